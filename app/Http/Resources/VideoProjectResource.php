@@ -23,6 +23,7 @@ public function toArray(Request $request): array
             'caption_style' => $this->caption_style,
             'caption_settings' => $this->caption_settings,
             'transcription' => $this->transcription,
+            'transcription_progress' => $this->transcription_progress,
             'video_metadata' => $this->video_metadata,
             'is_processing' => $this->isProcessing(),
             'can_edit' => $this->canEdit(),
@@ -22,6 +22,9 @@ class TranscribeVideoJob implements ShouldQueue
     public int $tries = 2;
     public int $backoff = 30;
 
+    /** Seconds between saves of the partial transcription while segments stream in. */
+    protected const PARTIAL_SAVE_INTERVAL = 5;
+
     public function __construct(protected VideoProject $project) {}
 
     protected function taskType(): string { return 'video_transcription'; }
@@ -49,15 +52,27 @@ public function handle(TranscriberService $transcriber, VideoEditorService $edit
                 'video_metadata' => $metadata,
             ]);
 
-            // Transcribe
+            // Transcribe, saving the segments decoded so far as they stream in
+            // (kept apart from `transcription`, which is only written once complete)
+            $lastSavedAt = microtime(true);
             $result = $transcriber->transcribe(
                 $this->project->video_path,
                 $this->project->language,
+                function (array $segment, ?float $progress, array $segments) use (&$lastSavedAt) {
+                    if (microtime(true) - $lastSavedAt < self::PARTIAL_SAVE_INTERVAL) {
+                        return;
+                    }
+                    $lastSavedAt = microtime(true);
+                    $this->project->update([
+                        'transcription_progress' => ['segments' => $segments, 'progress' => $progress],
+                    ]);
+                },
             );
 
             // Save transcription
             $this->project->update([
                 'transcription' => $result,
+                'transcription_progress' => null,
                 'language' => $result['language'] ?? $this->project->language,
                 'language_probability' => $result['language_probability'] ?? null,
                 'duration' => $result['duration'] ?? $this->project->duration,
@@ -72,6 +87,7 @@ public function handle(TranscriberService $transcriber, VideoEditorService $edit
 
             $this->broadcastTaskCompleted(true, null, ['project_id' => $this->project->public_id]);
         } catch (\Throwable $e) {
+            $this->project->transcription_progress = null;
             $this->project->markAsFailed($e->getMessage());
             $this->broadcastTaskCompleted(false, $e->getMessage());
 
@@ -91,6 +107,7 @@ public function failed(\Throwable $exception): void
             'error' => $exception->getMessage(),
         ]);
 
+        $this->project->transcription_progress = null;
         $this->project->markAsFailed($exception->getMessage());
     }
 }
@@ -30,6 +30,7 @@ class VideoProject extends Model
         'caption_style',
         'caption_settings',
         'transcription',
+        'transcription_progress',
         'video_metadata',
         'composition',
         'is_template',
@@ -43,6 +44,7 @@ class VideoProject extends Model
         'status' => VideoProjectStatus::class,
         'caption_settings' => 'array',
         'transcription' => 'array',
+        'transcription_progress' => 'array',
         'video_metadata' => 'array',
         'composition' => 'array',
         'template_defaults' => 'array',
@@ -6,12 +6,16 @@
 use Illuminate\Support\Facades\Http;
 use Illuminate\Support\Facades\Log;
 use Illuminate\Support\Facades\Storage;
+use Psr\Http\Message\StreamInterface;
 
 class TranscriberService
 {
     protected string $baseUrl;
     protected int $timeout;
 
+    /** Bytes read from a streamed transcription per read. */
+    protected int $streamReadSize = 8192;
+
     public function __construct()
     {
         $this->baseUrl = config('services.transcriber.url', 'http://transcriber:3340');
@@ -21,11 +25,17 @@ public function __construct()
     /**
      * Transcribe a video/audio file and return word-level timestamps.
      *
+     * With $onSegment the transcriber streams its segments (NDJSON) and the
+     * callback receives each one as soon as it is decoded, together with the
+     * progress (segment end / duration, 0-1), so callers can persist partial
+     * transcriptions. The returned result is the same in both modes.
+     *
      * @param string $filePath Path in storage
      * @param string|null $language Source language (null for auto-detect)
+     * @param callable|null $onSegment fn(array $segment, ?float $progress, array $segments): void
      * @return array Transcription result with segments and language info
      */
-    public function transcribe(string $filePath, ?string $language = null): array
+    public function transcribe(string $filePath, ?string $language = null, ?callable $onSegment = null): array
     {
         $fullPath = Storage::path($filePath);
 
@@ -37,15 +47,23 @@ public function transcribe(string $filePath, ?string $language = null): array
         if ($language) {
             $params['language'] = $language;
         }
+        if ($onSegment) {
+            $params['stream'] = 'ndjson';
+        }
 
         Log::info('[TranscriberService] Starting transcription', [
             'file' => $filePath,
             'language' => $language,
+            'stream' => (bool) $onSegment,
         ]);
 
-        $response = Http::timeout($this->timeout)
-            ->attach('file', fopen($fullPath, 'r'), basename($filePath))
-            ->post("{$this->baseUrl}/transcribe?" . http_build_query($params));
+        $request = Http::timeout($this->timeout)
+            ->attach('file', fopen($fullPath, 'r'), basename($filePath));
+        if ($onSegment) {
+            $request = $request->withOptions(['stream' => true]);
+        }
+
+        $response = $request->post("{$this->baseUrl}/transcribe?" . http_build_query($params));
 
         if ($response->failed()) {
             $error = $response->json('error') ?? $response->body();
@@ -53,7 +71,9 @@ public function transcribe(string $filePath, ?string $language = null): array
             throw new Exception("Transcription failed: {$error}");
         }
 
-        $result = $response->json();
+        $result = $onSegment
+            ? $this->readStream($response->toPsrResponse()->getBody(), $onSegment)
+            : $response->json();
 
         Log::info('[TranscriberService] Transcription completed', [
             'language' => $result['language'] ?? 'unknown',
@@ -64,6 +84,52 @@ public function transcribe(string $filePath, ?string $language = null): array
         return $result;
     }
 
+    /**
+     * Collect a streamed transcription (info, segment..., done) into a result.
+     */
+    protected function readStream(StreamInterface $body, callable $onSegment): array
+    {
+        $result = ['segments' => []];
+        $done = false;
+        $buffer = '';
+
+        while (!$body->eof() || $buffer !== '') {
+            $buffer .= $body->eof() ? "\n" : $body->read($this->streamReadSize);
+
+            while (($newline = strpos($buffer, "\n")) !== false) {
+                $line = trim(substr($buffer, 0, $newline));
+                $buffer = substr($buffer, $newline + 1);
+                if ($line === '') {
+                    continue;
+                }
+
+                $record = json_decode($line, true);
+                $type = $record['type'] ?? null;
+                unset($record['type']);
+
+                if ($type === 'info') {
+                    $result = array_merge($record, $result);
+                } elseif ($type === 'segment') {
+                    $progress = $record['progress'] ?? null;
+                    unset($record['progress']);
+                    $result['segments'][] = $record;
+                    $onSegment($record, $progress, $result['segments']);
+                } elseif ($type === 'done') {
+                    $done = true;
+                } elseif ($type === 'error') {
+                    Log::error('[TranscriberService] Transcription failed', ['error' => $record['error'] ?? null]);
+                    throw new Exception("Transcription failed: " . ($record['error'] ?? 'unknown error'));
+                }
+            }
+        }
+
+        if (!$done) {
+            throw new Exception('Transcription failed: stream ended before completion');
+        }
+
+        return $result;
+    }
+
     /**
      * Detect the language of an audio/video file.
      */
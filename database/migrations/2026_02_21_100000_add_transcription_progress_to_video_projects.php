@@ -0,0 +1,22 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    public function up(): void
+    {
+        Schema::table('video_projects', function (Blueprint $table) {
+            $table->json('transcription_progress')->nullable()->after('transcription');
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('video_projects', function (Blueprint $table) {
+            $table->dropColumn('transcription_progress');
+        });
+    }
+};
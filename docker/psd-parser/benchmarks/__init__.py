@@ -0,0 +1 @@
+# psd-parser benchmarks
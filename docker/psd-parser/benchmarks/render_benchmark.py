@@ -0,0 +1,264 @@
+"""
+Golden-image benchmark of the psd-parser renderers.
+
+For every PSD of a corpus, three renders are timed and compared against the
+merged image stored in the file (what Photoshop composited when saving):
+
+    render-psd     POST /render-psd?source=composite&scale=1 (psd-tools composite)
+    parse+render   POST /parse, then POST /render with its JSON
+    substitution   POST /render-with-substitution with empty tags and data
+
+Requests go through the Flask test client of this process, so every render
+reports its per-stage runtime and peak RSS (the request memory profiles),
+next to PSNR and SSIM against the merged image. Files saved without a merged
+image ("Maximize Compatibility" off) are timed but not scored.
+
+Usage (from docker/psd-parser):
+    python -m benchmarks.render_benchmark <psd files or directories>
+        [--repeat N] [--json results.json] [--baseline previous.json] [--save-dir renders/]
+
+With --baseline, renders that are less accurate than in the baseline run
+(PSNR or SSIM dropped beyond the tolerances) make the run exit with status 1,
+so an optimization has to show it is faster without losing fidelity.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+# Renders must be computed, not served from the on-disk cache; keep a profile of every request
+os.environ.setdefault("RENDER_CACHE_MAX_MB", "0")
+os.environ.setdefault("MEMORY_LOG_THRESHOLD_MB", "0")
+os.environ.setdefault("MEMORY_PROFILE_HISTORY", "16")
+
+import numpy as np
+from PIL import Image
+from psd_tools import PSDImage
+from skimage.metrics import peak_signal_noise_ratio, structural_similarity
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import server  # Warm-up logs are not part of the report
+from utils.channel_decoder import iter_psd_files
+
+
+RENDERERS = ("render-psd", "parse+render", "substitution")
+
+# Accuracy regressions against a baseline run that fail the benchmark
+PSNR_TOLERANCE_DB = 0.1
+SSIM_TOLERANCE = 0.001
+
+
+def _flatten(image: Image.Image) -> np.ndarray:
+    """RGB pixels of an image composited over white (how the merged image is stored)."""
+    image = image.convert("RGBA")
+    background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+    return np.asarray(Image.alpha_composite(background, image).convert("RGB"))
+
+
+def compare_images(reference: Image.Image, image: Image.Image) -> dict:
+    """
+    PSNR and SSIM of a render against the reference image.
+
+    Args:
+        reference: Merged image stored in the PSD
+        image: Render to score (resized to the reference size if needed)
+
+    Returns:
+        dict with psnr (dB, None for identical images) and ssim
+    """
+    if image.size != reference.size:
+        image = image.resize(reference.size, Image.Resampling.LANCZOS)
+    expected, actual = _flatten(reference), _flatten(image)
+
+    if np.array_equal(expected, actual):
+        return {"psnr": None, "ssim": 1.0}
+    return {
+        "psnr": round(float(peak_signal_noise_ratio(expected, actual, data_range=255)), 2),
+        "ssim": round(float(structural_similarity(expected, actual, channel_axis=2, data_range=255)), 4),
+    }
+
+
+class _Client:
+    """Test client that collects the memory profile of every request."""
+
+    def __init__(self):
+        self.client = server.app.test_client()
+
+    def post(self, *args, **kwargs) -> tuple:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            response = self.client.post(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            profile = self.client.get("/debug/memory", query_string={"id": response.headers.get("X-Memory-Profile")})
+        if response.status_code != 200:
+            raise RuntimeError(f"{args[0]} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response, seconds, profile.get_json() if profile.status_code == 200 else None
+
+
+def _upload(psd_bytes: bytes, name: str) -> dict:
+    return {"file": (io.BytesIO(psd_bytes), name)}
+
+
+def _run_renderer(client: _Client, renderer: str, psd_bytes: bytes, name: str) -> tuple:
+    """Render once; returns (PIL image, seconds, [memory profiles])."""
+    if renderer == "render-psd":
+        response, seconds, profile = client.post(
+            # Full size: the endpoint defaults to scale=0.5, which would score resampling, not compositing
+            "/render-psd", query_string={"source": "composite", "scale": 1}, data=_upload(psd_bytes, name)
+        )
+        return Image.open(io.BytesIO(response.data)), seconds, [profile]
+
+    if renderer == "parse+render":
+        parsed, parse_seconds, parse_profile = client.post("/parse", data=_upload(psd_bytes, name))
+        response, render_seconds, render_profile = client.post("/render", json=parsed.get_json())
+        return Image.open(io.BytesIO(response.data)), parse_seconds + render_seconds, [parse_profile, render_profile]
+
+    response, seconds, profile = client.post(
+        "/render-with-substitution", data={**_upload(psd_bytes, name), "tags": "{}", "data": "{}"}
+    )
+    return Image.open(io.BytesIO(response.data)), seconds, [profile]
+
+
+def _merge_profiles(profiles: list) -> dict:
+    """Peak RSS and stage timings of the requests of one render."""
+    stages = {}
+    peak = 0.0
+    for profile in filter(None, profiles):
+        peak = max(peak, profile["peak_rss_mb"])
+        for name, stage in profile["stages"].items():
+            stages[name] = round(stages.get(name, 0.0) + stage["seconds"], 3)
+    return {"peak_rss_mb": peak, "stages": stages}
+
+
+def benchmark_file(client: _Client, path: str, repeat: int = 1, save_dir: str | None = None) -> dict:
+    """
+    Benchmark all renderers on one PSD.
+
+    Returns:
+        dict with the document size, whether a merged image was found and
+        per renderer: seconds (first run), warm_seconds (median of the
+        repeats, None for a single run), peak_rss_mb, stages, psnr, ssim
+        (or error)
+    """
+    with open(path, "rb") as f:
+        psd_bytes = f.read()
+    name = os.path.basename(path)
+
+    psd = PSDImage.open(io.BytesIO(psd_bytes))
+    reference = psd.topil() if psd.has_preview() else None
+    result = {"file": path, "width": psd.width, "height": psd.height, "has_merged_image": reference is not None}
+
+    for renderer in RENDERERS:
+        try:
+            image, seconds, profiles = _run_renderer(client, renderer, psd_bytes, name)
+            warm = [_run_renderer(client, renderer, psd_bytes, name)[1] for _ in range(repeat - 1)]
+        except Exception as e:
+            result[renderer] = {"error": str(e)}
+            continue
+
+        entry = {
+            "seconds": round(seconds, 3),
+            "warm_seconds": round(statistics.median(warm), 3) if warm else None,
+            **_merge_profiles(profiles),
+        }
+        entry.update(compare_images(reference, image) if reference is not None else {"psnr": None, "ssim": None})
+        result[renderer] = entry
+
+        if save_dir:
+            stem = os.path.splitext(name)[0]
+            image.save(os.path.join(save_dir, f"{stem}.{renderer.replace('+', '_')}.png"))
+
+    return result
+
+
+def _format_metric(value, digits: int) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_report(results: list):
+    print(f"{'file':<32} {'renderer':<13} {'time s':>8} {'warm s':>8} {'peak MB':>8} {'PSNR':>7} {'SSIM':>7}  stages")
+    for result in results:
+        name = os.path.basename(result["file"])[:32]
+        for renderer in RENDERERS:
+            entry = result[renderer]
+            if "error" in entry:
+                print(f"{name:<32} {renderer:<13} ERROR {entry['error']}")
+                continue
+            psnr = "inf" if entry["ssim"] == 1.0 and entry["psnr"] is None else _format_metric(entry["psnr"], 2)
+            stages = ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in entry["stages"].items())
+            print(f"{name:<32} {renderer:<13} {entry['seconds']:>8.3f} {_format_metric(entry['warm_seconds'], 3):>8} "
+                  f"{entry['peak_rss_mb']:>8.1f} {psnr:>7} {_format_metric(entry['ssim'], 4):>7}  {stages}")
+
+
+def compare_with_baseline(results: list, baseline: list) -> bool:
+    """
+    Print time and accuracy changes against a previous run.
+
+    Returns:
+        False if any render lost accuracy beyond the tolerances
+    """
+    previous = {result["file"]: result for result in baseline}
+    ok = True
+    print("\nAgainst baseline:")
+    for result in results:
+        before = previous.get(result["file"])
+        if before is None:
+            continue
+        for renderer in RENDERERS:
+            new, old = result.get(renderer, {}), before.get(renderer, {})
+            if "seconds" not in new or "seconds" not in old:
+                continue
+
+            speedup = old["seconds"] / new["seconds"] if new["seconds"] else float("inf")
+            regressions = []
+            if new["ssim"] is not None and old["ssim"] is not None and new["ssim"] < old["ssim"] - SSIM_TOLERANCE:
+                regressions.append(f"SSIM {old['ssim']:.4f} -> {new['ssim']:.4f}")
+            # psnr None with ssim 1.0 means identical to the reference (infinite PSNR)
+            old_psnr = float("inf") if old["psnr"] is None and old["ssim"] == 1.0 else old["psnr"]
+            new_psnr = float("inf") if new["psnr"] is None and new["ssim"] == 1.0 else new["psnr"]
+            if new_psnr is not None and old_psnr is not None and new_psnr < old_psnr - PSNR_TOLERANCE_DB:
+                regressions.append(f"PSNR {old_psnr:.2f} -> {new_psnr:.2f} dB")
+
+            ok = ok and not regressions
+            status = "LESS ACCURATE: " + ", ".join(regressions) if regressions else "ok"
+            print(f"  {os.path.basename(result['file'])} {renderer}: {speedup:.2f}x speed - {status}")
+    return ok
+
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(description="Time psd-parser renderers and score them against the merged image.")
+    parser.add_argument("paths", nargs="+", help="PSD/PSB files or directories")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per renderer (warm time = median of runs 2..N)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results of a previous run (--json) to compare against")
+    parser.add_argument("--save-dir", help="Save every render as PNG into this directory")
+    args = parser.parse_args(argv)
+
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+
+    client = _Client()
+    results = []
+    for path in iter_psd_files(args.paths):
+        results.append(benchmark_file(client, path, max(1, args.repeat), args.save_dir))
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare_with_baseline(results, baseline):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -5,35 +5,181 @@ Parses PSD files and returns structured JSON data
 suitable for importing into a canvas-based graphics editor.
 """
 
+import base64
 import os
 import io
+import json
+import re
 import tempfile
-from flask import Flask, request, jsonify, send_file
+import time
+import uuid
+from collections import deque
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
-from psd_tools import PSDImage
+from werkzeug.http import quote_header_value
+from PIL import Image
 from psd_tools.api.layers import Group, PixelLayer, ShapeLayer, SmartObjectLayer
 
-from utils.layer_mapper import map_layer, collect_fonts
-from utils.image_extractor import rgba_to_hex, extract_smart_object_source
+from utils.layer_mapper import map_layer, collect_fonts, build_sibling_index
+from utils.clipping_compositor import composite_clipping_group
+from utils.image_extractor import (
+    rgba_to_hex,
+    extract_smart_object_source,
+    extract_document_preview,
+    sample_merged_pixel,
+    downscale_image,
+    encode_image_asset,
+    encode_png_asset,
+)
+from utils.asset_pyramid import asset_pyramid, parse_mipmap_spec
+from utils.texture_atlas import texture_atlas
+from utils.json_response import dumps, json_response
+from utils.output_encoder import encode_image, output_cache_key, output_mimetype, parse_output_options
+from utils.preview_renderer import render_parsed_document, resolve_preview_scale
+from utils.substitution_renderer import (
+    collect_render_layers,
+    build_render_plan,
+    render_plan,
+    plan_cache_key,
+    RenderPlanCache,
+)
+from utils.render_cache import RenderCache, make_cache_key
+from utils.render_bundle import BundleStore, BUNDLE_VERSION, collect_layer_metadata, write_bundle, read_bundle_index
+from utils.psd_input import open_psd_path, spool_upload
+from utils.psd_scanner import scan_psd_structure
+from utils.memory_stats import MemoryProfile, memory_stage
+from utils.channel_decoder import install_channel_decoder
+from utils.warmup import start_warm_up, warm_up_status
 from psd_tools.api.layers import SmartObjectLayer
 
 app = Flask(__name__)
 CORS(app)
 
+# numpy channel decoding for psd-tools (FAST_CHANNEL_DECODER=0 keeps psd-tools' own)
+install_channel_decoder()
+
 # Configuration
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
-MAX_DIMENSIONS = 4096
+# Large documents are composited in tiles (see utils/tiled_compositor.py), so the
+# limit only guards against absurd inputs; 30000px is the PSD format maximum
+MAX_DIMENSIONS = int(os.environ.get("MAX_DIMENSIONS", 30000))
+PSD_EXTENSIONS = (".psd", ".psb")
 MAX_LAYERS = 500
+MAX_BATCH_ITEMS = 500
+# Batch item ids become zip member names and multipart filenames
+BATCH_ITEM_ID_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,128}")
+GALLERY_DEFAULT_SIZE = 256
+GALLERY_MAX_SIZE = 2048
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 2))
+PLATE_CACHE_MAX_BYTES = int(os.environ.get("PLATE_CACHE_MAX_MB", 256)) * 1024 * 1024
+
+RENDER_CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "psd-render-cache"))
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_MB", 1024)) * 1024 * 1024
+# Bump when rendering output changes so cached renders and client ETags are invalidated
+RENDER_CACHE_VERSION = 1
+
+BUNDLE_DIR = os.environ.get("BUNDLE_DIR", os.path.join(tempfile.gettempdir(), "psd-bundles"))
+BUNDLE_MAX_LOADED = int(os.environ.get("BUNDLE_MAX_LOADED", 32))
+
+# Static background plates of substitution renders, shared across requests
+render_plan_cache = RenderPlanCache(PLATE_CACHE_MAX_BYTES)
+# Encoded render outputs on disk, shared across workers (RENDER_CACHE_MAX_MB=0 disables)
+render_cache = RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES)
+# Compiled templates (see /compile), memory-mapped on first use
+bundle_store = BundleStore(BUNDLE_DIR, BUNDLE_MAX_LOADED)
+
+# Per-request memory profiles: RSS per stage always, tracemalloc on demand
+# (?profile_memory=1, or MEMORY_PROFILE=always for every request)
+MEMORY_PROFILE_MODE = os.environ.get("MEMORY_PROFILE", "on-demand")
+MEMORY_LOG_THRESHOLD_MB = int(os.environ.get("MEMORY_LOG_THRESHOLD_MB", 1024))
+# Recent profiles kept per worker for /debug/memory (slow or large requests only)
+memory_profiles = deque(maxlen=int(os.environ.get("MEMORY_PROFILE_HISTORY", 50)))
+
+
+@app.before_request
+def start_request_memory_profile():
+    trace = MEMORY_PROFILE_MODE == "always" or request.args.get("profile_memory") == "1"
+    g.memory_profile = MemoryProfile(f"{request.method} {request.path}", trace_allocations=trace).start()
+    g.psd_inputs = []
+
+
+@app.after_request
+def report_request_memory(response):
+    """Report the peak RSS of the request (X-Peak-RSS-MB header, log and /debug/memory)."""
+    profile = g.pop("memory_profile", None)
+    if profile is None:
+        return response
+
+    profile.stop()
+    response.headers["X-Peak-RSS-MB"] = f"{profile.peak_rss / (1024 * 1024):.1f}"
+    if request.method != "POST":
+        return response
+
+    print(f"[MEMORY] {profile.summary()}")
+    if profile.trace_allocations or profile.peak_rss >= MEMORY_LOG_THRESHOLD_MB * 1024 * 1024:
+        profile_id = uuid.uuid4().hex[:12]
+        memory_profiles.append({"id": profile_id, "timestamp": time.time(), **profile.to_dict()})
+        response.headers["X-Memory-Profile"] = profile_id
+        if profile.peak_rss >= MEMORY_LOG_THRESHOLD_MB * 1024 * 1024:
+            print(f"[MEMORY] Request above {MEMORY_LOG_THRESHOLD_MB} MB: {json.dumps(profile.to_dict())}")
+    return response
+
+
+@app.teardown_request
+def close_psd_inputs(error=None):
+    for psd_input in g.pop("psd_inputs", []):
+        psd_input.close()
+
+
+def _open_upload(file):
+    """Map an uploaded PSD (spooled to disk, never read into memory); closed after the request."""
+    psd_input = spool_upload(file)
+    g.psd_inputs.append(psd_input)
+    return psd_input
+
+
+def _open_path(path: str):
+    """Map a PSD on disk without reading it; closed after the request."""
+    psd_input = open_psd_path(path)
+    g.psd_inputs.append(psd_input)
+    return psd_input
 
 
 @app.route("/health", methods=["GET"])
 def health():
-    """Health check endpoint."""
+    """Health check endpoint (503 until the worker has warmed up)."""
+    warmup = warm_up_status()
     return jsonify({
-        "status": "ok",
+        "status": "ok" if warmup["ready"] else "warming",
         "service": "psd-parser",
         "version": "1.0.0",
+        "warmup": warmup,
+    }), 200 if warmup["ready"] else 503
+
+
+@app.route("/debug/memory", methods=["GET"])
+def debug_memory():
+    """
+    Recent memory profiles of this worker.
+
+    Profiles are kept for requests with ?profile_memory=1 and for requests
+    whose peak RSS exceeded MEMORY_LOG_THRESHOLD_MB.
+
+    Optional query params:
+        - id: return a single profile (id from the X-Memory-Profile header)
+    """
+    profile_id = request.args.get("id")
+    if profile_id:
+        for profile in memory_profiles:
+            if profile["id"] == profile_id:
+                return jsonify(profile)
+        return jsonify({"error": "Profile not found (it may belong to another worker)"}), 404
+
+    return jsonify({
+        "pid": os.getpid(),
+        "threshold_mb": MEMORY_LOG_THRESHOLD_MB,
+        "profiles": list(memory_profiles),
     })
 
 
@@ -45,6 +191,11 @@ def parse_psd():
     Expects:
         - multipart/form-data with 'file' field containing the PSD
 
+    Query params:
+        - mipmaps: "1" to add 1/2, 1/4 and 1/8 levels to every image, or divisors ("2,4,8")
+        - mipmap_widths: target level widths instead of divisors ("256,1024")
+        - atlas: "1" to pack small images and masks into atlas sheets ("atlases")
+
     Returns:
         JSON with:
             - width: canvas width
@@ -64,20 +215,30 @@ def parse_psd():
     if not file.filename:
         return jsonify({"error": "No filename"}), 400
 
-    if not file.filename.lower().endswith(".psd"):
-        return jsonify({"error": "File must be a PSD file"}), 400
+    if not file.filename.lower().endswith(PSD_EXTENSIONS):
+        return jsonify({"error": "File must be a PSD or PSB file"}), 400
 
-    # Read file into memory
-    file_data = file.read()
+    try:
+        mipmap_spec = parse_mipmap_spec(request.args.get("mipmaps"), request.args.get("mipmap_widths"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    use_atlas = request.args.get("atlas", "0").lower() in ("1", "true", "yes")
 
-    if len(file_data) > MAX_FILE_SIZE:
+    # Map the spooled upload instead of reading it into memory
+    try:
+        psd_input = _open_upload(file)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if len(psd_input) > MAX_FILE_SIZE:
         return jsonify({"error": f"File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB"}), 400
 
     warnings = []
 
     try:
-        # Parse PSD from memory
-        psd = PSDImage.open(io.BytesIO(file_data))
+        # Parse PSD from the mapping
+        with memory_stage("open"):
+            psd = psd_input.open_psd()
 
         # Validate dimensions
         if psd.width > MAX_DIMENSIONS or psd.height > MAX_DIMENSIONS:
@@ -110,16 +271,13 @@ def parse_psd():
         # Try to get background color
         background_color = "#FFFFFF"
         try:
-            # Check if there's a background layer or get from composite
-            if psd.has_preview():
-                composite = psd.composite()
-                if composite:
-                    # Sample corner pixel for background estimation
-                    rgba = composite.convert("RGBA")
-                    corner_pixel = rgba.getpixel((0, 0))
-                    # Only use if not transparent
-                    if corner_pixel[3] > 200:
-                        background_color = rgba_to_hex(corner_pixel)
+            # Sample corner pixel of the merged image for background estimation
+            # (decodes a single scanline instead of the whole composite)
+            with memory_stage("background"):
+                corner_pixel = sample_merged_pixel(psd, 0, 0)
+            # Only use if not transparent
+            if corner_pixel and corner_pixel[3] > 200:
+                background_color = rgba_to_hex(corner_pixel)
         except Exception as e:
             warnings.append(f"Could not determine background color: {str(e)}")
 
@@ -209,13 +367,13 @@ def parse_psd():
                 if bg_groups:
                     print(f"[Z-ORDER] Reordered groups: backgrounds={[l.name for l in bg_groups]}, foregrounds={[l.name for l in fg_groups]}")
 
-            # Build a set of layers that are clipped to other layers (should be skipped)
-            # These are handled via their clipping base's composite
-            clipped_layers = set()
+            # Clipping lookups for this group, including the layers that are clipped to
+            # other layers (should be skipped - handled via their clipping base's composite)
+            sibling_index = build_sibling_index(sibling_layers)
+            clipped_layers = sibling_index["clipped_ids"]
             for layer in sibling_layers:
                 if hasattr(layer, 'clip_layers') and layer.clip_layers:
                     for clipped in layer.clip_layers:
-                        clipped_layers.add(id(clipped))
                         print(f"[CLIP] Layer '{clipped.name}' is clipped to '{layer.name}' - will be skipped")
 
             for layer in sibling_layers:
@@ -248,71 +406,19 @@ def parse_psd():
                             print(f"  [CLIP] Clipped layer: '{clip_layer.name}'")
 
                         try:
-                            from utils.image_extractor import extract_layer_image
-                            import base64
-                            from io import BytesIO
-                            from PIL import Image
-
-                            # Get base layer composite
-                            base_comp = layer.composite()
-                            if not base_comp:
+                            # Base composite with the clipped layers blended inside its alpha.
+                            # Clipped layers are cropped TO the base, not expanded beyond it
+                            comp = composite_clipping_group(layer)
+                            if not comp:
                                 print(f"[CLIP BASE] No composite for '{layer.name}', skipping")
                                 continue
 
-                            base_comp = base_comp.convert("RGBA")
-
-                            # Use ONLY base layer bounds - this is the clipping mask!
-                            # Clipped layers are cropped TO the base, not expanded beyond it
                             min_x = layer.left
                             min_y = layer.top
-                            result_width = base_comp.width
-                            result_height = base_comp.height
-                            result_img = Image.new("RGBA", (result_width, result_height), (0, 0, 0, 0))
-
-                            # Paste base layer
-                            base_x = int(layer.left - min_x)
-                            base_y = int(layer.top - min_y)
-                            result_img.paste(base_comp, (base_x, base_y), base_comp)
-
-                            # Process clipped layers - they are clipped TO the base's alpha
-                            for clip_layer in layer.clip_layers:
-                                clip_comp = clip_layer.composite()
-                                if not clip_comp:
-                                    continue
-                                clip_comp = clip_comp.convert("RGBA")
-
-                                # Position on result canvas
-                                clip_x = int(clip_layer.left - min_x)
-                                clip_y = int(clip_layer.top - min_y)
-
-                                # Create a temporary image for this clipped layer
-                                temp = Image.new("RGBA", (result_width, result_height), (0, 0, 0, 0))
-                                temp.paste(clip_comp, (clip_x, clip_y), clip_comp)
-
-                                # Clip to base layer's alpha (use base alpha as mask)
-                                # Create mask from base layer alpha channel
-                                base_alpha = Image.new("L", (result_width, result_height), 0)
-                                base_with_alpha = Image.new("RGBA", (result_width, result_height), (0, 0, 0, 0))
-                                base_with_alpha.paste(base_comp, (base_x, base_y), base_comp)
-                                base_alpha = base_with_alpha.split()[3]
-
-                                # Apply clip mask - only show clipped layer where base has alpha
-                                temp_r, temp_g, temp_b, temp_a = temp.split()
-                                # Multiply clipped layer alpha with base alpha
-                                clipped_alpha = Image.composite(temp_a, Image.new("L", temp_a.size, 0), base_alpha)
-                                temp = Image.merge("RGBA", (temp_r, temp_g, temp_b, clipped_alpha))
-
-                                # Composite onto result
-                                result_img = Image.alpha_composite(result_img, temp)
-
-                            comp = result_img
-                            print(f"[CLIP BASE] Composited '{layer.name}' with clipped layers: {result_width}x{result_height}")
+                            print(f"[CLIP BASE] Composited '{layer.name}' with clipped layers: {comp.width}x{comp.height}")
 
                             # Convert composite to base64
-                            comp_rgba = comp.convert("RGBA")
-                            buffer = BytesIO()
-                            comp_rgba.save(buffer, format="PNG")
-                            img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+                            asset = encode_image_asset(comp.convert("RGBA"), optimize=False)
 
                             # Create image layer data
                             position = layer_counter["index"]
@@ -345,10 +451,7 @@ def parse_psd():
                             images.append({
                                 "id": image_id,
                                 "layer_index": position,
-                                "data": f"data:image/png;base64,{img_base64}",
-                                "mime_type": "image/png",
-                                "width": comp.width,
-                                "height": comp.height,
+                                **asset,
                             })
                             mapped["image_id"] = image_id
 
@@ -359,14 +462,14 @@ def parse_psd():
                             print(f"[CLIP BASE] Error extracting composite for '{layer.name}': {e}")
                             # Fall through to normal processing
 
-                    # Regular layer - pass sibling_layers for clipping mask detection
+                    # Regular layer - pass the sibling index for clipping mask detection
                     mapped = map_layer(
                         layer,
                         layer_counter["index"],
                         width,
                         height,
                         is_root=is_root,
-                        sibling_layers=sibling_layers,
+                        sibling_index=sibling_index,
                         psd_dpi=psd_dpi
                     )
                     if mapped:
@@ -404,36 +507,39 @@ def parse_psd():
 
             return result
 
-        # First pass: collect all SmartObjectLayers
-        collect_smart_objects(psd)
-
-        # Extract source images for unique smart objects
-        for so_layer in smart_object_layers:
-            if hasattr(so_layer, "smart_object") and so_layer.smart_object:
-                so = so_layer.smart_object
-                uid = so.unique_id if hasattr(so, "unique_id") else None
-
-                if uid and uid not in smart_object_sources:
-                    print(f"[SMART_OBJECT_SOURCE] Extracting source for unique_id: {uid} (layer: {so_layer.name})")
-                    source_data = extract_smart_object_source(so_layer)
-
-                    if source_data:
-                        smart_object_sources[uid] = {
-                            "id": f"so_{uid}",
-                            "unique_id": uid,
-                            "data": source_data["data"],
-                            "mime_type": source_data["mime_type"],
-                            "width": source_data["width"],
-                            "height": source_data["height"],
-                        }
-                        print(f"[SMART_OBJECT_SOURCE] Successfully extracted source: {source_data['width']}x{source_data['height']}")
-                    else:
-                        print(f"[SMART_OBJECT_SOURCE] Failed to extract source for unique_id: {uid}")
-
-        print(f"[SMART_OBJECT_SOURCE] Total unique sources extracted: {len(smart_object_sources)}")
-
-        # Process all layers starting from PSD root
-        mapped_layers = process_layers(psd)
+        # Assets encoded while mapping get mipmap levels / atlas slots when requested
+        with memory_stage("mapping"), asset_pyramid(mipmap_spec), texture_atlas(use_atlas) as atlas:
+            # First pass: collect all SmartObjectLayers
+            collect_smart_objects(psd)
+
+            # Extract source images for unique smart objects
+            for so_layer in smart_object_layers:
+                if hasattr(so_layer, "smart_object") and so_layer.smart_object:
+                    so = so_layer.smart_object
+                    uid = so.unique_id if hasattr(so, "unique_id") else None
+
+                    if uid and uid not in smart_object_sources:
+                        print(f"[SMART_OBJECT_SOURCE] Extracting source for unique_id: {uid} (layer: {so_layer.name})")
+                        source_data = extract_smart_object_source(so_layer)
+
+                        if source_data:
+                            # Asset keys: data (or atlas), mime_type, width, height, mipmaps
+                            source_data.pop("unique_id", None)
+                            smart_object_sources[uid] = {
+                                "id": f"so_{uid}",
+                                "unique_id": uid,
+                                **source_data,
+                            }
+                            print(f"[SMART_OBJECT_SOURCE] Successfully extracted source: {source_data['width']}x{source_data['height']}")
+                        else:
+                            print(f"[SMART_OBJECT_SOURCE] Failed to extract source for unique_id: {uid}")
+
+            print(f"[SMART_OBJECT_SOURCE] Total unique sources extracted: {len(smart_object_sources)}")
+
+            # Process all layers starting from PSD root
+            mapped_layers = process_layers(psd)
+
+            atlases = atlas.finish(encode_png_asset) if atlas else None
 
         # Count total layers (including nested)
         def count_layers(layers):
@@ -453,7 +559,7 @@ def parse_psd():
         # Collect fonts used
         fonts = collect_fonts(mapped_layers)
 
-        return jsonify({
+        response_data = {
             "width": width,
             "height": height,
             "background_color": background_color,
@@ -463,7 +569,12 @@ def parse_psd():
             "masks": masks,  # Layer masks (raster masks)
             "smart_object_sources": list(smart_object_sources.values()),
             "warnings": warnings,
-        })
+        }
+        if atlases is not None:
+            response_data["atlases"] = atlases  # Sheets referenced by "atlas" entries
+
+        # orjson + negotiated compression (serialization / compression stages)
+        return json_response(response_data)
 
     except Exception as e:
         return jsonify({
@@ -477,6 +588,10 @@ def analyze_psd():
     Analyze PSD file structure without full parsing.
     Returns information about groups/folders and their visibility.
 
+    Only the layer records are read (pixel data is never decoded), so this
+    stays fast for very large files. Layers also report their pixel area
+    and an estimated decode cost.
+
     Useful for debugging and selecting which group to import.
     """
     if "file" not in request.files:
@@ -484,45 +599,28 @@ def analyze_psd():
 
     file = request.files["file"]
 
-    if not file.filename or not file.filename.lower().endswith(".psd"):
-        return jsonify({"error": "File must be a PSD file"}), 400
+    if not file.filename or not file.filename.lower().endswith(PSD_EXTENSIONS):
+        return jsonify({"error": "File must be a PSD or PSB file"}), 400
 
-    file_data = file.read()
+    try:
+        psd_input = _open_upload(file)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    if len(file_data) > MAX_FILE_SIZE:
+    if len(psd_input) > MAX_FILE_SIZE:
         return jsonify({"error": "File too large"}), 400
 
     try:
-        psd = PSDImage.open(io.BytesIO(file_data))
-
-        def analyze_structure(container, depth=0):
-            """Recursively analyze layer structure."""
-            result = []
-            for layer in container:
-                layer_info = {
-                    "name": layer.name,
-                    "visible": layer.visible,
-                    "type": type(layer).__name__,
-                    "depth": depth,
-                }
-
-                if isinstance(layer, Group):
-                    layer_info["is_group"] = True
-                    layer_info["children_count"] = len(list(layer))
-                    layer_info["children"] = analyze_structure(layer, depth + 1)
-                else:
-                    layer_info["is_group"] = False
-                    layer_info["bounds"] = {
-                        "left": layer.left,
-                        "top": layer.top,
-                        "width": layer.width,
-                        "height": layer.height,
-                    }
-
-                result.append(layer_info)
-            return result
-
-        structure = analyze_structure(psd)
+        try:
+            # Layer records only: channel image data is never read
+            scan = scan_psd_structure(psd_input.data)
+            width, height = scan["width"], scan["height"]
+            structure = _scanned_structure(scan["layers"])
+        except ValueError as e:
+            print(f"[ANALYZE] Header scan failed ({e}), falling back to psd-tools")
+            psd = psd_input.open_psd()
+            width, height = psd.width, psd.height
+            structure = _analyze_structure(psd)
 
         # Count visible vs total layers
         def count_layers(items, parent_visible=True):
@@ -541,9 +639,9 @@ def analyze_psd():
 
         total_layers, visible_layers = count_layers(structure)
 
-        return jsonify({
-            "width": psd.width,
-            "height": psd.height,
+        return json_response({
+            "width": width,
+            "height": height,
             "total_layers": total_layers,
             "visible_layers": visible_layers,
             "structure": structure,
@@ -553,6 +651,68 @@ def analyze_psd():
         return jsonify({"error": f"Failed to analyze PSD: {str(e)}"}), 500
 
 
+def _scanned_structure(nodes: list, depth: int = 0) -> list:
+    """Convert scan_psd_structure nodes to the /analyze structure (plus decode estimates)."""
+    result = []
+    for node in nodes:
+        layer_info = {
+            "name": node["name"],
+            "visible": node["visible"],
+            "type": node["type"],
+            "depth": depth,
+            "is_group": node["is_group"],
+        }
+
+        if node["is_group"]:
+            children = _scanned_structure(node["children"], depth + 1)
+            layer_info["children_count"] = len(children)
+            layer_info["children"] = children
+            layer_info["pixel_area"] = sum(child["pixel_area"] for child in children)
+            layer_info["estimated_decode_ms"] = round(sum(child["estimated_decode_ms"] for child in children), 2)
+        else:
+            left, top, right, bottom = node["bbox"]
+            layer_info["bounds"] = {
+                "left": left,
+                "top": top,
+                "width": max(0, right - left),
+                "height": max(0, bottom - top),
+            }
+            for key in ("pixel_area", "compressed_bytes", "decoded_bytes", "compression", "estimated_decode_ms"):
+                layer_info[key] = node[key]
+
+        result.append(layer_info)
+    return result
+
+
+def _analyze_structure(container, depth: int = 0) -> list:
+    """/analyze structure from an opened PSDImage (fallback when the header scan fails)."""
+    result = []
+    for layer in container:
+        layer_info = {
+            "name": layer.name,
+            "visible": layer.visible,
+            "type": type(layer).__name__,
+            "depth": depth,
+        }
+
+        if isinstance(layer, Group):
+            children = _analyze_structure(layer, depth + 1)
+            layer_info["is_group"] = True
+            layer_info["children_count"] = len(children)
+            layer_info["children"] = children
+        else:
+            layer_info["is_group"] = False
+            layer_info["bounds"] = {
+                "left": layer.left,
+                "top": layer.top,
+                "width": layer.width,
+                "height": layer.height,
+            }
+
+        result.append(layer_info)
+    return result
+
+
 @app.route("/render", methods=["POST"])
 def render_preview():
     """
@@ -564,11 +724,23 @@ def render_preview():
         - layers: array of layer objects (same format as /parse response)
         - images: array of image data (base64)
 
+    Optional query params:
+        - scale: output scale factor (default 1.0)
+        - max_size: limit for the longest output side in pixels (e.g. 512)
+        - format: png (default), jpeg, webp or avif
+        - quality: 1-100 for jpeg/webp/avif
+        - compress_level: 0-9 for png (default 6)
+
+    Layers are drawn natively at the target resolution, so small previews
+    cost roughly scale^2 of a full-size render.
+
     Returns:
-        PNG image
+        Image in the requested format (PNG by default)
     """
-    from PIL import Image, ImageDraw, ImageFont
-    import base64
+    try:
+        output = parse_output_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
         data = request.get_json()
@@ -576,176 +748,128 @@ def render_preview():
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
 
-        width = data.get("width", 1080)
-        height = data.get("height", 1080)
-        layers = data.get("layers", [])
-        images_data = {img["id"]: img for img in data.get("images", [])}
+        scale = resolve_preview_scale(
+            data.get("width", 1080),
+            data.get("height", 1080),
+            float(request.args.get("scale", 1.0)),
+            request.args.get("max_size", type=int),
+        )
 
-        # Create canvas
-        canvas = Image.new("RGBA", (width, height), (255, 255, 255, 255))
-        draw = ImageDraw.Draw(canvas)
+        with memory_stage("render"):
+            canvas = render_parsed_document(data, scale)
 
-        def render_layers(layer_list):
-            """Render layers recursively."""
-            for layer in layer_list:
-                if not layer.get("visible", True):
-                    continue
+        with memory_stage("encoding"):
+            img_bytes = io.BytesIO(encode_image(canvas, output))
 
-                layer_type = layer.get("type")
-                x = int(layer.get("x", 0))
-                y = int(layer.get("y", 0))
-                w = int(layer.get("width", 100))
-                h = int(layer.get("height", 100))
-                opacity = layer.get("opacity", 1.0)
-                props = layer.get("properties", {})
-
-                if layer_type == "group":
-                    render_layers(layer.get("children", []))
-
-                elif layer_type == "rectangle":
-                    fill = props.get("fill", "#CCCCCC")
-                    try:
-                        if fill.startswith("#"):
-                            r = int(fill[1:3], 16)
-                            g = int(fill[3:5], 16)
-                            b = int(fill[5:7], 16)
-                            if opacity < 1.0:
-                                # Create transparent layer and composite for proper alpha blending
-                                shape_layer = Image.new("RGBA", (w, h), (r, g, b, 255))
-                                # Apply opacity
-                                alpha = shape_layer.split()[3]
-                                alpha = alpha.point(lambda p: int(p * opacity))
-                                shape_layer.putalpha(alpha)
-                                canvas.paste(shape_layer, (x, y), shape_layer)
-                            else:
-                                draw.rectangle([x, y, x + w, y + h], fill=(r, g, b, 255))
-                    except Exception as e:
-                        print(f"Error drawing rectangle: {e}")
-
-                elif layer_type == "ellipse":
-                    fill = props.get("fill", "#CCCCCC")
-                    try:
-                        if fill.startswith("#"):
-                            r = int(fill[1:3], 16)
-                            g = int(fill[3:5], 16)
-                            b = int(fill[5:7], 16)
-                            if opacity < 1.0:
-                                # Create transparent layer and composite for proper alpha blending
-                                shape_layer = Image.new("RGBA", (w, h), (0, 0, 0, 0))
-                                shape_draw = ImageDraw.Draw(shape_layer)
-                                shape_draw.ellipse([0, 0, w, h], fill=(r, g, b, 255))
-                                # Apply opacity
-                                alpha = shape_layer.split()[3]
-                                alpha = alpha.point(lambda p: int(p * opacity))
-                                shape_layer.putalpha(alpha)
-                                canvas.paste(shape_layer, (x, y), shape_layer)
-                            else:
-                                draw.ellipse([x, y, x + w, y + h], fill=(r, g, b, 255))
-                    except Exception as e:
-                        print(f"Error drawing ellipse: {e}")
-
-                elif layer_type == "text":
-                    text = props.get("text", "")
-                    fill = props.get("fill", "#000000")
-                    font_size = int(props.get("fontSize", 24))
-
-                    try:
-                        # Try to load font, fallback to default with size
-                        try:
-                            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size)
-                        except Exception:
-                            # Use default font with explicit size (PIL 10+)
-                            font = ImageFont.load_default(size=font_size)
-
-                        if fill.startswith("#"):
-                            r = int(fill[1:3], 16)
-                            g = int(fill[3:5], 16)
-                            b = int(fill[5:7], 16)
-                            color = (r, g, b, int(255 * opacity))
-
-                        # Draw text with word wrap if fixedWidth
-                        if props.get("fixedWidth") and w > 0:
-                            # Simple word wrap
-                            words = text.split()
-                            lines = []
-                            current_line = ""
-                            for word in words:
-                                test_line = current_line + " " + word if current_line else word
-                                bbox = draw.textbbox((0, 0), test_line, font=font)
-                                if bbox[2] - bbox[0] <= w:
-                                    current_line = test_line
-                                else:
-                                    if current_line:
-                                        lines.append(current_line)
-                                    current_line = word
-                            if current_line:
-                                lines.append(current_line)
-
-                            line_height = font_size * 1.2
-                            for i, line in enumerate(lines):
-                                draw.text((x, y + i * line_height), line, fill=color, font=font)
-                        else:
-                            draw.text((x, y), text, fill=color, font=font)
+        return send_file(img_bytes, mimetype=output_mimetype(output))
 
-                    except Exception as e:
-                        print(f"Error drawing text '{text[:20]}...': {e}")
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Render failed: {str(e)}"}), 500
 
-                elif layer_type == "image":
-                    image_id = layer.get("image_id")
-                    if image_id and image_id in images_data:
-                        try:
-                            img_data = images_data[image_id]
-                            base64_data = img_data.get("data", "")
-                            if base64_data.startswith("data:"):
-                                base64_data = base64_data.split(",")[1]
-
-                            img_bytes = base64.b64decode(base64_data)
-                            img = Image.open(io.BytesIO(img_bytes)).convert("RGBA")
-
-                            # Resize to layer dimensions
-                            img = img.resize((w, h), Image.Resampling.LANCZOS)
-
-                            # Apply tint color if specified (for recoloring icon images)
-                            tint_color = props.get("tintColor")
-                            if tint_color and tint_color.startswith("#"):
-                                try:
-                                    tr = int(tint_color[1:3], 16)
-                                    tg = int(tint_color[3:5], 16)
-                                    tb = int(tint_color[5:7], 16)
-                                    # Create solid color image with same size
-                                    tint_layer = Image.new("RGBA", img.size, (tr, tg, tb, 255))
-                                    # Use original image's alpha as mask
-                                    # This replaces all non-transparent pixels with tint color
-                                    img = Image.composite(tint_layer, Image.new("RGBA", img.size, (0, 0, 0, 0)), img)
-                                except Exception as te:
-                                    print(f"Error applying tint: {te}")
-
-                            # Apply opacity
-                            if opacity < 1.0:
-                                alpha = img.split()[3]
-                                alpha = alpha.point(lambda p: int(p * opacity))
-                                img.putalpha(alpha)
-
-                            # Paste onto canvas
-                            canvas.paste(img, (x, y), img)
-                        except Exception as e:
-                            print(f"Error rendering image: {e}")
-                            # Draw placeholder
-                            draw.rectangle([x, y, x + w, y + h], fill=(200, 200, 200, 128), outline=(150, 150, 150))
 
-        render_layers(layers)
+def _read_substitution_request(extra_fields: tuple = ()):
+    """
+    Read the PSD bytes and substitution parameters of a render request.
 
-        # Save to bytes
-        img_bytes = io.BytesIO()
-        canvas.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
+    Accepts either a JSON body with 'psd_path' (or 'bundle_id' of a compiled
+    template) or multipart/form-data with a 'file' field; JSON-encoded form
+    fields ('tags', 'data' and ``extra_fields``) are decoded.
 
-        return send_file(img_bytes, mimetype="image/png")
+    Returns:
+        Tuple of (psd_input, psd_identity, req_data, error_response).
+        psd_input is the memory-mapped PSD (None for bundles). psd_identity
+        identifies the PSD content for caching (path + mtime for psd_path,
+        content hash for uploads, the bundle id for bundles). error_response
+        is None on success.
+    """
+    import json as json_module
+
+    if request.is_json:
+        req_data = request.get_json()
+        bundle_id = req_data.get('bundle_id')
+        if bundle_id:
+            # Map the bundle up front, so an unknown id is a 404 rather than a failed render
+            try:
+                bundle_store.get(bundle_id)
+            except ValueError:
+                return None, None, None, (jsonify({"error": "Unknown bundle_id"}), 404)
+            return None, f"bundle:{bundle_id}", req_data, None
+
+        psd_path = req_data.get('psd_path')
+        if not psd_path:
+            return None, None, None, (jsonify({"error": "No psd_path provided"}), 400)
+        psd_input = _open_path(psd_path)
+    elif "file" in request.files:
+        psd_input = _open_upload(request.files["file"])
+        req_data = {
+            'variant_path': request.form.get('variant_path'),
+            'tags': request.form.get('tags', '{}'),
+            'data': request.form.get('data', '{}'),
+        }
+        for field in extra_fields:
+            req_data[field] = request.form.get(field)
+        for field in ('tags', 'data') + tuple(extra_fields):
+            if isinstance(req_data[field], str):
+                req_data[field] = json_module.loads(req_data[field])
+    else:
+        return None, None, None, (jsonify({"error": "No file or psd_path provided"}), 400)
+
+    return psd_input, psd_input.identity(), req_data, None
+
+
+def _cached_render_response(cache_key: str, mimetype: str):
+    """
+    Answer a render request from the client's or the server's cache.
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Render failed: {str(e)}"}), 500
+    Returns:
+        304 response if the client's If-None-Match matches ``cache_key``,
+        the cached image if it is in the render cache, otherwise None
+    """
+    if cache_key in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(cache_key)
+        return response
+
+    data = render_cache.get(cache_key)
+    if data is None:
+        return None
+
+    print(f"[RENDER CACHE] Hit {cache_key[:12]}")
+    return _render_response(data, mimetype, cache_key, "hit")
+
+
+def _render_response(data: bytes, mimetype: str, cache_key: str, cache_status: str):
+    """Build an image response carrying the render cache key as ETag."""
+    response = send_file(io.BytesIO(data), mimetype=mimetype)
+    response.set_etag(cache_key)
+    response.headers["X-Render-Cache"] = cache_status
+    return response
+
+
+def _get_render_plan(psd_input, psd_identity: str, variant_path: str, tags: dict, bundle_id: str = None) -> dict:
+    """
+    Get the render plan (cached plates + dynamic layers) for a PSD variant.
+
+    Plans are cached by (PSD identity, variant path, tag set); on a cache
+    hit the PSD is not parsed at all. With a bundle_id the plan is mapped from
+    the compiled bundle instead (its variant and tags were fixed at compile time).
+    """
+    if bundle_id:
+        return bundle_store.get(bundle_id)
+
+    key = plan_cache_key(psd_identity, variant_path, tags)
+    plan = render_plan_cache.get(key)
+    if plan is not None:
+        print(f"[PLATES] Cache hit for '{variant_path or 'document'}'")
+        return plan
+
+    psd = psd_input.open_psd()
+    render_layers = collect_render_layers(psd, variant_path, tags)
+    plan = build_render_plan(psd, render_layers)
+    render_plan_cache.put(key, plan)
+    return plan
 
 
 @app.route("/render-with-substitution", methods=["POST"])
@@ -755,218 +879,384 @@ def render_with_substitution():
     Uses psd.composite() for 1:1 accuracy, then overlays substituted content.
 
     Expects JSON body with:
-        - psd_path: path to PSD file (or 'file' in form data)
+        - psd_path: path to PSD file (or 'file' in form data,
+          or 'bundle_id' of a template compiled with /compile)
         - variant_path: path to variant group (e.g. "Post 01")
         - tags: dict mapping layer paths to semantic tags
         - data: substitution data (header, subtitle, main_image, primary_color, etc.)
 
-    Returns: PNG image
+    Optional query params:
+        - max_size: limit for the longest output side in pixels
+        - format, quality, compress_level: output encoding (as for /render)
+
+    Returns: Image in the requested format (PNG by default)
     """
-    from PIL import Image, ImageDraw, ImageFont
-    import base64
+    try:
+        output = parse_output_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    max_size = request.args.get("max_size", type=int)
+    mimetype = output_mimetype(output)
 
     try:
-        # Get request data
-        if request.is_json:
-            req_data = request.get_json()
-            psd_path = req_data.get('psd_path')
-            if psd_path:
-                with open(psd_path, 'rb') as f:
-                    file_data = f.read()
+        psd_input, psd_identity, req_data, error = _read_substitution_request()
+        if error:
+            return error
+
+        variant_path = req_data.get('variant_path') or ''
+        tags = req_data.get('tags') or {}
+        sub_data = req_data.get('data') or {}
+
+        # Identical requests are served from the render cache (or answered with 304)
+        cache_key = make_cache_key(
+            "render-with-substitution", RENDER_CACHE_VERSION, psd_identity, variant_path, tags, sub_data,
+            *output_cache_key(output), max_size,
+        )
+        cached = _cached_render_response(cache_key, mimetype)
+        if cached is not None:
+            return cached
+
+        # Static plates come from the plan cache; only tagged layers are redrawn
+        with memory_stage("plan"):
+            plan = _get_render_plan(psd_input, psd_identity, variant_path, tags, req_data.get('bundle_id'))
+        with memory_stage("render"):
+            canvas = render_plan(plan, sub_data)
+            if max_size:
+                scale = resolve_preview_scale(canvas.width, canvas.height, 1.0, max_size)
+                if scale < 1.0:
+                    canvas = downscale_image(canvas, (max(1, int(canvas.width * scale)), max(1, int(canvas.height * scale))))
+
+        with memory_stage("encoding"):
+            encoded = encode_image(canvas, output)
+        render_cache.put(cache_key, encoded)
+
+        return _render_response(encoded, mimetype, cache_key, "miss")
+
+    except ValueError as e:
+        # Malformed JSON fields, or a bundle removed since the request was read
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Render failed: {str(e)}"}), 500
+
+
+@app.route("/render-with-substitution/batch", methods=["POST"])
+def render_with_substitution_batch():
+    """
+    Render one PSD variant many times with different substitution payloads.
+
+    The PSD is opened and walked once; untagged layers are flattened into
+    cached plates shared by all outputs, and the per-payload compositing and
+    PNG encoding run on a thread pool (RENDER_WORKERS).
+
+    Expects the same input as /render-with-substitution, with 'items' instead of 'data':
+        - items: array of substitution payloads, either plain data dicts or
+          {"id": "...", "data": {...}} objects (max MAX_BATCH_ITEMS); ids must
+          be unique and match BATCH_ITEM_ID_PATTERN (letters, digits, _ . -)
+
+    Optional query params:
+        - output: "zip" (default) or "multipart" (multipart/mixed stream,
+          parts are sent as soon as they finish)
+
+    Returns:
+        ZIP archive of <id>.png files, or a multipart/mixed stream of PNGs
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    import zipfile
+    import uuid
+
+    output = request.args.get("output", "zip")
+    if output not in ("zip", "multipart"):
+        return jsonify({"error": "output must be 'zip' or 'multipart'"}), 400
+
+    try:
+        psd_input, psd_identity, req_data, error = _read_substitution_request(extra_fields=('items',))
+        if error:
+            return error
+
+        items = req_data.get('items') or []
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "No items provided"}), 400
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({"error": f"Too many items ({len(items)}). Maximum is {MAX_BATCH_ITEMS}"}), 400
+
+        jobs = []
+        for index, item in enumerate(items):
+            if isinstance(item, dict) and isinstance(item.get('data'), dict):
+                jobs.append((str(item.get('id', index)), item['data']))
             else:
-                return jsonify({"error": "No psd_path provided"}), 400
-        elif "file" in request.files:
-            file_data = request.files["file"].read()
-            req_data = {
-                'variant_path': request.form.get('variant_path'),
-                'tags': request.form.get('tags', '{}'),
-                'data': request.form.get('data', '{}')
-            }
-            if isinstance(req_data['tags'], str):
-                import json as json_module
-                req_data['tags'] = json_module.loads(req_data['tags'])
-            if isinstance(req_data['data'], str):
-                import json as json_module
-                req_data['data'] = json_module.loads(req_data['data'])
+                jobs.append((str(index), item or {}))
+
+        seen_ids = set()
+        for job_id, _ in jobs:
+            if not BATCH_ITEM_ID_PATTERN.fullmatch(job_id):
+                return jsonify({"error": f"Invalid item id {job_id[:64]!r}: use 1-128 letters, digits, '_', '.' or '-'"}), 400
+            if job_id in seen_ids:
+                return jsonify({"error": f"Duplicate item id '{job_id}'"}), 400
+            seen_ids.add(job_id)
+
+        variant_path = req_data.get('variant_path') or ''
+        tags = req_data.get('tags') or {}
+
+        # Open, walk and composite the document once (or reuse cached plates);
+        # the worker threads only paste plates, substitute and encode
+        plan = _get_render_plan(psd_input, psd_identity, variant_path, tags, req_data.get('bundle_id'))
+
+        print(f"[BATCH] Rendering {len(jobs)} variants of '{variant_path or 'document'}' "
+              f"({len(plan['steps'])} plan steps) with {RENDER_WORKERS} workers")
+
+        def render_job(job):
+            job_id, sub_data = job
+            canvas = render_plan(plan, sub_data)
+            img_bytes = io.BytesIO()
+            canvas.save(img_bytes, format="PNG")
+            return job_id, img_bytes.getvalue()
+
+        if output == "multipart":
+            boundary = uuid.uuid4().hex
+
+            def generate():
+                with ThreadPoolExecutor(max_workers=RENDER_WORKERS) as executor:
+                    futures = [executor.submit(render_job, job) for job in jobs]
+                    for future in as_completed(futures):
+                        job_id, png = future.result()
+                        yield (
+                            f"--{boundary}\r\n"
+                            f"Content-Type: image/png\r\n"
+                            f"Content-Disposition: attachment; filename={quote_header_value(job_id + '.png')}\r\n"
+                            f"X-Item-Id: {job_id}\r\n"
+                            f"Content-Length: {len(png)}\r\n\r\n"
+                        ).encode("utf-8") + png + b"\r\n"
+                yield f"--{boundary}--\r\n".encode("utf-8")
+
+            return Response(generate(), mimetype=f"multipart/mixed; boundary={boundary}")
+
+        zip_bytes = io.BytesIO()
+        with ThreadPoolExecutor(max_workers=RENDER_WORKERS) as executor:
+            # PNGs are already compressed - store them as-is
+            with zipfile.ZipFile(zip_bytes, "w", compression=zipfile.ZIP_STORED) as archive:
+                for job_id, png in executor.map(render_job, jobs):
+                    archive.writestr(f"{job_id}.png", png)
+        zip_bytes.seek(0)
+
+        return send_file(zip_bytes, mimetype="application/zip", as_attachment=True, download_name="renders.zip")
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Batch render failed: {str(e)}"}), 500
+
+
+def _gallery_source(document: dict) -> str | None:
+    """Which kind of document a gallery item is: bundle_id, psd_path or document (parsed JSON)."""
+    sources = [key for key in ("bundle_id", "psd_path", "document") if document.get(key)]
+    return sources[0] if len(sources) == 1 else None
+
+
+def _render_gallery_item(document: dict, max_size: int) -> dict:
+    """
+    Render one gallery thumbnail.
+
+    Returns:
+        Result line: id, width, height, mime_type, data (base64 PNG data URI),
+        source and cache status - or id and error
+    """
+    doc_id = document["id"]
+    kind = _gallery_source(document)
+    start = time.perf_counter()
+
+    try:
+        cache_key = None
+        preview_source = {"bundle_id": "bundle", "document": "document"}.get(kind)
+        if kind == "psd_path":
+            source = document.get("source", "auto")
+            with open_psd_path(document["psd_path"]) as psd_input:
+                # Keyed by the file's identity (path, mtime, size): repeated galleries hit without
+                # hashing the file. /render-psd keys uploads by content, so the two don't share entries
+                cache_key = make_cache_key(
+                    "gallery-psd", RENDER_CACHE_VERSION, psd_input.identity(), max_size, source, "png"
+                )
+                png = render_cache.get(cache_key)
+                if png is None:
+                    psd = psd_input.open_psd()
+                    scale = resolve_preview_scale(psd.width, psd.height, 1.0, max_size)
+                    size = (max(1, int(psd.width * scale)), max(1, int(psd.height * scale)))
+                    image, preview_source = extract_document_preview(psd, size, source)
+                    if image is None:
+                        raise ValueError("Could not composite PSD")
+                    image = downscale_image(image.convert("RGBA"), size)
+
+        elif kind == "bundle_id":
+            bundle_id = document["bundle_id"]
+            if not bundle_store.is_valid_id(bundle_id) or not bundle_store.exists(bundle_id):
+                raise ValueError("Unknown bundle_id")
+            cache_key = make_cache_key("gallery", RENDER_CACHE_VERSION, f"bundle:{bundle_id}", max_size, "png")
+            png = render_cache.get(cache_key)
+            if png is None:
+                image = render_plan(bundle_store.get(bundle_id), {})
+                scale = resolve_preview_scale(image.width, image.height, 1.0, max_size)
+                image = downscale_image(image, (max(1, int(image.width * scale)), max(1, int(image.height * scale))))
+
+        else:
+            data = document["document"]
+            scale = resolve_preview_scale(data.get("width", 1080), data.get("height", 1080), 1.0, max_size)
+            image = render_parsed_document(data, scale)
+            png = None
+
+        if png is None:
+            img_bytes = io.BytesIO()
+            image.save(img_bytes, format="PNG")
+            png = img_bytes.getvalue()
+            if cache_key:
+                render_cache.put(cache_key, png)
+            cache_status = "miss" if cache_key else None
         else:
+            cache_status = "hit"
+            preview_source = None
+
+        with Image.open(io.BytesIO(png)) as rendered:
+            width, height = rendered.size
+        return {
+            "id": doc_id,
+            "width": width,
+            "height": height,
+            "mime_type": "image/png",
+            "data": f"data:image/png;base64,{base64.b64encode(png).decode('ascii')}",
+            "source": preview_source,
+            "cache": cache_status,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+
+    except Exception as e:
+        print(f"[GALLERY] '{doc_id}' failed: {e}")
+        return {"id": doc_id, "error": str(e)}
+
+
+@app.route("/render/gallery", methods=["POST"])
+def render_gallery():
+    """
+    Render thumbnails of many documents in one request.
+
+    Expects JSON body with:
+        - documents: array (max MAX_BATCH_ITEMS) of objects with an 'id' and
+          exactly one of:
+            - bundle_id: a template compiled with /compile
+            - psd_path: path to a PSD on disk (optional 'source' as in /render-psd)
+            - document: parsed JSON (as sent to /render)
+        - max_size: longest thumbnail side in pixels (default GALLERY_DEFAULT_SIZE)
+
+    Documents are rendered concurrently on a thread pool (RENDER_WORKERS).
+    Bundle and PSD thumbnails go through the render cache.
+
+    Returns:
+        NDJSON stream, one line per document as soon as it is rendered:
+        {id, width, height, mime_type, data, source, cache, seconds} or {id, error}.
+        source is the preview source for PSDs ("thumbnail", "merged", "composite"),
+        "bundle" or "document"; cache is "hit", "miss" or null (parsed JSON)
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    req_data = request.get_json(silent=True)
+    if not isinstance(req_data, dict):
+        return jsonify({"error": "No JSON data provided"}), 400
+
+    documents = req_data.get("documents")
+    if not isinstance(documents, list) or not documents:
+        return jsonify({"error": "No documents provided"}), 400
+    if len(documents) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"Too many documents ({len(documents)}). Maximum is {MAX_BATCH_ITEMS}"}), 400
+
+    max_size = req_data.get("max_size", GALLERY_DEFAULT_SIZE)
+    if not isinstance(max_size, int) or not 1 <= max_size <= GALLERY_MAX_SIZE:
+        return jsonify({"error": f"max_size must be an integer between 1 and {GALLERY_MAX_SIZE}"}), 400
+
+    jobs = []
+    for index, document in enumerate(documents):
+        if not isinstance(document, dict) or _gallery_source(document) is None:
+            return jsonify({
+                "error": f"Document {index} needs exactly one of bundle_id, psd_path or document"
+            }), 400
+        jobs.append({**document, "id": str(document.get("id", index))})
+
+    print(f"[GALLERY] Rendering {len(jobs)} thumbnails (max {max_size}px) with {RENDER_WORKERS} workers")
+
+    def generate():
+        start = time.perf_counter()
+        errors = 0
+        with ThreadPoolExecutor(max_workers=RENDER_WORKERS) as executor:
+            futures = [executor.submit(_render_gallery_item, job, max_size) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                errors += "error" in result
+                yield dumps(result) + b"\n"
+        print(f"[GALLERY] Rendered {len(jobs) - errors}/{len(jobs)} thumbnails in {time.perf_counter() - start:.2f}s")
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@app.route("/compile", methods=["POST"])
+def compile_template():
+    """
+    Compile a PSD variant into a memory-mappable render bundle.
+
+    The bundle holds the layer metadata, the pre-composited static plates and
+    tagged layer rasters (uint8) and the text styles of tagged text layers, so
+    /render-with-substitution can render it by 'bundle_id' without parsing
+    the PSD. Compiling the same PSD, variant and tag set again is a no-op.
+
+    Expects the same input as /render-with-substitution (without 'data').
+
+    Returns:
+        JSON with bundle_id, size_bytes, width, height, layer and step counts
+    """
+    try:
+        psd_input, psd_identity, req_data, error = _read_substitution_request()
+        if error:
+            return error
+        if psd_input is None:
             return jsonify({"error": "No file or psd_path provided"}), 400
 
-        variant_path = req_data.get('variant_path', '')
-        tags = req_data.get('tags', {})
-        sub_data = req_data.get('data', {})
-
-        # Parse PSD
-        psd = PSDImage.open(io.BytesIO(file_data))
-
-        # Find variant group if specified
-        def find_group(layers, path):
-            parts = path.split('/') if path else []
-            current = layers
-            for part in parts:
-                found = None
-                for layer in current:
-                    if layer.name == part:
-                        found = layer
-                        break
-                if found is None:
-                    return None
-                current = found
-            return current
-
-        target_group = find_group(list(psd), variant_path) if variant_path else psd
-
-        # Start with blank canvas
-        canvas = Image.new("RGBA", (psd.width, psd.height), (255, 255, 255, 255))
-
-        def get_layer_path(layer, parent_path=""):
-            return f"{parent_path}/{layer.name}" if parent_path else layer.name
-
-        def render_layer_recursive(layer, parent_path="", parent_visible=True):
-            """Render layer using native composite, with substitutions for tagged layers."""
-            layer_path = get_layer_path(layer, parent_path)
-            is_visible = layer.visible and parent_visible
-
-            print(f"[RENDER] Processing layer: '{layer_path}' visible={is_visible} type={type(layer).__name__}")
-
-            # Check if this layer path has a tag
-            tag_info = tags.get(layer_path, {})
-            semantic_tag = tag_info.get('semantic_tag') if isinstance(tag_info, dict) else tag_info
-            if semantic_tag:
-                print(f"[RENDER] Layer '{layer_path}' has semantic_tag: {semantic_tag}")
-
-            if hasattr(layer, '__iter__'):  # Group
-                for child in layer:
-                    render_layer_recursive(child, layer_path, is_visible)
-            else:
-                if not is_visible:
-                    return
-
-                # Get native composite (1:1 with Photoshop)
-                comp = layer.composite()
-                if not comp:
-                    return
-
-                comp = comp.convert("RGBA")
-                x, y = layer.left, layer.top
-
-                # Apply substitution if layer has semantic tag and data exists
-                if semantic_tag and sub_data:
-                    value = sub_data.get(semantic_tag)
-                    print(f"[SUBST] Layer '{layer_path}' has tag '{semantic_tag}', value exists: {value is not None}")
-
-                    if value:
-                        # Text substitution
-                        if semantic_tag in ['header', 'subtitle', 'paragraph', 'social_handle', 'url', 'cta']:
-                            if hasattr(layer, 'engine_dict'):
-                                # Draw new text over the composite
-                                try:
-                                    # Get original text properties
-                                    font_size = 24
-                                    font_family = "DejaVuSans"
-                                    fill_color = (0, 0, 0, 255)
-
-                                    # Try to extract from layer
-                                    if hasattr(layer, 'engine_dict') and layer.engine_dict:
-                                        ed = layer.engine_dict
-                                        if 'StyleRun' in ed and 'RunArray' in ed['StyleRun']:
-                                            style = ed['StyleRun']['RunArray'][0].get('StyleSheet', {}).get('StyleSheetData', {})
-                                            font_size = int(style.get('FontSize', 24))
-                                            fc = style.get('FillColor', {}).get('Values', [1, 0, 0, 0])
-                                            if len(fc) >= 4:
-                                                fill_color = (int(fc[1]*255), int(fc[2]*255), int(fc[3]*255), int(fc[0]*255))
-
-                                    # Create new text image
-                                    try:
-                                        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size)
-                                    except:
-                                        font = ImageFont.load_default(size=font_size)
-
-                                    # Measure text
-                                    temp_draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
-                                    bbox = temp_draw.textbbox((0, 0), value, font=font)
-                                    text_w = bbox[2] - bbox[0]
-                                    text_h = bbox[3] - bbox[1]
-
-                                    # Create text image
-                                    text_img = Image.new("RGBA", (max(comp.width, text_w + 10), max(comp.height, text_h + 10)), (0, 0, 0, 0))
-                                    draw = ImageDraw.Draw(text_img)
-                                    draw.text((0, 0), value, fill=fill_color, font=font)
-
-                                    comp = text_img
-                                except Exception as e:
-                                    print(f"[SUBST] Error substituting text: {e}")
-
-                        # Image substitution
-                        elif semantic_tag in ['main_image', 'logo']:
-                            print(f"[SUBST IMAGE] Attempting image substitution for '{layer_path}'")
-                            print(f"[SUBST IMAGE] Original comp size: {comp.width}x{comp.height}")
-                            print(f"[SUBST IMAGE] Value starts with: {value[:50] if isinstance(value, str) else 'N/A'}...")
-                            try:
-                                img_data = value
-                                if img_data.startswith('data:'):
-                                    img_data = img_data.split(',')[1]
-                                    print(f"[SUBST IMAGE] Stripped data: prefix")
-                                img_bytes = base64.b64decode(img_data)
-                                new_img = Image.open(io.BytesIO(img_bytes)).convert("RGBA")
-                                print(f"[SUBST IMAGE] Loaded new image: {new_img.width}x{new_img.height}")
-
-                                # Resize to fit layer bounds, maintaining aspect ratio
-                                new_img = new_img.resize((comp.width, comp.height), Image.Resampling.LANCZOS)
-                                print(f"[SUBST IMAGE] Resized to: {new_img.width}x{new_img.height}")
-
-                                # Use original alpha as mask (for clipping)
-                                if comp.mode == 'RGBA':
-                                    orig_alpha = comp.split()[3]
-                                    new_img.putalpha(orig_alpha)
-                                    print(f"[SUBST IMAGE] Applied original alpha mask")
-
-                                comp = new_img
-                                print(f"[SUBST IMAGE] Image substitution complete")
-                            except Exception as e:
-                                print(f"[SUBST IMAGE] Error substituting image: {e}")
-                                import traceback
-                                traceback.print_exc()
-
-                        # Color substitution
-                        elif semantic_tag in ['primary_color', 'secondary_color']:
-                            try:
-                                color = value
-                                if color.startswith('#'):
-                                    r = int(color[1:3], 16)
-                                    g = int(color[3:5], 16)
-                                    b = int(color[5:7], 16)
-
-                                    # Recolor - keep alpha, change RGB
-                                    if comp.mode == 'RGBA':
-                                        _, _, _, a = comp.split()
-                                        colored = Image.new("RGBA", comp.size, (r, g, b, 255))
-                                        colored.putalpha(a)
-                                        comp = colored
-                            except Exception as e:
-                                print(f"[SUBST] Error substituting color: {e}")
-
-                # Paste onto canvas
-                canvas.paste(comp, (x, y), comp)
-
-        # Render all layers in variant
-        if variant_path:
-            for layer in target_group:
-                render_layer_recursive(layer, variant_path, True)
+        variant_path = req_data.get('variant_path') or ''
+        tags = req_data.get('tags') or {}
+
+        bundle_id = make_cache_key("bundle", BUNDLE_VERSION, plan_cache_key(psd_identity, variant_path, tags))
+        path = bundle_store.path(bundle_id)
+        compiled = not bundle_store.exists(bundle_id)
+
+        if compiled:
+            psd = psd_input.open_psd()
+            render_layers = collect_render_layers(psd, variant_path, tags)
+            plan = build_render_plan(psd, render_layers)
+            write_bundle(path, plan, collect_layer_metadata(render_layers), {
+                "psd_identity": psd_identity,
+                "variant_path": variant_path,
+                "tags": tags,
+            })
         else:
-            for layer in psd:
-                render_layer_recursive(layer, "", layer.visible)
+            print(f"[BUNDLE] Bundle {bundle_id[:12]} already compiled")
 
-        # Return PNG
-        img_bytes = io.BytesIO()
-        canvas.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
+        index = read_bundle_index(path)
 
-        return send_file(img_bytes, mimetype="image/png")
+        return jsonify({
+            "bundle_id": bundle_id,
+            "compiled": compiled,
+            "size_bytes": os.path.getsize(path),
+            "width": index["width"],
+            "height": index["height"],
+            "variant_path": index["variant_path"],
+            "layers": len(index["layers"]),
+            "steps": len(index["steps"]),
+        })
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({"error": f"Render failed: {str(e)}"}), 500
+        return jsonify({"error": f"Compile failed: {str(e)}"}), 500
 
 
 @app.route("/render-psd", methods=["POST"])
@@ -978,44 +1268,78 @@ def render_psd_file():
     Expects:
         - multipart/form-data with 'file' field containing the PSD
         - Optional 'scale' query param (default 0.5 for smaller preview)
+        - Optional 'max_size' query param limiting the longest output side
+        - Optional 'source' query param:
+            - auto (default): embedded thumbnail if it is large enough,
+              then the stored merged image, then full layer compositing
+            - thumbnail / merged: prefer that embedded preview
+            - composite: always composite all layers
+        - Optional 'format' (png, jpeg, webp, avif), 'quality' and
+          'compress_level' query params (output encoding, as for /render)
+
+    Identical requests are served from the render cache; the response ETag
+    can be sent back as If-None-Match for a 304 revalidation.
 
     Returns:
-        PNG image
+        Image in the requested format, PNG by default (X-Preview-Source
+        header names the source used on a cache miss)
     """
-    from PIL import Image, ImageDraw, ImageFont
-    import base64
-
     if "file" not in request.files:
         return jsonify({"error": "No file provided"}), 400
 
     file = request.files["file"]
     scale = float(request.args.get("scale", 0.5))
+    max_size = request.args.get("max_size", type=int)
+    source = request.args.get("source", "auto")
+
+    if source not in ("auto", "thumbnail", "merged", "composite"):
+        return jsonify({"error": "source must be one of: auto, thumbnail, merged, composite"}), 400
+
+    try:
+        output = parse_output_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    mimetype = output_mimetype(output)
 
-    if not file.filename or not file.filename.lower().endswith(".psd"):
-        return jsonify({"error": "File must be a PSD file"}), 400
+    if not file.filename or not file.filename.lower().endswith(PSD_EXTENSIONS):
+        return jsonify({"error": "File must be a PSD or PSB file"}), 400
 
-    file_data = file.read()
+    try:
+        psd_input = _open_upload(file)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
-        psd = PSDImage.open(io.BytesIO(file_data))
+        cache_key = make_cache_key(
+            "render-psd", RENDER_CACHE_VERSION, psd_input.identity(), scale, max_size, source, *output_cache_key(output)
+        )
+        cached = _cached_render_response(cache_key, mimetype)
+        if cached is not None:
+            return cached
+
+        with memory_stage("open"):
+            psd = psd_input.open_psd()
 
         # Create scaled canvas
-        width = int(psd.width * scale)
-        height = int(psd.height * scale)
+        scale = resolve_preview_scale(psd.width, psd.height, scale, max_size)
+        width = max(1, int(psd.width * scale))
+        height = max(1, int(psd.height * scale))
 
-        # Get composite image from PSD (full render)
-        composite = psd.composite()
+        # Get flattened image, preferring the embedded previews over compositing
+        with memory_stage("background"):
+            composite, preview_source = extract_document_preview(psd, (width, height), source)
         if composite:
-            # Resize
+            # Reduce by integer factor first, LANCZOS only for the remainder
             composite = composite.convert("RGBA")
-            composite = composite.resize((width, height), Image.Resampling.LANCZOS)
+            composite = downscale_image(composite, (width, height))
 
-            # Save to bytes
-            img_bytes = io.BytesIO()
-            composite.save(img_bytes, format="PNG")
-            img_bytes.seek(0)
+            with memory_stage("encoding"):
+                encoded = encode_image(composite, output)
+            render_cache.put(cache_key, encoded)
 
-            return send_file(img_bytes, mimetype="image/png")
+            response = _render_response(encoded, mimetype, cache_key, "miss")
+            response.headers["X-Preview-Source"] = preview_source
+            return response
         else:
             return jsonify({"error": "Could not composite PSD"}), 500
 
@@ -1035,6 +1359,11 @@ def internal_server_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 
+# Run a synthetic PSD through the pipeline before serving (WARMUP=sync|background|off).
+# Under gunicorn --preload this happens once in the master, before workers fork.
+start_warm_up(app, os.environ.get("WARMUP", "sync"))
+
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 3335))
     app.run(host="0.0.0.0", port=port, debug=True)
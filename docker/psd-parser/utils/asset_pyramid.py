@@ -0,0 +1,120 @@
+"""
+Multi-resolution asset pyramids (mipmaps) for /parse.
+
+With ``?mipmaps=1`` every raster in the /parse response (layer images, masks,
+Smart Object sources) also carries reduced copies, so the editor can paint
+from thumbnails first and swap in the full-size asset when it has loaded.
+
+Levels are cut from the raster that is being encoded anyway, each one from
+the previous (larger) level, so a pyramid costs about a third of the full
+image's resampling work. Levels are either divisors of the full size
+(default 1/2, 1/4, 1/8) or target widths (``?mipmap_widths=256,1024``).
+
+The spec is request-scoped (a context variable set around layer processing),
+so the extractors don't need an extra argument through the layer mapper.
+"""
+
+import contextvars
+from contextlib import contextmanager
+
+from .image_extractor import downscale_image
+
+
+DEFAULT_MIPMAP_DIVISORS = (2, 4, 8)
+MAX_MIPMAP_LEVELS = 8
+MIN_MIPMAP_SIZE = 16  # Levels whose longest side would be smaller are skipped
+
+_pyramid_spec = contextvars.ContextVar("asset_pyramid", default=None)
+
+
+def parse_mipmap_spec(mipmaps: str | None, widths: str | None = None) -> dict | None:
+    """
+    Parse the /parse mipmap query parameters.
+
+    Args:
+        mipmaps: "1"/"true" for the default levels, or comma-separated divisors ("2,4,8")
+        widths: Comma-separated target widths in pixels ("256,512,1024")
+
+    Returns:
+        {"divisors": [...]} or {"widths": [...]}, or None when mipmaps are off
+
+    Raises:
+        ValueError: On malformed or out-of-range values
+    """
+    if widths:
+        values = _parse_int_list(widths, "mipmap_widths")
+        return {"widths": sorted(set(values), reverse=True)}
+
+    if not mipmaps or mipmaps.lower() in ("0", "false", "no"):
+        return None
+
+    if mipmaps.lower() in ("1", "true", "yes"):
+        return {"divisors": list(DEFAULT_MIPMAP_DIVISORS)}
+
+    values = _parse_int_list(mipmaps, "mipmaps")
+    if min(values) < 2:
+        raise ValueError("mipmaps divisors must be 2 or larger")
+    return {"divisors": sorted(set(values))}
+
+
+def _parse_int_list(value: str, name: str) -> list:
+    try:
+        values = [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise ValueError(f"{name} must be a comma-separated list of integers")
+    if not values or min(values) < 1:
+        raise ValueError(f"{name} must contain positive integers")
+    if len(values) > MAX_MIPMAP_LEVELS:
+        raise ValueError(f"{name} allows at most {MAX_MIPMAP_LEVELS} levels")
+    return values
+
+
+@contextmanager
+def asset_pyramid(spec: dict | None):
+    """Emit mipmaps with every asset encoded inside the block (no-op for None)."""
+    token = _pyramid_spec.set(spec)
+    try:
+        yield
+    finally:
+        _pyramid_spec.reset(token)
+
+
+def _level_sizes(width: int, height: int, spec: dict) -> list:
+    """(scale, width, height) of each level, largest first."""
+    if "widths" in spec:
+        targets = [w / width for w in spec["widths"] if w < width]
+    else:
+        targets = [1 / d for d in spec["divisors"]]
+
+    sizes = []
+    for scale in targets:
+        size = max(1, round(width * scale)), max(1, round(height * scale))
+        if max(size) < MIN_MIPMAP_SIZE:
+            break
+        sizes.append((round(scale, 6), *size))
+    return sizes
+
+
+def build_mipmaps(image, encode) -> list | None:
+    """
+    Reduced copies of ``image`` for the active pyramid spec.
+
+    Args:
+        image: Full-size PIL image (as encoded)
+        encode: Callable turning a PIL image into an asset dict (data, mime_type, ...)
+
+    Returns:
+        List of asset dicts with an extra "scale" key, largest first, or None
+        when no pyramid is requested
+    """
+    spec = _pyramid_spec.get()
+    if spec is None:
+        return None
+
+    levels = []
+    previous = image
+    for scale, width, height in _level_sizes(image.width, image.height, spec):
+        # Each level is reduced from the previous one, not from the full image
+        previous = downscale_image(previous, (width, height))
+        levels.append({"scale": scale, **encode(previous)})
+    return levels
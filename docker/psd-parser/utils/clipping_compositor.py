@@ -0,0 +1,139 @@
+"""
+Clipping-group compositor.
+
+A clipping base is exported as one image: the base layer with every layer
+clipped to it blended inside the base's alpha. Clipped layers only change
+color where they overlap the base; the group keeps the base's alpha.
+
+The base is composited once (without its clipped layers) and each plain
+clipped layer - a normal-blend pixel layer without effects - is blended
+with numpy over the intersection of its bounds with the base, through one
+reused float buffer. Cost scales with the clipped pixel area instead of
+base size x number of clipped layers.
+
+Groups that need psd-tools' full compositor (blend modes, layer effects,
+adjustment or vector content, bases with effects) are composited by
+psd-tools, which applies clipping itself. Bases larger than the memory
+ceiling are composited the same way, through tiled viewports.
+"""
+
+import numpy as np
+from PIL import Image
+from psd_tools.constants import Tag
+
+from .image_extractor import has_layer_effects
+from .tiled_compositor import composite_tiled, fits_in_memory, is_plain_pixel_layer
+
+
+def _intersect(a: tuple, b: tuple) -> tuple | None:
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    if right <= left or bottom <= top:
+        return None
+    return left, top, right, bottom
+
+
+def _is_plain_clip_layer(layer) -> bool:
+    """Clipped layer that can be blended from its raw pixels."""
+    if not is_plain_pixel_layer(layer, allow_mask=True):
+        return False
+    mask = layer.mask if layer.has_mask() else None
+    # Mask density/feather parameters are only handled by psd-tools
+    return mask is None or mask.disabled or not mask.parameters
+
+
+def _clip_alpha(layer, pixels: np.ndarray, rect: tuple) -> np.ndarray:
+    """
+    Coverage of a clipped layer over rect: pixel alpha x layer mask x opacity.
+
+    Args:
+        layer: Clipped psd-tools layer
+        pixels: RGBA pixels of the layer cropped to rect
+        rect: (left, top, right, bottom) in document coordinates
+
+    Returns:
+        float32 array (height, width) in [0, 1]
+    """
+    fill_opacity = layer.tagged_blocks.get_data(Tag.BLEND_FILL_OPACITY, 255)
+    alpha = pixels[:, :, 3].astype(np.float32)
+    alpha *= (layer.opacity / 255.0) * (fill_opacity / 255.0) / 255.0
+
+    if layer.has_mask() and not layer.mask.disabled:
+        mask = layer.mask.topil()
+        if mask is not None:
+            # Outside its bounds the mask has its background color
+            shape = np.full((rect[3] - rect[1], rect[2] - rect[0]), layer.mask.background_color, np.uint8)
+            overlap = _intersect(layer.mask.bbox, rect)
+            if overlap:
+                left, top, right, bottom = overlap
+                m_left, m_top = layer.mask.left, layer.mask.top
+                shape[top - rect[1]:bottom - rect[1], left - rect[0]:right - rect[0]] = np.asarray(
+                    mask.convert("L").crop((left - m_left, top - m_top, right - m_left, bottom - m_top))
+                )
+            alpha *= shape
+            alpha /= 255.0
+
+    return alpha
+
+
+def composite_clipping_group(base, max_bytes: int | None = None) -> Image.Image | None:
+    """
+    Composite a clipping base together with the layers clipped to it.
+
+    Args:
+        base: psd-tools layer with clip_layers
+        max_bytes: Memory ceiling of a single composite pass (default COMPOSITE_MEMORY_LIMIT)
+
+    Returns:
+        RGBA PIL Image of the base's bounds (positioned at base.left, base.top),
+        or None if the base has no pixels
+    """
+    clip_layers = [clip for clip in base.clip_layers if clip.is_visible()]
+
+    fits = fits_in_memory(base.width, base.height, max_bytes)
+    if not fits or has_layer_effects(base) or not all(_is_plain_clip_layer(clip) for clip in clip_layers):
+        # A layer's psd-tools composite includes its clip layers, also per viewport
+        print(f"[CLIP] Compositing clipping group '{base.name}' with psd-tools{'' if fits else ' in tiles'}")
+        return base.composite() if fits else composite_tiled(base, base.bbox, max_bytes=max_bytes)
+
+    # Base alone: its clipped layers are blended below
+    base_image = base.composite(layer_filter=lambda layer: layer is base and layer.is_visible())
+    if base_image is None:
+        return None
+
+    result = np.array(base_image.convert("RGBA"))
+    base_rect = (base.left, base.top, base.left + result.shape[1], base.top + result.shape[0])
+
+    rects = []
+    for clip in clip_layers:
+        rect = _intersect(clip.bbox, base_rect)
+        if rect:
+            rects.append((clip, rect))
+
+    # One work buffer sized for the largest intersection, shared by all layers
+    largest = max(((r[2] - r[0]) * (r[3] - r[1]) for _, r in rects), default=0)
+    buffer = np.empty(largest * 3, np.float32)
+
+    blended = 0
+    for clip, rect in rects:
+        pixels = clip.topil()
+        if pixels is None:
+            continue
+        left, top, right, bottom = rect
+        pixels = np.asarray(
+            pixels.convert("RGBA").crop((left - clip.left, top - clip.top, right - clip.left, bottom - clip.top))
+        )
+
+        alpha = _clip_alpha(clip, pixels, rect)
+        region = result[top - base_rect[1]:bottom - base_rect[1], left - base_rect[0]:right - base_rect[0], :3]
+        work = buffer[:region.size].reshape(region.shape)
+
+        # region += (clip - region) * alpha; the group keeps the base alpha
+        np.subtract(pixels[:, :, :3], region, out=work, dtype=np.float32)
+        work *= alpha[:, :, None]
+        work += region
+        region[...] = work
+        blended += 1
+
+    print(f"[CLIP] Blended {blended} clipped layers into '{base.name}' ({result.shape[1]}x{result.shape[0]})")
+    return Image.fromarray(result, "RGBA")
@@ -5,8 +5,75 @@ Converts layer images to base64 encoded PNG.
 
 import base64
 import io
+import numpy as np
 from PIL import Image
 from psd_tools import PSDImage
+from psd_tools.compression import rle_impl
+from psd_tools.constants import ColorMode, Compression, Tag
+
+from .memory_stats import memory_stage
+
+
+def _encode_png(pil_image: Image.Image, optimize: bool) -> dict:
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format="PNG", optimize=optimize)
+    base64_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+    return {
+        "data": f"data:image/png;base64,{base64_data}",
+        "mime_type": "image/png",
+        "width": pil_image.width,
+        "height": pil_image.height,
+    }
+
+
+def encode_png_asset(pil_image: Image.Image, optimize: bool = True) -> dict:
+    """Encode an image as a base64 PNG asset (no mipmaps, never atlased)."""
+    with memory_stage("encoding"):
+        return _encode_png(pil_image, optimize)
+
+
+def encode_image_asset(pil_image: Image.Image, optimize: bool = True) -> dict:
+    """
+    Encode an image as a base64 PNG asset.
+
+    When the request asked for an asset pyramid (see asset_pyramid.py), the
+    reduced levels are added under "mipmaps". In atlas mode (see
+    texture_atlas.py) small images are not encoded: the asset references a
+    rectangle of an atlas sheet under "atlas" instead of carrying "data".
+
+    Args:
+        pil_image: Image to encode
+        optimize: Use PNG optimize (smaller, slower)
+
+    Returns:
+        dict with keys:
+            - data: base64 encoded image data (data URI)
+            - mime_type: image MIME type
+            - width: image width
+            - height: image height
+            - mipmaps: reduced levels (same keys plus scale), only when requested
+            - atlas: {id, x, y, width, height} instead of data, in atlas mode
+    """
+    from .asset_pyramid import build_mipmaps
+    from .texture_atlas import add_to_atlas
+
+    atlas_ref = add_to_atlas(pil_image)
+    if atlas_ref is not None:
+        return {
+            "mime_type": "image/png",
+            "width": pil_image.width,
+            "height": pil_image.height,
+            "atlas": atlas_ref,
+        }
+
+    with memory_stage("encoding"):
+        asset = _encode_png(pil_image, optimize)
+        mipmaps = build_mipmaps(pil_image, lambda level: _encode_png(level, optimize))
+
+    if mipmaps:
+        asset["mipmaps"] = mipmaps
+    return asset
 
 
 def extract_layer_image(layer, max_dimension: int = 4096, apply_mask: bool = True, normalize_opacity: bool = True) -> dict | None:
@@ -28,9 +95,11 @@ def extract_layer_image(layer, max_dimension: int = 4096, apply_mask: bool = Tru
             - height: image height
         or None if extraction fails
     """
+    from .tiled_compositor import composite_layer
+
     try:
-        # Get the layer's composite image
-        pil_image = layer.composite()
+        # Get the layer's composite image (tiled / reduced for very large layers)
+        pil_image = composite_layer(layer, max_dimension)
 
         if pil_image is None:
             return None
@@ -48,7 +117,6 @@ def extract_layer_image(layer, max_dimension: int = 4096, apply_mask: bool = Tru
                 # Split into channels
                 r, g, b, a = pil_image.split()
                 # Normalize alpha by dividing by layer opacity (clamped to 255)
-                import numpy as np
                 a_array = np.array(a, dtype=np.float32)
                 a_normalized = np.clip(a_array / layer_opacity, 0, 255).astype(np.uint8)
                 a = Image.fromarray(a_normalized, mode='L')
@@ -79,21 +147,9 @@ def extract_layer_image(layer, max_dimension: int = 4096, apply_mask: bool = Tru
             new_width = int(width * ratio)
             new_height = int(height * ratio)
             pil_image = pil_image.resize((new_width, new_height), Image.LANCZOS)
-            width, height = new_width, new_height
 
         # Convert to base64
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format="PNG", optimize=True)
-        buffer.seek(0)
-
-        base64_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-        return {
-            "data": f"data:image/png;base64,{base64_data}",
-            "mime_type": "image/png",
-            "width": width,
-            "height": height,
-        }
+        return encode_image_asset(pil_image)
 
     except Exception as e:
         print(f"Failed to extract layer image: {e}")
@@ -118,6 +174,8 @@ def extract_layer_image_without_mask(layer, max_dimension: int = 4096, normalize
     Returns:
         dict with image data or None if extraction fails
     """
+    from .tiled_compositor import composite_layer
+
     try:
         pil_image = None
         layer_name = getattr(layer, 'name', 'unknown')
@@ -127,7 +185,7 @@ def extract_layer_image_without_mask(layer, max_dimension: int = 4096, normalize
         if layer_has_effects:
             print(f"  [IMAGE] Layer '{layer_name}' has effects - using composite() to preserve them")
             try:
-                pil_image = layer.composite()
+                pil_image = composite_layer(layer, max_dimension)
             except Exception as e:
                 print(f"  [IMAGE] composite() failed for '{layer_name}': {e}")
 
@@ -153,7 +211,7 @@ def extract_layer_image_without_mask(layer, max_dimension: int = 4096, normalize
         # Method 3: Fall back to composite (will have mask baked in)
         if pil_image is None:
             try:
-                pil_image = layer.composite()
+                pil_image = composite_layer(layer, max_dimension)
             except Exception:
                 pass
 
@@ -169,7 +227,6 @@ def extract_layer_image_without_mask(layer, max_dimension: int = 4096, normalize
         if normalize_opacity and hasattr(layer, 'opacity') and layer.opacity < 255:
             layer_opacity = layer.opacity / 255.0
             if layer_opacity > 0:
-                import numpy as np
                 r, g, b, a = pil_image.split()
                 a_array = np.array(a, dtype=np.float32)
                 a_normalized = np.clip(a_array / layer_opacity, 0, 255).astype(np.uint8)
@@ -184,21 +241,9 @@ def extract_layer_image_without_mask(layer, max_dimension: int = 4096, normalize
             new_width = int(width * ratio)
             new_height = int(height * ratio)
             pil_image = pil_image.resize((new_width, new_height), Image.LANCZOS)
-            width, height = new_width, new_height
 
         # Convert to base64
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format="PNG", optimize=True)
-        buffer.seek(0)
-
-        base64_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-        return {
-            "data": f"data:image/png;base64,{base64_data}",
-            "mime_type": "image/png",
-            "width": width,
-            "height": height,
-        }
+        return encode_image_asset(pil_image)
 
     except Exception as e:
         print(f"Failed to extract layer image without mask: {e}")
@@ -240,20 +285,8 @@ def _process_pil_image(pil_image: Image.Image, max_dimension: int) -> dict | Non
             new_width = int(width * ratio)
             new_height = int(height * ratio)
             pil_image = pil_image.resize((new_width, new_height), Image.LANCZOS)
-            width, height = new_width, new_height
-
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format="PNG", optimize=True)
-        buffer.seek(0)
 
-        base64_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-        return {
-            "data": f"data:image/png;base64,{base64_data}",
-            "mime_type": "image/png",
-            "width": width,
-            "height": height,
-        }
+        return encode_image_asset(pil_image)
 
     except Exception as e:
         print(f"Failed to process PIL image: {e}")
@@ -268,8 +301,6 @@ def has_layer_effects(layer) -> bool:
     Also checks if composite() looks different from source (e.g., color tint applied).
     """
     try:
-        from psd_tools.constants import Tag
-
         layer_name = getattr(layer, 'name', 'unknown')
 
         if not hasattr(layer, 'tagged_blocks'):
@@ -313,8 +344,6 @@ def composite_differs_from_source(layer, threshold: float = 0.1) -> bool:
     Returns True if the composite appears to have color/effects applied.
     """
     try:
-        import numpy as np
-
         layer_name = getattr(layer, 'name', 'unknown')
 
         # Get composite
@@ -561,26 +590,18 @@ def extract_layer_mask(layer, max_dimension: int = 4096) -> dict | None:
             new_width = int(width * resize_ratio)
             new_height = int(height * resize_ratio)
             mask_image = mask_image.resize((new_width, new_height), Image.LANCZOS)
-            width, height = new_width, new_height
             # Adjust offset for resize
             offset_x = int(offset_x * resize_ratio)
             offset_y = int(offset_y * resize_ratio)
 
         # Convert to PNG (grayscale)
-        buffer = io.BytesIO()
-        mask_image.save(buffer, format="PNG", optimize=True)
-        buffer.seek(0)
-
-        base64_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        asset = encode_image_asset(mask_image)
 
         # Get mask properties
         background_color = getattr(mask, 'background_color', 255)
 
         return {
-            "data": f"data:image/png;base64,{base64_data}",
-            "mime_type": "image/png",
-            "width": width,
-            "height": height,
+            **asset,
             "offset_x": offset_x,
             "offset_y": offset_y,
             "background_color": background_color,
@@ -725,6 +746,143 @@ def analyze_smart_object_transform(layer) -> dict | None:
         return None
 
 
+def extract_document_preview(psd, size: tuple | None = None, source: str = "auto") -> tuple:
+    """
+    Get a flattened preview of the whole document, cheapest source first.
+
+    Sources, in "auto" order:
+        - thumbnail: the embedded thumbnail resource (JPEG, usually <= 160px),
+          used only when it is at least as large as the requested ``size``
+        - merged: the pre-composited merged image Photoshop stores when
+          "Maximize Compatibility" is on (one channel decode, no compositing)
+        - composite: full layer compositing with psd-tools (fallback)
+
+    Args:
+        psd: PSDImage object
+        size: Target (width, height) the caller will downscale to, or None for full size
+        source: "auto", "thumbnail", "merged" or "composite"
+
+    Returns:
+        Tuple of (PIL Image or None, name of the source used)
+    """
+    if source in ("auto", "thumbnail") and size is not None:
+        try:
+            if psd.has_thumbnail():
+                thumbnail = psd.thumbnail()
+                if thumbnail is not None and (
+                    source == "thumbnail"
+                    or (thumbnail.width >= size[0] and thumbnail.height >= size[1])
+                ):
+                    print(f"[PREVIEW] Using embedded thumbnail {thumbnail.width}x{thumbnail.height}")
+                    return thumbnail, "thumbnail"
+        except Exception as e:
+            print(f"[PREVIEW] Could not read thumbnail resource: {e}")
+
+    if source in ("auto", "thumbnail", "merged"):
+        try:
+            if psd.has_preview():
+                merged = psd.topil()
+                if merged is not None:
+                    print(f"[PREVIEW] Using merged image data {merged.width}x{merged.height}")
+                    return merged, "merged"
+        except Exception as e:
+            print(f"[PREVIEW] Could not read merged image data: {e}")
+
+    from .tiled_compositor import composite_document
+
+    print("[PREVIEW] No embedded preview available, compositing layers")
+    return composite_document(psd, size), "composite"
+
+
+def sample_merged_pixel(psd, x: int = 0, y: int = 0) -> tuple | None:
+    """
+    Read a single pixel of the merged image without decoding the whole image.
+
+    Only the scanline containing the pixel is decoded in each channel. This
+    works for 8-bit RGB merged data stored RAW or RLE (what Photoshop writes).
+    Other layouts fall back to decoding the merged image with ``topil()``.
+
+    Args:
+        psd: PSDImage object
+        x: Pixel column
+        y: Pixel row
+
+    Returns:
+        (r, g, b, a) tuple, or None if the document has no merged image
+    """
+    if not psd.has_preview():
+        return None
+
+    try:
+        header = psd._record.header
+        image_data = psd._record.image_data
+
+        if header.color_mode == ColorMode.RGB and header.depth == 8 and header.channels >= 3:
+            row_size = header.width
+            channel_count = min(header.channels, 4)
+            rows = []
+
+            if image_data.compression == Compression.RAW:
+                for channel in range(channel_count):
+                    offset = (channel * header.height + y) * row_size
+                    rows.append(image_data.data[offset:offset + row_size])
+
+            elif image_data.compression == Compression.RLE:
+                # Byte counts for every scanline of every channel precede the rows
+                count_dtype = ">u2" if header.version == 1 else ">u4"
+                counts_total = header.height * header.channels
+                counts = np.frombuffer(image_data.data, dtype=count_dtype, count=counts_total)
+                offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+                data_start = counts_total * counts.itemsize
+                for channel in range(channel_count):
+                    row_index = channel * header.height + y
+                    start = data_start + int(offsets[row_index])
+                    encoded = image_data.data[start:start + int(counts[row_index])]
+                    rows.append(rle_impl.decode(encoded, row_size))
+
+            if rows:
+                pixel = tuple(row[x] for row in rows)
+                return pixel if len(pixel) == 4 else pixel + (255,)
+
+        # Fallback: decode the whole merged image
+        merged = psd.topil()
+        return merged.convert("RGBA").getpixel((x, y)) if merged is not None else None
+
+    except Exception as e:
+        print(f"[PREVIEW] Could not sample merged pixel: {e}")
+        return None
+
+
+def downscale_image(image_pil: Image.Image, size: tuple) -> Image.Image:
+    """
+    Resize an image to ``size``, reducing large ratios cheaply first.
+
+    ``Image.reduce()`` box-averages by an integer factor (fast, low memory),
+    then a LANCZOS pass only covers the remaining < 2x ratio. Upscaling and
+    small ratios go straight to LANCZOS, matching a plain ``resize()``.
+
+    Args:
+        image_pil: Source PIL image
+        size: Target (width, height)
+
+    Returns:
+        Resized PIL image (the source image when it already has ``size``)
+    """
+    target_width, target_height = max(1, int(size[0])), max(1, int(size[1]))
+
+    if image_pil.size == (target_width, target_height):
+        return image_pil
+
+    factor = min(image_pil.width // target_width, image_pil.height // target_height)
+    if factor >= 2 and image_pil.mode in ("L", "LA", "RGB", "RGBA"):
+        image_pil = image_pil.reduce(factor)
+
+    if image_pil.size != (target_width, target_height):
+        image_pil = image_pil.resize((target_width, target_height), Image.LANCZOS)
+
+    return image_pil
+
+
 def apply_mask_to_image(image_pil: Image.Image, mask_pil: Image.Image) -> Image.Image:
     """
     Apply a grayscale mask to an image's alpha channel.
@@ -754,8 +912,6 @@ def apply_mask_to_image(image_pil: Image.Image, mask_pil: Image.Image) -> Image.
 
         # Combine existing alpha with mask
         # Multiply: new_alpha = old_alpha * mask / 255
-        import numpy as np
-
         a_arr = np.array(a, dtype=np.float32)
         m_arr = np.array(mask_pil, dtype=np.float32)
 
@@ -0,0 +1,125 @@
+"""
+Fast JSON responses with negotiated compression.
+
+Large JSON payloads (/parse, /analyze) are serialized with orjson, which
+also writes numpy scalars and arrays natively, and compressed with the best
+encoding the client accepts: zstd, then brotli, then gzip. zstandard and
+brotli are optional - encodings whose module is missing are not offered.
+
+The serialized and on-the-wire sizes and the chosen encoding are recorded
+as request metrics (see memory_stats.record_metric) next to the
+"serialization" and "compression" stage timings.
+"""
+
+import gzip
+import json
+import os
+
+from flask import Response, request
+
+from .memory_stats import memory_stage, record_metric
+
+try:
+    import orjson
+except ImportError:  # Falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "1") != "0"
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", 1024))
+# Base64 image data dominates the payloads: higher levels cost time for ~no gain
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 4
+
+
+def _default(obj):
+    """Serialize values neither encoder handles natively (numpy scalars, sets)."""
+    if hasattr(obj, "tolist"):  # numpy scalars and arrays (stdlib fallback)
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    """Serialize ``data`` to UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def available_encodings() -> list:
+    """Content encodings this worker can produce, in order of preference."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encodings) -> str | None:
+    """
+    Pick the response encoding for a request.
+
+    Args:
+        accept_encodings: werkzeug Accept object (request.accept_encodings)
+
+    Returns:
+        "zstd", "br", "gzip", or None to send the body uncompressed
+    """
+    if not RESPONSE_COMPRESSION:
+        return None
+    return accept_encodings.best_match(available_encodings())
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a response body with a negotiated encoding."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def json_response(data, status: int = 200) -> Response:
+    """
+    Build a (compressed) JSON response for the current request.
+
+    Args:
+        data: JSON-serializable data (dicts, lists, numpy values)
+        status: HTTP status code
+
+    Returns:
+        Flask Response with Content-Encoding and Vary set when compressed
+    """
+    with memory_stage("serialization"):
+        body = dumps(data)
+    record_metric("json_bytes", len(body))
+
+    encoding = negotiate_encoding(request.accept_encodings) if len(body) >= COMPRESSION_MIN_BYTES else None
+    if encoding:
+        with memory_stage("compression"):
+            body = compress(body, encoding)
+    record_metric("wire_bytes", len(body))
+    record_metric("content_encoding", encoding or "identity")
+
+    response = Response(body, status=status, mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
@@ -2,7 +2,10 @@
 Layer mapper utility for mapping PSD layers to canvas layer types.
 """
 
-from psd_tools.constants import BlendMode
+import numpy as np
+from psd_tools.constants import BlendMode, Tag
+from scipy.ndimage import binary_dilation, binary_erosion, binary_fill_holes
+from skimage import measure
 from psd_tools.api.layers import TypeLayer, PixelLayer, ShapeLayer, SmartObjectLayer, Group
 from psd_tools.api.adjustments import SolidColorFill, GradientFill
 
@@ -17,6 +20,7 @@ from .image_extractor import (
     analyze_smart_object_transform,
     apply_mask_to_image,
 )
+from .tiled_compositor import composite_layer
 
 
 # Canvas layer types matching LayerType enum
@@ -139,12 +143,8 @@ def extract_alpha_contour_path(layer, width: float, height: float) -> str | None
     Returns SVG path string or None if no valid contour found.
     """
     try:
-        import numpy as np
-        from skimage import measure
-        from scipy.ndimage import binary_dilation, binary_erosion, binary_fill_holes
-
         # Get composite image
-        comp = layer.composite()
+        comp = composite_layer(layer)
         if comp is None or comp.mode != 'RGBA':
             return None
 
@@ -234,10 +234,8 @@ def extract_alpha_contour_path(layer, width: float, height: float) -> str | None
             return None
 
         # Calculate circularity to decide smoothing strategy
-        from skimage.measure import regionprops, label
-
-        labeled = label(binary)
-        regions = regionprops(labeled)
+        labeled = measure.label(binary)
+        regions = measure.regionprops(labeled)
 
         circularity = 0
         if regions:
@@ -248,18 +246,16 @@ def extract_alpha_contour_path(layer, width: float, height: float) -> str | None
                 circularity = (4 * np.pi * area) / (perimeter ** 2)
 
         # Simplify contour - use fewer points for round shapes, more for complex
-        from skimage.measure import approximate_polygon
-
         if circularity > 0.75:
             # Round shape - use more points for accuracy, will smooth with Bezier
             tolerance = max(0.5, min(w, h) * 0.002)  # 0.2% - finer detail
-            simplified = approximate_polygon(largest_contour, tolerance)
+            simplified = measure.approximate_polygon(largest_contour, tolerance)
             use_bezier = True
             print(f"  Detected round shape (circularity={circularity:.2f}), using {len(simplified)} points with Bezier smoothing")
         else:
             # Angular shape - use polygon
             tolerance = max(1, min(w, h) * 0.005)  # 0.5%
-            simplified = approximate_polygon(largest_contour, tolerance)
+            simplified = measure.approximate_polygon(largest_contour, tolerance)
             use_bezier = False
             print(f"  Detected angular shape (circularity={circularity:.2f}), using {len(simplified)} points as polygon")
 
@@ -348,10 +344,8 @@ def detect_alpha_mask_shape(layer, width: float, height: float) -> dict | None:
         - cx, cy: center for ellipse
     """
     try:
-        import numpy as np
-
         # Get composite image
-        comp = layer.composite()
+        comp = composite_layer(layer)
         if comp is None or comp.mode != 'RGBA':
             return None
 
@@ -596,7 +590,69 @@ def extract_rotation_from_origination(layer) -> float:
         return 0.0
 
 
-def collect_clipping_base_layers(clipping_layer, sibling_layers: list, layer_offset_x: float, layer_offset_y: float) -> list:
+def build_sibling_index(sibling_layers: list) -> dict:
+    """
+    Precompute clipping lookups for the layers of one group.
+
+    A clipping layer clips to the non-clipping layers directly below it, up to
+    the previous clipping layer or the bottom of the group; the following
+    clipping layers of the same run have no base of their own. Built once per
+    group so the per-layer lookups are O(1) instead of scans of the group.
+
+    Args:
+        sibling_layers: All layers of the group (in order)
+
+    Returns:
+        Dict with:
+            layers: sibling_layers
+            positions: id(layer) -> index in layers
+            clip_runs: (start, end) index spans of consecutive clipping layers
+            clip_bases: index of the first layer of each run -> its base layers (nearest first)
+            clipped_ids: ids of layers listed in a sibling's clip_layers
+    """
+    positions = {}
+    clip_runs = []
+    clip_bases = {}
+    clipped_ids = set()
+
+    run_start = None
+    bases_start = 0  # First non-clipping layer after the previous run
+    for i, layer in enumerate(sibling_layers):
+        positions[id(layer)] = i
+
+        for clipped in getattr(layer, "clip_layers", None) or []:
+            clipped_ids.add(id(clipped))
+
+        if getattr(layer, "clipping", False):
+            if run_start is None:
+                run_start = i
+                clip_bases[i] = sibling_layers[bases_start:i][::-1]
+        elif run_start is not None:
+            clip_runs.append((run_start, i))
+            run_start = None
+            bases_start = i
+
+    if run_start is not None:
+        clip_runs.append((run_start, len(sibling_layers)))
+
+    return {
+        "layers": sibling_layers,
+        "positions": positions,
+        "clip_runs": clip_runs,
+        "clip_bases": clip_bases,
+        "clipped_ids": clipped_ids,
+    }
+
+
+def get_clipping_base_layers(clipping_layer, sibling_index: dict) -> list:
+    """Base layers a clipping layer clips to (nearest first), from a build_sibling_index() result."""
+    position = sibling_index["positions"].get(id(clipping_layer))
+    if position is None:
+        return []
+    return sibling_index["clip_bases"].get(position, [])
+
+
+def collect_clipping_base_layers(clipping_layer, sibling_index: dict, layer_offset_x: float, layer_offset_y: float) -> list:
     """
     Collect information about clipping base layers for complex clipping mask rendering.
 
@@ -605,7 +661,7 @@ def collect_clipping_base_layers(clipping_layer, sibling_layers: list, layer_off
 
     Args:
         clipping_layer: The layer with clipping=True
-        sibling_layers: All sibling layers in the same group (in order)
+        sibling_index: build_sibling_index() of the layer's group
         layer_offset_x: X offset of the clipping layer
         layer_offset_y: Y offset of the clipping layer
 
@@ -613,25 +669,7 @@ def collect_clipping_base_layers(clipping_layer, sibling_layers: list, layer_off
         List of base layer info dicts with: x, y, width, height, rotation, opacity, name
     """
     try:
-        # Find index of clipping layer
-        clipping_index = None
-        for i, layer in enumerate(sibling_layers):
-            if layer is clipping_layer:
-                clipping_index = i
-                break
-
-        if clipping_index is None or clipping_index == 0:
-            return []
-
-        # Collect base layers (non-clipping layers before this one)
-        base_layers = []
-        for i in range(clipping_index - 1, -1, -1):
-            layer = sibling_layers[i]
-            # Stop at another clipping layer
-            if getattr(layer, "clipping", False):
-                break
-            base_layers.append(layer)
-
+        base_layers = get_clipping_base_layers(clipping_layer, sibling_index)
         if not base_layers:
             return []
 
@@ -691,7 +729,7 @@ def collect_clipping_base_layers(clipping_layer, sibling_layers: list, layer_off
         return []
 
 
-def generate_clipping_base_path(clipping_layer, sibling_layers: list, layer_offset_x: float, layer_offset_y: float) -> str | None:
+def generate_clipping_base_path(clipping_layer, sibling_index: dict, layer_offset_x: float, layer_offset_y: float) -> str | None:
     """
     Generate SVG path from clipping base layers (layers that a clipped layer clips to).
 
@@ -703,7 +741,7 @@ def generate_clipping_base_path(clipping_layer, sibling_layers: list, layer_offs
 
     Args:
         clipping_layer: The layer with clipping=True
-        sibling_layers: All sibling layers in the same group (in order)
+        sibling_index: build_sibling_index() of the layer's group
         layer_offset_x: X offset of the clipping layer
         layer_offset_y: Y offset of the clipping layer
 
@@ -711,25 +749,7 @@ def generate_clipping_base_path(clipping_layer, sibling_layers: list, layer_offs
         Combined SVG path string or None
     """
     try:
-        # Find index of clipping layer
-        clipping_index = None
-        for i, layer in enumerate(sibling_layers):
-            if layer is clipping_layer:
-                clipping_index = i
-                break
-
-        if clipping_index is None or clipping_index == 0:
-            return None
-
-        # Collect base layers (non-clipping layers before this one)
-        base_layers = []
-        for i in range(clipping_index - 1, -1, -1):
-            layer = sibling_layers[i]
-            # Stop at another clipping layer
-            if getattr(layer, "clipping", False):
-                break
-            base_layers.append(layer)
-
+        base_layers = get_clipping_base_layers(clipping_layer, sibling_index)
         if not base_layers:
             return None
 
@@ -855,7 +875,7 @@ def _detect_shape_type(layer: ShapeLayer) -> str:
         return LAYER_TYPE_RECTANGLE
 
 
-def map_layer(layer, layer_index: int, psd_width: int, psd_height: int, is_group: bool = False, is_root: bool = True, sibling_layers: list = None, psd_dpi: int = 72) -> dict | None:
+def map_layer(layer, layer_index: int, psd_width: int, psd_height: int, is_group: bool = False, is_root: bool = True, sibling_index: dict = None, psd_dpi: int = 72) -> dict | None:
     """
     Map a PSD layer to a canvas layer structure.
 
@@ -866,7 +886,7 @@ def map_layer(layer, layer_index: int, psd_width: int, psd_height: int, is_group
         psd_height: PSD document height
         is_group: whether this layer is a group
         is_root: whether this layer is at the root level (not inside a group)
-        sibling_layers: list of sibling layers (for clipping mask detection)
+        sibling_index: build_sibling_index() of the layer's group (for clipping mask detection)
         psd_dpi: PSD document resolution in DPI (for font size scaling)
 
     Returns:
@@ -920,7 +940,7 @@ def map_layer(layer, layer_index: int, psd_width: int, psd_height: int, is_group
     if layer_type == LAYER_TYPE_TEXT:
         _map_text_layer(layer, base_data, opacity, psd_dpi)
     elif layer_type == LAYER_TYPE_IMAGE:
-        _map_image_layer(layer, base_data, opacity, sibling_layers)
+        _map_image_layer(layer, base_data, opacity, sibling_index)
     elif isinstance(layer, GradientFill):
         _map_gradient_fill_layer(layer, base_data, opacity)
     elif isinstance(layer, SolidColorFill):
@@ -1241,14 +1261,14 @@ def _map_text_layer(layer: TypeLayer, data: dict, opacity: float, psd_dpi: int =
         }
 
 
-def _map_image_layer(layer, data: dict, opacity: float, sibling_layers: list = None):
+def _map_image_layer(layer, data: dict, opacity: float, sibling_index: dict = None):
     """Map image/pixel layer properties.
 
     Args:
         layer: The PSD layer
         data: Layer data dict to populate
         opacity: Layer opacity
-        sibling_layers: Optional list of sibling layers (for clipping mask detection)
+        sibling_index: Optional build_sibling_index() of the group (for clipping mask detection)
     """
     try:
         clip_path = None
@@ -1278,13 +1298,13 @@ def _map_image_layer(layer, data: dict, opacity: float, sibling_layers: list = N
         # Check for CLIPPING MASK first
         # If layer is clipping, collect full base layer info (with rotation, opacity)
         clipping_bases = []
-        if is_clipping and sibling_layers:
+        if is_clipping and sibling_index:
             print(f"  [CLIPPING] Layer '{layer_name}' is a clipping layer")
 
             # Collect full info about each base layer
             clipping_bases = collect_clipping_base_layers(
                 layer,
-                sibling_layers,
+                sibling_index,
                 layer.left,
                 layer.top
             )
@@ -1292,7 +1312,7 @@ def _map_image_layer(layer, data: dict, opacity: float, sibling_layers: list = N
             # Also generate simple clipPath for fallback (without rotation)
             clipping_clip_path = generate_clipping_base_path(
                 layer,
-                sibling_layers,
+                sibling_index,
                 layer.left,
                 layer.top
             )
@@ -1314,10 +1334,8 @@ def _map_image_layer(layer, data: dict, opacity: float, sibling_layers: list = N
 
             if potential_clip_path:
                 # Check if this is a "closed" shape (like ellipse) vs "open" decorative element
-                import numpy as np
-
                 try:
-                    comp = layer.composite()
+                    comp = composite_layer(layer)
                     if comp and comp.mode == 'RGBA':
                         arr = np.array(comp)
                         alpha = arr[:, :, 3]
@@ -1523,7 +1541,6 @@ def _extract_gradient_data(gradient_fill: dict, layer_name: str) -> dict | None:
 
 def _map_shape_layer(layer: ShapeLayer, data: dict, opacity: float):
     """Map shape layer properties."""
-    from psd_tools.constants import Tag
     import math
 
     try:
@@ -1598,7 +1615,7 @@ def _map_shape_layer(layer: ShapeLayer, data: dict, opacity: float):
         # Priority 2: If still default, try composite approach (for complex shapes)
         if fill_color == "#CCCCCC":
             try:
-                composite = layer.composite()
+                composite = composite_layer(layer)
                 if composite:
                     composite_rgba = composite.convert("RGBA")
                     w, h = composite_rgba.size
@@ -1653,8 +1670,6 @@ def _map_shape_layer(layer: ShapeLayer, data: dict, opacity: float):
 
 def _map_gradient_fill_layer(layer: GradientFill, data: dict, opacity: float):
     """Map gradient fill adjustment layer properties."""
-    from psd_tools.constants import Tag
-
     try:
         print(f"  [GRADIENT FILL] Processing layer '{layer.name}'")
 
@@ -0,0 +1,209 @@
+"""
+Process memory statistics and per-request memory profiles.
+
+Peak RSS (VmHWM) is read from /proc/self/status. On Linux the peak can be
+reset by writing "5" to /proc/self/clear_refs, which gives per-request peaks
+for sync gunicorn workers (one request per process at a time). Elsewhere the
+lifetime peak from getrusage() is reported instead.
+
+A MemoryProfile splits a request into named stages (open, background,
+mapping, encoding, serialization, ...). Code marks stages with
+``with memory_stage("name"):`` - a no-op when no profile is active, so the
+utils modules can be instrumented without depending on Flask. Every stage
+records its duration and peak RSS; with tracemalloc enabled it also records
+the peak of traced Python allocations and, for top-level stages, the
+allocation sites that grew the most during the stage. Code can attach
+request metrics (e.g. response sizes) with ``record_metric()``.
+"""
+
+import contextvars
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+_current_profile = contextvars.ContextVar("memory_profile", default=None)
+
+MB = 1024 * 1024
+
+
+def reset_peak_rss() -> bool:
+    """Reset the process peak RSS to the current RSS. Returns False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss() -> int:
+    """Peak RSS of the process in bytes (since the last reset_peak_rss())."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryProfile:
+    """
+    Stage-by-stage memory profile of one request.
+
+    The peak measured between two checkpoints (stage entry/exit) is charged to
+    every stage that is open at that moment, so nested stages (e.g. encoding
+    inside mapping) count towards their parents as well.
+    """
+
+    def __init__(self, name: str, trace_allocations: bool = False, top_allocations: int = 10):
+        self.name = name
+        self.trace_allocations = trace_allocations
+        self.top_allocations = top_allocations
+        self.stages = {}
+        self.metrics = {}
+        self.peak_rss = 0
+        self.peak_traced = 0
+        self.peak_rss_is_per_request = False
+        self.seconds = 0.0
+        self._stack = []
+        self._stage_snapshot = None
+        self._started_tracing = False
+        self._token = None
+        self._start_time = None
+
+    def start(self):
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.peak_rss_is_per_request = reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._token = _current_profile.set(self)
+        self._start_time = time.perf_counter()
+        return self
+
+    def stop(self):
+        self._checkpoint()
+        self.seconds = time.perf_counter() - self._start_time
+        if self._token is not None:
+            _current_profile.reset(self._token)
+            self._token = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _checkpoint(self):
+        """Charge the peak since the last checkpoint to the open stages, then reset it."""
+        rss = read_peak_rss()
+        traced = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_traced = max(self.peak_traced, traced)
+        for stage in self._stack:
+            stage["peak_rss"] = max(stage["peak_rss"], rss)
+            stage["peak_traced"] = max(stage["peak_traced"], traced)
+
+        reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def enter(self, name: str):
+        self._checkpoint()
+        stage = self.stages.setdefault(name, {
+            "calls": 0, "seconds": 0.0, "peak_rss": 0, "peak_traced": 0, "top_allocations": None,
+        })
+        stage["calls"] += 1
+        if not self._stack and tracemalloc.is_tracing() and self.top_allocations:
+            self._stage_snapshot = self._snapshot()
+        self._stack.append(stage)
+        return stage, time.perf_counter()
+
+    def exit(self, stage: dict, started: float):
+        self._checkpoint()
+        stage["seconds"] += time.perf_counter() - started
+        self._stack.remove(stage)
+
+        if not self._stack and self._stage_snapshot is not None:
+            stage["top_allocations"] = self._top_allocation_sites(self._stage_snapshot)
+            self._stage_snapshot = None
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    def _top_allocation_sites(self, before) -> list:
+        """Allocation sites that grew the most since the ``before`` snapshot."""
+        stats = [stat for stat in self._snapshot().compare_to(before, "lineno") if stat.size_diff > 0]
+        return [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_mb": round(stat.size_diff / MB, 2),
+                "count": stat.count_diff,
+            }
+            for stat in stats[:self.top_allocations]
+        ]
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "seconds": round(self.seconds, 3),
+            "peak_rss_mb": round(self.peak_rss / MB, 1),
+            "peak_rss_scope": "request" if self.peak_rss_is_per_request else "process",
+            "peak_traced_mb": round(self.peak_traced / MB, 1) if self.trace_allocations else None,
+            "stages": {
+                name: {
+                    "calls": stage["calls"],
+                    "seconds": round(stage["seconds"], 3),
+                    "peak_rss_mb": round(stage["peak_rss"] / MB, 1),
+                    "peak_traced_mb": round(stage["peak_traced"] / MB, 1) if self.trace_allocations else None,
+                    "top_allocations": stage["top_allocations"],
+                }
+                for name, stage in self.stages.items()
+            },
+            "metrics": self.metrics,
+        }
+
+    def summary(self) -> str:
+        """One-line description for logs."""
+        stages = ", ".join(
+            f"{name} {stage['peak_rss'] / MB:.0f} MB/{stage['seconds']:.2f}s"
+            for name, stage in self.stages.items()
+        )
+        summary = f"{self.name}: peak RSS {self.peak_rss / MB:.1f} MB in {self.seconds:.2f}s ({stages})"
+        if self.metrics:
+            summary += " " + " ".join(f"{name}={value}" for name, value in self.metrics.items())
+        return summary
+
+
+@contextmanager
+def memory_stage(name: str):
+    """Mark a stage of the current request's memory profile (no-op without one)."""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    stage, started = profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit(stage, started)
+
+
+def record_metric(name: str, value):
+    """Attach a metric to the current request's memory profile (no-op without one)."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.metrics[name] = value
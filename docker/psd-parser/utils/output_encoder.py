@@ -0,0 +1,136 @@
+"""
+Output encodings of the render endpoints.
+
+/render, /render-psd and /render-with-substitution return a PNG by default.
+Consumers that don't need lossless output (AI-vision calls, thumbnail grids)
+can ask for ``?format=jpeg|webp|avif`` with a ``quality``, which is both much
+smaller and much faster to encode for photo-heavy canvases; PNG output takes
+a ``compress_level`` (0-9, lower is faster).
+
+Pillow's PNG (zlib), JPEG and WebP encoders release the GIL while they run,
+so renders encoding on different threads (batch/gallery pools, threaded
+workers) don't serialize on encoding. AVIF needs the optional
+pillow-avif-plugin; without it, format=avif is rejected.
+"""
+
+import io
+
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401 - registers the AVIF plugin with Pillow
+except ImportError:
+    pillow_avif = None
+
+
+OUTPUT_MIMETYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+DEFAULT_QUALITY = {"jpeg": 85, "webp": 80, "avif": 60}
+DEFAULT_PNG_COMPRESS_LEVEL = 6  # Pillow's default
+DEFAULT_OUTPUT = {"format": "png", "quality": None, "compress_level": DEFAULT_PNG_COMPRESS_LEVEL}
+
+
+def available_formats() -> list:
+    """Output formats this worker can encode."""
+    formats = ["png", "jpeg", "webp"]
+    if "AVIF" in Image.SAVE:
+        formats.append("avif")
+    return formats
+
+
+def _int_arg(args, name: str, low: int, high: int) -> int | None:
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def parse_output_options(args) -> dict:
+    """
+    Read the output encoding query parameters of a render request.
+
+    Args:
+        args: Request query args (format, quality, compress_level)
+
+    Returns:
+        dict with format, quality (lossy formats) and compress_level (PNG)
+
+    Raises:
+        ValueError: On unknown formats or out-of-range values
+    """
+    output_format = (args.get("format") or "png").lower()
+    if output_format == "jpg":
+        output_format = "jpeg"
+    if output_format not in OUTPUT_MIMETYPES:
+        raise ValueError(f"format must be one of: {', '.join(OUTPUT_MIMETYPES)}")
+    if output_format not in available_formats():
+        raise ValueError(f"format '{output_format}' is not supported by this server")
+
+    quality = _int_arg(args, "quality", 1, 100)
+    compress_level = _int_arg(args, "compress_level", 0, 9)
+
+    if output_format == "png":
+        return {
+            "format": "png",
+            "quality": None,
+            "compress_level": DEFAULT_PNG_COMPRESS_LEVEL if compress_level is None else compress_level,
+        }
+    return {
+        "format": output_format,
+        "quality": DEFAULT_QUALITY[output_format] if quality is None else quality,
+        "compress_level": None,
+    }
+
+
+def output_mimetype(options: dict) -> str:
+    return OUTPUT_MIMETYPES[options["format"]]
+
+
+def output_cache_key(options: dict) -> tuple:
+    """Cache key parts of the output encoding (("png",) for the default, as before)."""
+    if options == DEFAULT_OUTPUT:
+        return ("png",)
+    return (options["format"], options["quality"], options["compress_level"])
+
+
+def encode_image(image: Image.Image, options: dict) -> bytes:
+    """
+    Encode a rendered image.
+
+    Args:
+        image: PIL image (RGBA renders; flattened onto white for JPEG)
+        options: Output of parse_output_options()
+
+    Returns:
+        Encoded image bytes
+    """
+    output_format = options["format"]
+    buffer = io.BytesIO()
+
+    if output_format == "png":
+        image.save(buffer, format="PNG", compress_level=options["compress_level"])
+    elif output_format == "jpeg":
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            flattened = Image.new("RGB", image.size, (255, 255, 255))
+            flattened.paste(image, mask=image.getchannel("A"))
+            image = flattened
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, format="JPEG", quality=options["quality"], optimize=False)
+    elif output_format == "webp":
+        image.save(buffer, format="WEBP", quality=options["quality"], method=4)
+    else:
+        image.save(buffer, format="AVIF", quality=options["quality"], speed=8)
+
+    return buffer.getvalue()
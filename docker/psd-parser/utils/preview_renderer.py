@@ -0,0 +1,234 @@
+"""
+Preview renderer for parsed PSD data.
+
+Draws the /parse JSON structure with PIL at an arbitrary scale, so previews
+for AI analysis are composited at target resolution instead of being drawn
+at full canvas size and downscaled afterwards.
+"""
+
+import base64
+import io
+from PIL import Image, ImageDraw, ImageFont
+
+from .image_extractor import downscale_image
+from .texture_atlas import crop_atlas_asset
+
+
+DEFAULT_FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+
+def resolve_preview_scale(width: int, height: int, scale: float = 1.0, max_size: int | None = None) -> float:
+    """
+    Resolve the effective render scale for a document.
+
+    Args:
+        width: Document width in pixels
+        height: Document height in pixels
+        scale: Requested scale factor (1.0 = full size)
+        max_size: Optional limit for the longest output side in pixels.
+                  When given, it wins over a larger ``scale``.
+
+    Returns:
+        Scale factor in the range (0, 1] for downscaled previews,
+        or ``scale`` itself when it is above 1.0 and no max_size applies
+    """
+    if scale <= 0:
+        scale = 1.0
+
+    if max_size and max_size > 0 and max(width, height) > 0:
+        scale = min(scale, max_size / max(width, height))
+
+    return scale
+
+
+def _hex_to_rgb(color: str) -> tuple | None:
+    """Convert '#RRGGBB' to an (r, g, b) tuple, or None for other formats."""
+    if not color or not color.startswith("#") or len(color) < 7:
+        return None
+    return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+
+
+def _apply_opacity(image: Image.Image, opacity: float) -> Image.Image:
+    """Multiply the alpha channel of an RGBA image by ``opacity``."""
+    if opacity < 1.0:
+        alpha = image.split()[3]
+        alpha = alpha.point(lambda p: int(p * opacity))
+        image.putalpha(alpha)
+    return image
+
+
+def _load_font(font_size: int):
+    """Load the default preview font at the given size."""
+    try:
+        return ImageFont.truetype(DEFAULT_FONT_PATH, font_size)
+    except Exception:
+        # Use default font with explicit size (PIL 10+)
+        return ImageFont.load_default(size=font_size)
+
+
+def decode_data_uri_image(data: str) -> Image.Image:
+    """Open a base64 (optionally data: URI prefixed) image without loading pixels yet."""
+    if data.startswith("data:"):
+        data = data.split(",")[1]
+    return Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def render_parsed_document(data: dict, scale: float = 1.0) -> Image.Image:
+    """
+    Render parsed PSD data (the /parse response format) to an RGBA image.
+
+    Layer geometry, font sizes and line heights are transformed by ``scale``
+    and every source raster is decoded and reduced once to its target size,
+    so CPU and memory scale with the output area rather than the canvas area.
+
+    Args:
+        data: dict with width, height, layers and images (same format as /parse,
+              including atlas references and their "atlases" sheets)
+        scale: Output scale factor (1.0 = full canvas size)
+
+    Returns:
+        PIL Image (RGBA) of size (width * scale, height * scale)
+    """
+    width = data.get("width", 1080)
+    height = data.get("height", 1080)
+    layers = data.get("layers", [])
+    images_data = {img["id"]: img for img in data.get("images", [])}
+    atlases_data = {atlas["id"]: atlas for atlas in data.get("atlases", [])}
+
+    canvas_width = max(1, round(width * scale))
+    canvas_height = max(1, round(height * scale))
+
+    # Create canvas
+    canvas = Image.new("RGBA", (canvas_width, canvas_height), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(canvas)
+
+    # Decoded rasters keyed by (image_id, target size) - each source is decoded once
+    raster_cache = {}
+    atlas_cache = {}
+
+    def load_source(image_id: str, size: tuple) -> Image.Image:
+        image_data = images_data[image_id]
+        atlas_ref = image_data.get("atlas")
+        if atlas_ref and not image_data.get("data"):
+            # Small asset packed into an atlas sheet (decoded once per sheet)
+            if atlas_ref["id"] not in atlas_cache:
+                atlas_cache[atlas_ref["id"]] = decode_data_uri_image(atlases_data[atlas_ref["id"]]["data"]).convert("RGBA")
+            return crop_atlas_asset(atlas_cache[atlas_ref["id"]], atlas_ref)
+
+        img = decode_data_uri_image(image_data.get("data", ""))
+        # JPEG sources can be decoded directly at reduced size
+        if img.format == "JPEG":
+            img.draft("RGB", size)
+        return img.convert("RGBA")
+
+    def load_raster(image_id: str, size: tuple) -> Image.Image:
+        key = (image_id, size)
+        if key not in raster_cache:
+            img = load_source(image_id, size)
+            raster_cache[key] = downscale_image(img, size)
+        return raster_cache[key].copy()
+
+    def render_layers(layer_list):
+        """Render layers recursively."""
+        for layer in layer_list:
+            if not layer.get("visible", True):
+                continue
+
+            layer_type = layer.get("type")
+            x = int(layer.get("x", 0) * scale)
+            y = int(layer.get("y", 0) * scale)
+            w = max(1, int(layer.get("width", 100) * scale))
+            h = max(1, int(layer.get("height", 100) * scale))
+            opacity = layer.get("opacity", 1.0)
+            props = layer.get("properties", {})
+
+            if layer_type == "group":
+                render_layers(layer.get("children", []))
+
+            elif layer_type in ("rectangle", "ellipse"):
+                rgb = _hex_to_rgb(props.get("fill", "#CCCCCC"))
+                if rgb is None:
+                    continue
+                try:
+                    if opacity < 1.0:
+                        # Create transparent layer and composite for proper alpha blending
+                        shape_layer = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+                        shape_draw = ImageDraw.Draw(shape_layer)
+                        if layer_type == "rectangle":
+                            shape_draw.rectangle([0, 0, w, h], fill=(*rgb, 255))
+                        else:
+                            shape_draw.ellipse([0, 0, w, h], fill=(*rgb, 255))
+                        _apply_opacity(shape_layer, opacity)
+                        canvas.paste(shape_layer, (x, y), shape_layer)
+                    elif layer_type == "rectangle":
+                        draw.rectangle([x, y, x + w, y + h], fill=(*rgb, 255))
+                    else:
+                        draw.ellipse([x, y, x + w, y + h], fill=(*rgb, 255))
+                except Exception as e:
+                    print(f"Error drawing {layer_type}: {e}")
+
+            elif layer_type == "text":
+                text = props.get("text", "")
+                font_size = max(1, int(props.get("fontSize", 24) * scale))
+
+                try:
+                    font = _load_font(font_size)
+                    rgb = _hex_to_rgb(props.get("fill", "#000000")) or (0, 0, 0)
+                    color = (*rgb, int(255 * opacity))
+
+                    # Draw text with word wrap if fixedWidth
+                    if props.get("fixedWidth") and w > 0:
+                        # Simple word wrap
+                        words = text.split()
+                        lines = []
+                        current_line = ""
+                        for word in words:
+                            test_line = current_line + " " + word if current_line else word
+                            bbox = draw.textbbox((0, 0), test_line, font=font)
+                            if bbox[2] - bbox[0] <= w:
+                                current_line = test_line
+                            else:
+                                if current_line:
+                                    lines.append(current_line)
+                                current_line = word
+                        if current_line:
+                            lines.append(current_line)
+
+                        line_height = font_size * 1.2
+                        for i, line in enumerate(lines):
+                            draw.text((x, y + i * line_height), line, fill=color, font=font)
+                    else:
+                        draw.text((x, y), text, fill=color, font=font)
+
+                except Exception as e:
+                    print(f"Error drawing text '{text[:20]}...': {e}")
+
+            elif layer_type == "image":
+                image_id = layer.get("image_id")
+                if image_id and image_id in images_data:
+                    try:
+                        # Decode and reduce straight to the scaled layer dimensions
+                        img = load_raster(image_id, (w, h))
+
+                        # Apply tint color if specified (for recoloring icon images)
+                        tint_rgb = _hex_to_rgb(props.get("tintColor") or "")
+                        if tint_rgb:
+                            try:
+                                # Replace all non-transparent pixels with tint color
+                                tint_layer = Image.new("RGBA", img.size, (*tint_rgb, 255))
+                                img = Image.composite(tint_layer, Image.new("RGBA", img.size, (0, 0, 0, 0)), img)
+                            except Exception as te:
+                                print(f"Error applying tint: {te}")
+
+                        _apply_opacity(img, opacity)
+
+                        # Paste onto canvas
+                        canvas.paste(img, (x, y), img)
+                    except Exception as e:
+                        print(f"Error rendering image: {e}")
+                        # Draw placeholder
+                        draw.rectangle([x, y, x + w, y + h], fill=(200, 200, 200, 128), outline=(150, 150, 150))
+
+    render_layers(layers)
+
+    return canvas
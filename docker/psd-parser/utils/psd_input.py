@@ -0,0 +1,104 @@
+"""
+Memory-mapped PSD input.
+
+Uploads and psd_path files are opened through mmap instead of being read
+into a bytes object: the pages are backed by the file (and can be dropped
+by the kernel under pressure) and nothing is copied before psd-tools parses
+the document.
+
+Uploads are mapped straight from Werkzeug's spooled temporary file; streams
+that only exist in memory are first copied to a spool file in SPOOL_DIR.
+"""
+
+import io
+import mmap
+import os
+import shutil
+import tempfile
+
+
+SPOOL_DIR = os.environ.get("SPOOL_DIR") or None  # None = system temp directory
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+class PsdInput:
+    """
+    Read-only, memory-mapped PSD file.
+
+    ``data`` is an mmap object: it is file-like (read/seek/tell, accepted by
+    PSDImage.open), sliceable and supports the buffer protocol (hashlib).
+    """
+
+    def __init__(self, fileobj, path: str | None = None, owns_file: bool = False):
+        self.path = path
+        self._file = fileobj
+        self._owns_file = owns_file
+
+        self.size = os.fstat(fileobj.fileno()).st_size
+        if self.size == 0:
+            raise ValueError("Empty file")
+        self.data = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def identity(self) -> str:
+        """Cache identity: path + mtime + size for files on disk, content hash for uploads."""
+        from .render_cache import psd_identity_from_path, psd_identity_from_bytes
+
+        if self.path:
+            return psd_identity_from_path(self.path)
+        return psd_identity_from_bytes(self.data)
+
+    def open_psd(self):
+        """Parse the mapped file with psd-tools."""
+        from psd_tools import PSDImage
+
+        self.data.seek(0)
+        return PSDImage.open(self.data)
+
+    def close(self):
+        try:
+            self.data.close()
+        except BufferError:
+            pass  # Still exported somewhere; released with the last reference
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_psd_path(path: str) -> PsdInput:
+    """Map a PSD file on disk without reading it."""
+    return PsdInput(open(path, "rb"), path=path, owns_file=True)
+
+
+def spool_upload(file_storage) -> PsdInput:
+    """
+    Map an uploaded file (werkzeug FileStorage).
+
+    Werkzeug spools uploads over 500 KB to a temporary file; that file is
+    mapped directly. In-memory streams are copied to a spool file in chunks.
+    """
+    stream = file_storage.stream
+    try:
+        # SpooledTemporaryFile.fileno() moves small in-memory uploads to disk
+        stream.fileno()
+        stream.flush()
+        return PsdInput(stream)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+
+    spool = tempfile.TemporaryFile(dir=SPOOL_DIR)
+    try:
+        stream.seek(0)
+        shutil.copyfileobj(stream, spool, SPOOL_CHUNK_SIZE)
+        spool.flush()
+        return PsdInput(spool, owns_file=True)
+    except Exception:
+        spool.close()
+        raise
@@ -0,0 +1,275 @@
+"""
+Compiled render bundles for frequently rendered templates.
+
+A bundle is a render plan (see substitution_renderer.build_render_plan)
+written to disk in a flat binary layout that can be memory-mapped and
+rendered from without parsing the PSD:
+
+    magic "PSDBNDL1" (8 bytes)
+    index length (uint64, little endian)
+    index (UTF-8 JSON): document and layer metadata, tagged-layer text
+        styles and the offset/size/mode of every raster
+    rasters: raw uint8 pixel data (RGBA plates/composites, L masks),
+        each aligned to 64 bytes
+
+Rasters are wrapped with Image.frombuffer() over the mapping, so worker
+processes share the pages through the OS page cache instead of holding
+private copies.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+
+BUNDLE_MAGIC = b"PSDBNDL1"
+BUNDLE_VERSION = 1
+BUNDLE_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + BUNDLE_ALIGNMENT - 1) // BUNDLE_ALIGNMENT * BUNDLE_ALIGNMENT
+
+
+def collect_layer_metadata(render_layers: list) -> list:
+    """
+    Describe the collected render layers for the bundle index.
+
+    Args:
+        render_layers: Output of collect_render_layers()
+
+    Returns:
+        List of dicts with path, name, type, bounds and semantic_tag
+    """
+    return [
+        {
+            "path": entry["path"],
+            "name": entry["layer"].name,
+            "type": type(entry["layer"]).__name__,
+            "left": entry["layer"].left,
+            "top": entry["layer"].top,
+            "width": entry["layer"].width,
+            "height": entry["layer"].height,
+            "semantic_tag": entry["semantic_tag"],
+        }
+        for entry in render_layers
+    ]
+
+
+def write_bundle(path: str, plan: dict, layers: list, meta: dict) -> int:
+    """
+    Write a render plan to ``path`` as a bundle (atomically).
+
+    Args:
+        path: Output file path
+        plan: Output of build_render_plan()
+        layers: Output of collect_layer_metadata()
+        meta: Extra index fields (variant_path, tags, psd_identity, ...)
+
+    Returns:
+        Size of the written bundle in bytes
+    """
+    rasters = []  # (image, index entry) in file order
+
+    def add_raster(image: Image.Image) -> dict:
+        entry = {"mode": image.mode, "width": image.width, "height": image.height}
+        rasters.append((image, entry))
+        return entry
+
+    steps = []
+    background = add_raster(plan["background"])
+    for step in plan["steps"]:
+        if step["kind"] == "plate":
+            steps.append({
+                "kind": "plate",
+                "image": add_raster(step["image"]),
+                "mask": add_raster(step["mask"]),
+                "x": step["x"],
+                "y": step["y"],
+            })
+        else:
+            steps.append({
+                "kind": "dynamic",
+                "path": step["path"],
+                "semantic_tag": step["semantic_tag"],
+                "comp": add_raster(step["comp"]),
+                "x": step["x"],
+                "y": step["y"],
+                "text_style": step["text_style"],
+            })
+
+    index = {
+        **meta,
+        "version": BUNDLE_VERSION,
+        "width": plan["width"],
+        "height": plan["height"],
+        "layers": layers,
+        "background": background,
+        "steps": steps,
+    }
+
+    # Offsets depend on the index length, which depends on the offsets:
+    # reserve room by assigning offsets until the index size is stable
+    index_bytes = b""
+    while True:
+        offset = _align(len(BUNDLE_MAGIC) + 8 + len(index_bytes))
+        for image, entry in rasters:
+            entry["offset"] = offset
+            entry["length"] = image.width * image.height * len(image.getbands())
+            offset = _align(offset + entry["length"])
+        encoded = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        if len(encoded) <= len(index_bytes):
+            break
+        index_bytes = encoded + b" " * 64  # Padding absorbs digit-count changes
+    index_bytes = encoded.ljust(len(index_bytes))
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack("<Q", len(index_bytes)))
+        f.write(index_bytes)
+        for image, entry in rasters:
+            f.write(b"\0" * (entry["offset"] - f.tell()))
+            f.write(image.tobytes())
+        size = f.tell()
+    os.replace(tmp_path, path)
+
+    print(f"[BUNDLE] Wrote {path}: {len(rasters)} rasters, {size // 1024} KB")
+    return size
+
+
+def read_bundle_index(path: str) -> dict:
+    """Read only the JSON index of a bundle."""
+    with open(path, "rb") as f:
+        if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+            raise ValueError(f"Not a render bundle: {path}")
+        (index_length,) = struct.unpack("<Q", f.read(8))
+        return json.loads(f.read(index_length))
+
+
+def load_bundle(path: str) -> dict:
+    """
+    Memory-map a bundle and return it as a render plan.
+
+    The returned plan can be passed to render_plan() directly. Its images are
+    read-only views of the mapping; the mapping stays open while they are alive.
+
+    Returns:
+        Render plan dict, plus the bundle "index"
+    """
+    with open(path, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapping[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+        mapping.close()
+        raise ValueError(f"Not a render bundle: {path}")
+
+    try:
+        (index_length,) = struct.unpack_from("<Q", mapping, len(BUNDLE_MAGIC))
+        index_start = len(BUNDLE_MAGIC) + 8
+        index = json.loads(mapping[index_start:index_start + index_length])
+    except (struct.error, ValueError):
+        mapping.close()
+        raise ValueError(f"Corrupt render bundle index: {path}") from None
+
+    if index.get("version") != BUNDLE_VERSION:
+        mapping.close()
+        raise ValueError(f"Unsupported bundle version: {index.get('version')}")
+
+    view = memoryview(mapping)
+
+    def raster(entry: dict) -> Image.Image:
+        data = view[entry["offset"]:entry["offset"] + entry["length"]]
+        return Image.frombuffer(entry["mode"], (entry["width"], entry["height"]), data, "raw", entry["mode"], 0, 1)
+
+    steps = []
+    for step in index["steps"]:
+        if step["kind"] == "plate":
+            steps.append({
+                "kind": "plate",
+                "image": raster(step["image"]),
+                "mask": raster(step["mask"]),
+                "x": step["x"],
+                "y": step["y"],
+            })
+        else:
+            text_style = step["text_style"]
+            if text_style:
+                text_style = {**text_style, "fill_color": tuple(text_style["fill_color"])}
+            steps.append({
+                "kind": "dynamic",
+                "path": step["path"],
+                "semantic_tag": step["semantic_tag"],
+                "comp": raster(step["comp"]),
+                "x": step["x"],
+                "y": step["y"],
+                "text_style": text_style,
+            })
+
+    return {
+        "width": index["width"],
+        "height": index["height"],
+        "background": raster(index["background"]),
+        "steps": steps,
+        "index": index,
+    }
+
+
+class BundleStore:
+    """
+    Directory of compiled bundles with an in-process LRU table of mapped bundles.
+
+    Bundle ids are hex digests (see render_cache.make_cache_key), so they can
+    be used as file names safely after validation. Evicted bundles are not
+    closed explicitly: a mapping is released once no render holds its images.
+    """
+
+    def __init__(self, directory: str, max_loaded: int = 32):
+        self.directory = directory
+        self.max_loaded = max(1, max_loaded)
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(bundle_id) -> bool:
+        return isinstance(bundle_id, str) and len(bundle_id) == 64 and all(c in "0123456789abcdef" for c in bundle_id)
+
+    def path(self, bundle_id: str) -> str:
+        if not self.is_valid_id(bundle_id):
+            raise ValueError("Invalid bundle_id")
+        return os.path.join(self.directory, f"{bundle_id}.psdb")
+
+    def exists(self, bundle_id: str) -> bool:
+        return os.path.exists(self.path(bundle_id))
+
+    def get(self, bundle_id: str) -> dict:
+        """
+        Return the mapped render plan for a bundle.
+
+        Raises:
+            ValueError: If the id is invalid or the bundle was never compiled
+                (or was removed)
+        """
+        with self._lock:
+            plan = self._loaded.get(bundle_id)
+            if plan is not None:
+                self._loaded.move_to_end(bundle_id)
+                return plan
+
+            try:
+                plan = load_bundle(self.path(bundle_id))
+            except FileNotFoundError:
+                raise ValueError("Unknown bundle_id") from None
+
+            self._loaded[bundle_id] = plan
+            print(f"[BUNDLE] Mapped bundle {bundle_id[:12]} ({len(plan['steps'])} steps)")
+
+            while len(self._loaded) > self.max_loaded:
+                old_id, _ = self._loaded.popitem(last=False)
+                print(f"[BUNDLE] Unmapped bundle {old_id[:12]}")
+            return plan
@@ -0,0 +1,142 @@
+"""
+Content-addressed on-disk cache for rendered images.
+
+Renders are deterministic for a given PSD and set of render parameters, so the
+encoded output is stored under a hash of those inputs. The same hash is used
+as the HTTP ETag, letting clients revalidate with If-None-Match.
+
+The cache directory may be shared by several gunicorn workers: entries are
+written atomically and least recently used entries (by mtime, bumped on every
+hit) are evicted once the directory exceeds its byte budget.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def make_cache_key(*parts) -> str:
+    """
+    Build a deterministic cache key from JSON-serializable parts.
+
+    Dict ordering does not matter; any change to a part changes the key.
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def psd_identity_from_path(path: str) -> str:
+    """Identify a PSD on disk by its real path, modification time and size (no read needed)."""
+    stat = os.stat(path)
+    return f"path:{os.path.realpath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def psd_identity_from_bytes(data) -> str:
+    """Identify an uploaded PSD by the hash of its content."""
+    return f"sha1:{hashlib.sha1(data).hexdigest()}"
+
+
+class RenderCache:
+    """
+    Disk-backed LRU cache of encoded renders with a byte budget.
+
+    A max_bytes of 0 disables the cache (get() always misses, put() is a no-op).
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None  # Lazily computed size of the directory
+
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.directory, key[:2], f"{key}.bin")
+
+    def get(self, key: str) -> bytes | None:
+        """Return cached bytes for ``key`` and mark the entry as recently used."""
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"[RENDER CACHE] Could not read {key[:12]}: {e}")
+            return None
+
+    def put(self, key: str, data: bytes):
+        """Store ``data`` under ``key`` atomically and evict old entries over budget."""
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[RENDER CACHE] Could not store {key[:12]}: {e}")
+            return
+
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan()[1]
+            else:
+                self._total += len(data)
+
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _scan(self) -> tuple:
+        """List cache entries as (mtime, size, path) and return them with the total size."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".bin"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # Evicted by another worker
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is below 90% of its budget."""
+        # Rescan: other workers write to the same directory
+        entries, total = self._scan()
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                evicted += 1
+            except FileNotFoundError:
+                total -= size
+
+        self._total = total
+        print(f"[RENDER CACHE] Evicted {evicted} entries, {total // 1024} KB in use")
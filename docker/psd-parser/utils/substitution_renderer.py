@@ -0,0 +1,443 @@
+"""
+Substitution renderer for templated PSD variants.
+
+Renders a PSD (or one variant group of it) with native layer composites,
+replacing the content of layers tagged with a semantic tag (header, main_image,
+primary_color, ...) by values from a substitution payload.
+
+Rendering is split into a collection pass, which walks the document once, and
+a render plan: runs of consecutive untagged layers are flattened into static
+"plates", so a render is a handful of pastes of cached plates plus the dynamic
+(tagged) layers. Plans are cached per (PSD hash, variant path, tag set).
+"""
+
+import base64
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+TEXT_TAGS = ['header', 'subtitle', 'paragraph', 'social_handle', 'url', 'cta']
+IMAGE_TAGS = ['main_image', 'logo']
+COLOR_TAGS = ['primary_color', 'secondary_color']
+
+
+def find_group(psd, path: str):
+    """
+    Find a group by its slash-separated layer path (e.g. "Post 01/Content").
+
+    Returns:
+        The matching group, ``psd`` itself for an empty path, or None if not found
+    """
+    if not path:
+        return psd
+
+    current = list(psd)
+    for part in path.split('/'):
+        found = None
+        for layer in current:
+            if layer.name == part:
+                found = layer
+                break
+        if found is None:
+            return None
+        current = found
+    return current
+
+
+def collect_render_layers(psd, variant_path: str, tags: dict) -> list:
+    """
+    Walk the document once and collect the visible leaf layers to render.
+
+    Args:
+        psd: PSDImage object
+        variant_path: Path of the variant group to render ("" for the whole document)
+        tags: dict mapping layer paths to semantic tags (or {'semantic_tag': ...} dicts)
+
+    Returns:
+        List of dicts in paint order with keys:
+            - layer: psd-tools layer
+            - path: slash-separated layer path
+            - semantic_tag: tag name or None
+    """
+    target_group = find_group(psd, variant_path)
+    if target_group is None:
+        raise ValueError(f"Variant group not found: {variant_path}")
+
+    render_layers = []
+
+    def get_layer_path(layer, parent_path=""):
+        return f"{parent_path}/{layer.name}" if parent_path else layer.name
+
+    def collect_recursive(layer, parent_path="", parent_visible=True):
+        layer_path = get_layer_path(layer, parent_path)
+        is_visible = layer.visible and parent_visible
+
+        print(f"[RENDER] Processing layer: '{layer_path}' visible={is_visible} type={type(layer).__name__}")
+
+        # Check if this layer path has a tag
+        tag_info = tags.get(layer_path, {})
+        semantic_tag = tag_info.get('semantic_tag') if isinstance(tag_info, dict) else tag_info
+        if semantic_tag:
+            print(f"[RENDER] Layer '{layer_path}' has semantic_tag: {semantic_tag}")
+
+        if hasattr(layer, '__iter__'):  # Group
+            for child in layer:
+                collect_recursive(child, layer_path, is_visible)
+        elif is_visible:
+            render_layers.append({
+                "layer": layer,
+                "path": layer_path,
+                "semantic_tag": semantic_tag or None,
+            })
+
+    if variant_path:
+        for layer in target_group:
+            collect_recursive(layer, variant_path, True)
+    else:
+        for layer in psd:
+            collect_recursive(layer, "", layer.visible)
+
+    return render_layers
+
+
+def get_layer_composite(layer) -> Image.Image | None:
+    """Get the native RGBA composite of a layer (1:1 with Photoshop)."""
+    comp = layer.composite()
+    if comp:
+        comp = comp.convert("RGBA")
+    return comp
+
+
+def extract_text_style(layer) -> dict | None:
+    """
+    Extract the text style used to redraw substituted text.
+
+    Returns:
+        dict with font_size and fill_color (RGBA tuple), or None if the layer
+        is not a text layer (text substitution does not apply)
+    """
+    if not hasattr(layer, 'engine_dict'):
+        return None
+
+    try:
+        font_size = 24
+        fill_color = (0, 0, 0, 255)
+
+        if layer.engine_dict:
+            ed = layer.engine_dict
+            if 'StyleRun' in ed and 'RunArray' in ed['StyleRun']:
+                style = ed['StyleRun']['RunArray'][0].get('StyleSheet', {}).get('StyleSheetData', {})
+                font_size = int(style.get('FontSize', 24))
+                fc = style.get('FillColor', {}).get('Values', [1, 0, 0, 0])
+                if len(fc) >= 4:
+                    fill_color = (int(fc[1]*255), int(fc[2]*255), int(fc[3]*255), int(fc[0]*255))
+
+        return {"font_size": font_size, "fill_color": fill_color}
+    except Exception as e:
+        print(f"[SUBST] Error reading text style of '{layer.name}': {e}")
+        return None
+
+
+def substitute_layer(layer_path: str, comp: Image.Image, semantic_tag: str, value, text_style: dict | None = None) -> Image.Image:
+    """
+    Apply a substitution value to a tagged layer's composite.
+
+    Args:
+        layer_path: Layer path (for logging)
+        comp: Original RGBA composite of the layer (not modified)
+        semantic_tag: Semantic tag of the layer
+        value: Substitution value (text, base64 image or hex color)
+        text_style: Output of extract_text_style() (required for text tags)
+
+    Returns:
+        New composite image, or ``comp`` if the substitution does not apply
+    """
+    # Text substitution
+    if semantic_tag in TEXT_TAGS:
+        if text_style is not None:
+            # Draw new text over the composite
+            try:
+                font_size = text_style["font_size"]
+                fill_color = text_style["fill_color"]
+
+                # Create new text image
+                try:
+                    font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", font_size)
+                except Exception:
+                    font = ImageFont.load_default(size=font_size)
+
+                # Measure text
+                temp_draw = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+                bbox = temp_draw.textbbox((0, 0), value, font=font)
+                text_w = bbox[2] - bbox[0]
+                text_h = bbox[3] - bbox[1]
+
+                # Create text image
+                text_img = Image.new("RGBA", (max(comp.width, text_w + 10), max(comp.height, text_h + 10)), (0, 0, 0, 0))
+                draw = ImageDraw.Draw(text_img)
+                draw.text((0, 0), value, fill=fill_color, font=font)
+
+                return text_img
+            except Exception as e:
+                print(f"[SUBST] Error substituting text: {e}")
+
+    # Image substitution
+    elif semantic_tag in IMAGE_TAGS:
+        print(f"[SUBST IMAGE] Attempting image substitution for '{layer_path}'")
+        print(f"[SUBST IMAGE] Original comp size: {comp.width}x{comp.height}")
+        try:
+            img_data = value
+            if img_data.startswith('data:'):
+                img_data = img_data.split(',')[1]
+            img_bytes = base64.b64decode(img_data)
+            new_img = Image.open(io.BytesIO(img_bytes)).convert("RGBA")
+            print(f"[SUBST IMAGE] Loaded new image: {new_img.width}x{new_img.height}")
+
+            # Resize to fit layer bounds
+            new_img = new_img.resize((comp.width, comp.height), Image.Resampling.LANCZOS)
+
+            # Use original alpha as mask (for clipping)
+            if comp.mode == 'RGBA':
+                new_img.putalpha(comp.split()[3])
+
+            print(f"[SUBST IMAGE] Image substitution complete")
+            return new_img
+        except Exception as e:
+            print(f"[SUBST IMAGE] Error substituting image: {e}")
+            import traceback
+            traceback.print_exc()
+
+    # Color substitution
+    elif semantic_tag in COLOR_TAGS:
+        try:
+            color = value
+            if color.startswith('#'):
+                r = int(color[1:3], 16)
+                g = int(color[3:5], 16)
+                b = int(color[5:7], 16)
+
+                # Recolor - keep alpha, change RGB
+                if comp.mode == 'RGBA':
+                    colored = Image.new("RGBA", comp.size, (r, g, b, 255))
+                    colored.putalpha(comp.split()[3])
+                    return colored
+        except Exception as e:
+            print(f"[SUBST] Error substituting color: {e}")
+
+    return comp
+
+
+def _flatten_plate(run: list, width: int, height: int) -> dict | None:
+    """
+    Flatten a run of untagged layers into one plate.
+
+    Pasting a layer with its own alpha as mask is, per pixel, the affine map
+    D' = (1 - m) * D + m * S (all bands, alpha included). A run of pastes is
+    therefore D' = P * D + Q; the plate stores Q / (1 - P) as image and 1 - P
+    as mask, so a single paste(image, box, mask) reproduces the whole run
+    (within 8-bit rounding).
+
+    Args:
+        run: List of (comp, x, y) tuples in paint order
+        width: Canvas width
+        height: Canvas height
+
+    Returns:
+        dict with image, mask, x, y (cropped to the run's bounds), or None if empty
+    """
+    x0 = max(0, min(x for _, x, _ in run))
+    y0 = max(0, min(y for _, _, y in run))
+    x1 = min(width, max(x + comp.width for comp, x, _ in run))
+    y1 = min(height, max(y + comp.height for comp, _, y in run))
+    if x0 >= x1 or y0 >= y1:
+        return None
+
+    keep = np.ones((y1 - y0, x1 - x0), dtype=np.float32)  # P: share of the backdrop kept
+    acc = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.float32)  # Q: accumulated layer content
+
+    for comp, x, y in run:
+        # Intersection of the layer with the plate bounds
+        ix0, iy0 = max(x, x0), max(y, y0)
+        ix1, iy1 = min(x + comp.width, x1), min(y + comp.height, y1)
+        if ix0 >= ix1 or iy0 >= iy1:
+            continue
+
+        src = np.asarray(comp, dtype=np.float32)[iy0 - y:iy1 - y, ix0 - x:ix1 - x]
+        m = src[:, :, 3:4] / 255.0
+        region = (slice(iy0 - y0, iy1 - y0), slice(ix0 - x0, ix1 - x0))
+        acc[region] = acc[region] * (1.0 - m) + src * m
+        keep[region] *= 1.0 - m[:, :, 0]
+
+    coverage = 1.0 - keep
+    image = acc / np.maximum(coverage, 1e-6)[:, :, None]
+    mask = np.rint(coverage * 255.0).astype(np.uint8)
+
+    return {
+        "image": Image.fromarray(np.rint(np.clip(image, 0, 255)).astype(np.uint8), "RGBA"),
+        "mask": Image.fromarray(mask, "L"),
+        "x": x0,
+        "y": y0,
+    }
+
+
+def build_render_plan(psd, render_layers: list) -> dict:
+    """
+    Precompute the static parts of a substitution render.
+
+    Untagged layers below the first tagged layer are flattened onto the white
+    canvas (the background); every later run of untagged layers becomes a
+    plate. Tagged layers keep their composite and text style, so rendering a
+    plan no longer touches psd-tools.
+
+    Args:
+        psd: PSDImage object (for canvas size)
+        render_layers: Output of collect_render_layers()
+
+    Returns:
+        dict with width, height, background (RGBA image) and steps, a list of
+        {"kind": "plate", image, mask, x, y} and
+        {"kind": "dynamic", path, semantic_tag, comp, x, y, text_style} dicts
+    """
+    width, height = psd.width, psd.height
+
+    # Start with blank canvas
+    background = Image.new("RGBA", (width, height), (255, 255, 255, 255))
+    steps = []
+    run = []
+
+    def close_run():
+        if run:
+            plate = _flatten_plate(run, width, height)
+            if plate:
+                steps.append({"kind": "plate", **plate})
+            run.clear()
+
+    for entry in render_layers:
+        layer = entry["layer"]
+        comp = get_layer_composite(layer)
+        if not comp:
+            continue
+
+        if entry["semantic_tag"]:
+            close_run()
+            steps.append({
+                "kind": "dynamic",
+                "path": entry["path"],
+                "semantic_tag": entry["semantic_tag"],
+                "comp": comp,
+                "x": layer.left,
+                "y": layer.top,
+                "text_style": extract_text_style(layer) if entry["semantic_tag"] in TEXT_TAGS else None,
+            })
+        elif not steps:
+            # Bottom run: paste straight onto the canvas (exact)
+            background.paste(comp, (layer.left, layer.top), comp)
+        else:
+            run.append((comp, layer.left, layer.top))
+
+    close_run()
+
+    plate_count = sum(1 for step in steps if step["kind"] == "plate")
+    print(f"[PLATES] Built plan: {len(render_layers)} layers -> background + {plate_count} plates + {len(steps) - plate_count} dynamic layers")
+
+    return {"width": width, "height": height, "background": background, "steps": steps}
+
+
+def render_plan(plan: dict, sub_data: dict) -> Image.Image:
+    """
+    Render a substitution from a render plan.
+
+    Args:
+        plan: Output of build_render_plan()
+        sub_data: Substitution data keyed by semantic tag
+
+    Returns:
+        PIL Image (RGBA) of the full document size
+    """
+    canvas = plan["background"].copy()
+
+    for step in plan["steps"]:
+        if step["kind"] == "plate":
+            canvas.paste(step["image"], (step["x"], step["y"]), step["mask"])
+            continue
+
+        comp = step["comp"]
+        semantic_tag = step["semantic_tag"]
+
+        # Apply substitution if data exists for the tag
+        if sub_data:
+            value = sub_data.get(semantic_tag)
+            print(f"[SUBST] Layer '{step['path']}' has tag '{semantic_tag}', value exists: {value is not None}")
+            if value:
+                comp = substitute_layer(step["path"], comp, semantic_tag, value, step["text_style"])
+
+        # Paste onto canvas
+        canvas.paste(comp, (step["x"], step["y"]), comp)
+
+    return canvas
+
+
+def _plan_size(plan: dict) -> int:
+    """Approximate memory held by a render plan in bytes."""
+    size = plan["width"] * plan["height"] * 4
+    for step in plan["steps"]:
+        if step["kind"] == "plate":
+            size += step["image"].width * step["image"].height * 5
+        else:
+            size += step["comp"].width * step["comp"].height * 4
+    return size
+
+
+class RenderPlanCache:
+    """
+    Thread-safe LRU cache of render plans with a memory budget.
+
+    Keys are (psd hash, variant path, tag set) tuples; see plan_cache_key().
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._plans = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key) -> dict | None:
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+            return plan
+
+    def put(self, key, plan: dict):
+        size = _plan_size(plan)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._plans:
+                self._total -= self._sizes.pop(key)
+                del self._plans[key]
+
+            self._plans[key] = plan
+            self._sizes[key] = size
+            self._total += size
+
+            # Evict least recently used plans over budget
+            while self._total > self.max_bytes and self._plans:
+                old_key, _ = self._plans.popitem(last=False)
+                self._total -= self._sizes.pop(old_key)
+                print(f"[PLATES] Evicted render plan {old_key[0][:12]}:{old_key[1]}")
+
+
+def plan_cache_key(psd_hash: str, variant_path: str, tags: dict) -> tuple:
+    """Build the render plan cache key for a document variant and tag set."""
+    tag_set = tuple(sorted(
+        (path, info.get('semantic_tag') if isinstance(info, dict) else info)
+        for path, info in tags.items()
+    ))
+    return psd_hash, variant_path or "", tag_set
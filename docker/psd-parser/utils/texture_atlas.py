@@ -0,0 +1,146 @@
+"""
+Texture atlases for small /parse assets.
+
+With ``?atlas=1`` small rasters (icons, bullets, masks - longest side up to
+ATLAS_MAX_ASSET_SIZE) are not encoded one by one. They are packed into a few
+sheets instead, and their asset entries reference a rectangle of a sheet:
+
+    {"id": "img_4", "width": 32, "height": 32,
+     "atlas": {"id": "atlas_0", "x": 130, "y": 0, "width": 32, "height": 32}}
+
+The sheets are returned once, in the response's "atlases" list. Packing is
+online shelf packing (a rectangle is placed as soon as the asset is encoded),
+with a transparent gutter between rectangles so scaled drawing does not bleed
+into neighbours. Color images and masks go to separate RGBA and L sheets.
+
+The atlas is request-scoped (a context variable set around layer mapping),
+like the asset pyramid.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from PIL import Image
+
+
+ATLAS_SHEET_SIZE = 2048
+ATLAS_MAX_ASSET_SIZE = 256
+ATLAS_PADDING = 2
+SHELF_FILL_RATIO = 0.7  # Items shorter than this share of a shelf open a new shelf
+
+_current_atlas = contextvars.ContextVar("texture_atlas", default=None)
+
+
+class _Sheet:
+    def __init__(self, sheet_id: str, mode: str):
+        self.id = sheet_id
+        self.mode = mode
+        self.shelves = []  # [y, height, next_x]
+        self.next_y = 0
+        self.items = []  # (image, x, y)
+
+    def place(self, width: int, height: int) -> tuple | None:
+        """Reserve a width x height rectangle (plus gutter); returns (x, y) or None if full."""
+        w, h = width + ATLAS_PADDING, height + ATLAS_PADDING
+
+        for shelf in self.shelves:
+            y, shelf_height, x = shelf
+            if h <= shelf_height and h >= shelf_height * SHELF_FILL_RATIO and x + w <= ATLAS_SHEET_SIZE:
+                shelf[2] += w
+                return x, y
+
+        if self.next_y + h > ATLAS_SHEET_SIZE:
+            # No room for a new shelf: take any shelf the item fits in
+            for shelf in self.shelves:
+                y, shelf_height, x = shelf
+                if h <= shelf_height and x + w <= ATLAS_SHEET_SIZE:
+                    shelf[2] += w
+                    return x, y
+            return None
+        self.shelves.append([self.next_y, h, w])
+        self.next_y += h
+        return 0, self.shelves[-1][0]
+
+    def render(self) -> Image.Image:
+        width = max(x + image.width for image, x, _ in self.items)
+        height = max(y + image.height for image, _, y in self.items)
+        sheet = Image.new(self.mode, (width, height), 0)
+        for image, x, y in self.items:
+            sheet.paste(image, (x, y))
+        return sheet
+
+
+class AtlasBuilder:
+    """Packs small images of one request into atlas sheets."""
+
+    def __init__(self):
+        self.sheets = []
+        self._open = {}  # mode -> sheet being filled
+
+    def add(self, image: Image.Image) -> dict | None:
+        """
+        Place an image in a sheet.
+
+        Returns:
+            Atlas reference {id, x, y, width, height}, or None if the image is
+            too large for the atlas
+        """
+        if max(image.size) > ATLAS_MAX_ASSET_SIZE:
+            return None
+
+        mode = "L" if image.mode == "L" else "RGBA"
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        sheet = self._open.get(mode)
+        position = sheet.place(image.width, image.height) if sheet else None
+        if position is None:
+            sheet = _Sheet(f"atlas_{len(self.sheets)}", mode)
+            self.sheets.append(sheet)
+            self._open[mode] = sheet
+            position = sheet.place(image.width, image.height)
+
+        x, y = position
+        sheet.items.append((image, x, y))
+        return {"id": sheet.id, "x": x, "y": y, "width": image.width, "height": image.height}
+
+    def finish(self, encode) -> list:
+        """
+        Render and encode all sheets.
+
+        Args:
+            encode: Callable turning a PIL image into an asset dict (data, mime_type, width, height)
+
+        Returns:
+            List of sheet assets with id and item count
+        """
+        atlases = []
+        for sheet in self.sheets:
+            atlases.append({"id": sheet.id, "items": len(sheet.items), **encode(sheet.render())})
+            sheet.items.clear()
+
+        if atlases:
+            packed = sum(atlas["items"] for atlas in atlases)
+            print(f"[ATLAS] Packed {packed} assets into {len(atlases)} sheets")
+        return atlases
+
+
+@contextmanager
+def texture_atlas(enabled: bool = True):
+    """Pack small assets encoded inside the block into an AtlasBuilder (yields None when disabled)."""
+    atlas = AtlasBuilder() if enabled else None
+    token = _current_atlas.set(atlas)
+    try:
+        yield atlas
+    finally:
+        _current_atlas.reset(token)
+
+
+def add_to_atlas(image: Image.Image) -> dict | None:
+    """Atlas reference for ``image`` if an atlas is active and the image is small enough."""
+    atlas = _current_atlas.get()
+    return atlas.add(image) if atlas is not None else None
+
+
+def crop_atlas_asset(sheet: Image.Image, ref: dict) -> Image.Image:
+    """Cut an asset out of its decoded atlas sheet."""
+    return sheet.crop((ref["x"], ref["y"], ref["x"] + ref["width"], ref["y"] + ref["height"]))
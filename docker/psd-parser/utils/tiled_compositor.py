@@ -0,0 +1,183 @@
+"""
+Tiled, memory-bounded compositing for large documents and layers.
+
+psd-tools composites in float arrays: a whole-document composite peaks at
+roughly 110 bytes per pixel, so a 12k x 8k print template needs ~10 GB.
+Compositing the same target through fixed-size viewports produces identical
+pixels while the working set is bounded by the tile area; every tile is
+reduced to the output scale as soon as it is rendered.
+
+The ceiling is configured with COMPOSITE_MEMORY_MB (default 1024).
+"""
+
+import math
+import os
+from PIL import Image
+from psd_tools.constants import Tag
+
+from .image_extractor import downscale_image
+
+
+# Peak bytes per composited pixel inside psd-tools (measured, float64 stacks)
+COMPOSITE_BYTES_PER_PIXEL = 112
+COMPOSITE_MEMORY_LIMIT = int(os.environ.get("COMPOSITE_MEMORY_MB", 1024)) * 1024 * 1024
+MIN_TILE_SIZE = 512
+
+
+def estimate_composite_bytes(width: int, height: int) -> int:
+    """Estimate the peak memory of compositing a width x height area at once."""
+    return width * height * COMPOSITE_BYTES_PER_PIXEL
+
+
+def fits_in_memory(width: int, height: int, max_bytes: int | None = None) -> bool:
+    """Check whether an area can be composited in a single pass."""
+    return estimate_composite_bytes(width, height) <= (max_bytes or COMPOSITE_MEMORY_LIMIT)
+
+
+def tile_size_for(max_bytes: int | None = None) -> int:
+    """Side length of square tiles that fit the memory ceiling."""
+    pixels = (max_bytes or COMPOSITE_MEMORY_LIMIT) // COMPOSITE_BYTES_PER_PIXEL
+    return max(MIN_TILE_SIZE, int(math.sqrt(pixels)) // 64 * 64)
+
+
+def composite_tiled(target, bbox: tuple, scale: float = 1.0, max_bytes: int | None = None) -> Image.Image | None:
+    """
+    Composite ``bbox`` of a PSDImage or layer tile by tile into a scaled image.
+
+    Args:
+        target: PSDImage or psd-tools layer
+        bbox: (left, top, right, bottom) area to composite, in document coordinates
+        scale: Output scale factor (<= 1.0)
+        max_bytes: Memory ceiling for a single tile (default COMPOSITE_MEMORY_LIMIT)
+
+    Returns:
+        PIL Image (RGBA) of size bbox * scale, or None if nothing was composited
+    """
+    left, top, right, bottom = bbox
+    out_width = max(1, round((right - left) * scale))
+    out_height = max(1, round((bottom - top) * scale))
+    tile = tile_size_for(max_bytes)
+
+    # Tiles are laid out in output pixels; each one composites its source area
+    # plus a margin covering the resampling filter, so tiles join seamlessly
+    out_tile = max(1, int(tile * scale))
+    step = (right - left) / out_width, (bottom - top) / out_height
+    margin = 0 if scale >= 1.0 else math.ceil(3 * max(step))  # LANCZOS support
+
+    # PSDImage.composite() returns the embedded merged image unless told not to
+    kwargs = {"ignore_preview": True} if getattr(target, "kind", None) == "psdimage" else {}
+
+    output = None
+    tiles = 0
+    for oy0 in range(0, out_height, out_tile):
+        oy1 = min(oy0 + out_tile, out_height)
+        for ox0 in range(0, out_width, out_tile):
+            ox1 = min(ox0 + out_tile, out_width)
+
+            # Exact source area of this output tile, and the composited viewport around it
+            sx0, sx1 = left + ox0 * step[0], left + ox1 * step[0]
+            sy0, sy1 = top + oy0 * step[1], top + oy1 * step[1]
+            viewport = (
+                max(left, math.floor(sx0) - margin),
+                max(top, math.floor(sy0) - margin),
+                min(right, math.ceil(sx1) + margin),
+                min(bottom, math.ceil(sy1) + margin),
+            )
+
+            part = target.composite(viewport=viewport, **kwargs)
+            if part is None:
+                continue
+            tiles += 1
+
+            part = part.convert("RGBA")
+            if part.size != (ox1 - ox0, oy1 - oy0):
+                box = (sx0 - viewport[0], sy0 - viewport[1], sx1 - viewport[0], sy1 - viewport[1])
+                part = part.resize((ox1 - ox0, oy1 - oy0), Image.LANCZOS, box=box)
+
+            if output is None:
+                output = Image.new("RGBA", (out_width, out_height), (0, 0, 0, 0))
+            output.paste(part, (ox0, oy0))
+
+    print(f"[TILES] Composited {right - left}x{bottom - top} in {tiles} tiles of {tile}px -> {out_width}x{out_height}")
+    return output
+
+
+def composite_document(psd, size: tuple | None = None) -> Image.Image | None:
+    """
+    Composite the whole document, tiled when it exceeds the memory ceiling.
+
+    Args:
+        psd: PSDImage
+        size: Optional target (width, height); defaults to the document size
+
+    Returns:
+        PIL Image of the requested size
+    """
+    scale = min(1.0, size[0] / psd.width, size[1] / psd.height) if size else 1.0
+
+    if fits_in_memory(psd.width, psd.height):
+        image = psd.composite(ignore_preview=True)
+        return downscale_image(image, size) if image is not None and size else image
+
+    return composite_tiled(psd, (0, 0, psd.width, psd.height), scale)
+
+
+def is_plain_pixel_layer(layer, allow_mask: bool = False) -> bool:
+    """
+    Pixel layer whose composite equals its raw pixels times opacity and fill opacity.
+
+    Args:
+        layer: psd-tools layer
+        allow_mask: Also accept an enabled raster mask (for callers that apply it themselves)
+    """
+    from .image_extractor import has_layer_effects
+
+    if getattr(layer, "kind", None) != "pixel" or has_layer_effects(layer):
+        return False
+    if getattr(layer, "has_vector_mask", None) and layer.has_vector_mask():
+        return False
+    if layer.has_clip_layers():
+        return False
+    if not allow_mask and layer.has_mask() and not layer.mask.disabled:
+        return False
+    blend_mode = str(getattr(layer, "blend_mode", "")).upper()
+    return "NORMAL" in blend_mode or "PASS_THROUGH" in blend_mode
+
+
+def composite_layer(layer, max_dimension: int | None = None) -> Image.Image | None:
+    """
+    Composite a layer without exceeding the memory ceiling.
+
+    Layers that fit are composited as before (layer.composite()). Larger plain
+    pixel layers (see is_plain_pixel_layer: no mask, no clipped layers) are
+    decoded as uint8 pixels with opacity and fill opacity applied; anything
+    else is composited in tiles straight to the asset size (max_dimension).
+
+    Args:
+        layer: psd-tools layer
+        max_dimension: Longest side of the result, or None for the full layer size
+
+    Returns:
+        PIL Image, or None if the layer has no pixels
+    """
+    width, height = layer.width, layer.height
+    if fits_in_memory(width, height):
+        return layer.composite()
+
+    scale = min(1.0, max_dimension / max(width, height, 1)) if max_dimension else 1.0
+
+    if is_plain_pixel_layer(layer):
+        image = layer.topil()
+        if image is None:
+            return None
+        image = image.convert("RGBA")
+        if scale < 1.0:
+            image = downscale_image(image, (max(1, round(width * scale)), max(1, round(height * scale))))
+        opacity = layer.opacity * layer.tagged_blocks.get_data(Tag.BLEND_FILL_OPACITY, 255) // 255
+        if opacity < 255:
+            alpha = image.getchannel("A").point(lambda v: v * opacity // 255)
+            image.putalpha(alpha)
+        print(f"[TILES] Decoded large pixel layer '{layer.name}' ({width}x{height}) without compositing")
+        return image
+
+    return composite_tiled(layer, layer.bbox, scale)
@@ -0,0 +1,219 @@
+"""
+Worker warm-up for psd-parser.
+
+The first request of a fresh worker used to pay for everything that is set
+up lazily: scikit-image/scipy imports, numpy's first-call dispatch, psd-tools'
+decoders, PIL's PNG encoder and font loading. warm_up() runs a tiny synthetic
+PSD through /parse, /analyze and /render with the Flask test client, so this
+cost is paid once at startup instead. It also checks that a clipping group
+over the memory ceiling (tiled psd-tools path) composites like psd-tools does.
+
+With gunicorn --preload the warm-up runs in the master process and workers
+fork with the warmed modules already in (shared) memory. /health reports
+"warming" (503) until warm-up has finished.
+
+Threads don't survive fork, so under gunicorn a background warm-up is not
+started at import (which --preload runs in the master) but by the first
+request each worker handles (/health included).
+"""
+
+import gc
+import io
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+from psd_tools.compression import compress
+from psd_tools.constants import Compression
+
+
+WARMUP_SIZE = 64
+
+_status = {"ready": False, "duration_s": None, "error": None}
+# App of a background warm-up and the process it was started in
+_background = {"app": None, "pid": None}
+_background_lock = threading.Lock()
+
+
+def _channel_data(channel: np.ndarray) -> bytes:
+    height, width = channel.shape
+    data = compress(channel.astype(np.uint8).tobytes(), Compression.RLE, width, height, 8)
+    return struct.pack(">H", Compression.RLE) + data
+
+
+def _layer_record(name: str, bbox: tuple, channels: dict, clipping: bool = False, divider: int | None = None) -> tuple:
+    """Layer record bytes and channel image data of one layer."""
+    top, left, bottom, right = bbox
+    channel_data = {channel_id: _channel_data(pixels) for channel_id, pixels in channels.items()}
+
+    name_bytes = name.encode("ascii")
+    pascal_name = bytes([len(name_bytes)]) + name_bytes
+    pascal_name += b"\x00" * (-len(pascal_name) % 4)
+    extra = struct.pack(">II", 0, 0) + pascal_name  # No mask, no blending ranges
+    if divider is not None:
+        extra += b"8BIMlsct" + struct.pack(">II", 4, divider)
+
+    record = struct.pack(">4iH", top, left, bottom, right, len(channel_data))
+    for channel_id, data in channel_data.items():
+        record += struct.pack(">hI", channel_id, len(data))
+    record += b"8BIMnorm" + struct.pack(">4B", 255, int(clipping), 0x08, 0)
+    record += struct.pack(">I", len(extra)) + extra
+    return record, b"".join(channel_data.values())
+
+
+def build_warmup_psd(size: int = WARMUP_SIZE) -> bytes:
+    """
+    Build a small RGB PSD exercising the main /parse paths.
+
+    Layers: a background, and a group with a circular clipping base and a
+    clipped layer (alpha contour, clipping compositor, RLE decoding).
+
+    Returns:
+        PSD file bytes
+    """
+    full = (0, 0, size, size)
+    yy, xx = np.mgrid[:size, :size]
+    circle = np.where((yy - size / 2) ** 2 + (xx - size / 2) ** 2 < (size * 0.4) ** 2, 255, 0)
+    gradient = (xx * 255 // max(1, size - 1)).astype(np.uint8)
+    empty = np.zeros((0, 0), np.uint8)
+
+    def rgba(r, g, b, alpha=255):
+        return {0: np.full((size, size), r), 1: np.full((size, size), g), 2: np.full((size, size), b),
+                -1: np.broadcast_to(alpha, (size, size))}
+
+    # Bottom to top; the group is opened by its bounding divider and closed by its folder record
+    layers = [
+        _layer_record("Background", full, rgba(240, 240, 240)),
+        _layer_record("</Layer group>", (0, 0, 0, 0), {channel: empty for channel in (-1, 0, 1, 2)}, divider=3),
+        _layer_record("frame", full, rgba(20, 160, 20, circle)),
+        _layer_record("photo", full, {**rgba(200, 40, 40), 1: gradient}, clipping=True),
+        _layer_record("group", (0, 0, 0, 0), {channel: empty for channel in (-1, 0, 1, 2)}, divider=1),
+    ]
+    layer_info = struct.pack(">h", len(layers))
+    layer_info += b"".join(record for record, _ in layers) + b"".join(data for _, data in layers)
+    layer_info += b"\x00" * (len(layer_info) % 2)
+    layer_and_mask = struct.pack(">I", len(layer_info)) + layer_info + struct.pack(">I", 0)
+
+    # Merged image: raw, planar RGB
+    merged = struct.pack(">H", Compression.RAW) + np.full((3, size, size), 240, np.uint8).tobytes()
+
+    return b"".join([
+        b"8BPS", struct.pack(">H", 1), b"\x00" * 6,
+        struct.pack(">HIIHH", 3, size, size, 8, 3),  # 3 channels, 8-bit RGB
+        struct.pack(">I", 0),  # Color mode data
+        struct.pack(">I", 0),  # Image resources
+        struct.pack(">I", len(layer_and_mask)), layer_and_mask,
+        merged,
+    ])
+
+
+def _check_oversized_clipping_group(psd_bytes: bytes):
+    """Composite the clipping group as if it exceeded COMPOSITE_MEMORY_MB and compare with psd-tools."""
+    from psd_tools import PSDImage
+    from .clipping_compositor import composite_clipping_group
+
+    psd = PSDImage.open(io.BytesIO(psd_bytes))
+    base = next(layer for layer in psd.descendants() if layer.has_clip_layers())
+    expected = np.asarray(base.composite().convert("RGBA"), np.int16)
+    tiled = np.asarray(composite_clipping_group(base, max_bytes=1), np.int16)
+    if tiled.shape != expected.shape or np.abs(tiled - expected).max() > 1:
+        raise RuntimeError(f"Oversized clipping group '{base.name}' differs from its psd-tools composite")
+
+
+def _warm_up_requests(app):
+    psd_bytes = build_warmup_psd()
+    client = app.test_client()
+
+    def upload(path: str):
+        response = client.post(path, data={"file": (io.BytesIO(psd_bytes), "warmup.psd")})
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return response
+
+    parsed = upload("/parse").get_json()
+    upload("/analyze")
+
+    # A text layer loads the preview font
+    parsed["layers"].append({
+        "type": "text", "x": 0, "y": 0, "width": WARMUP_SIZE, "height": 16,
+        "properties": {"text": "Warm-up", "fontSize": 12},
+    })
+    response = client.post("/render", json=parsed)
+    if response.status_code != 200:
+        raise RuntimeError(f"/render returned {response.status_code}")
+
+    _check_oversized_clipping_group(psd_bytes)
+
+
+def warm_up(app) -> dict:
+    """
+    Run the synthetic PSD through the pipeline and mark the worker ready.
+
+    A failed warm-up is logged but still marks the worker ready: requests
+    then pay the warm-up cost themselves, as before.
+
+    Args:
+        app: Flask application
+
+    Returns:
+        Warm-up status (see warm_up_status)
+    """
+    start = time.perf_counter()
+    try:
+        _warm_up_requests(app)
+    except Exception as e:
+        _status["error"] = str(e)
+        print(f"[WARMUP] Failed: {e}")
+
+    _status["duration_s"] = round(time.perf_counter() - start, 3)
+    _status["ready"] = True
+    print(f"[WARMUP] Finished in {_status['duration_s']:.2f}s")
+    return warm_up_status()
+
+
+def start_warm_up(app, mode: str = "sync"):
+    """
+    Start the warm-up.
+
+    Args:
+        app: Flask application
+        mode: "sync" (block until warm, e.g. in the gunicorn master with --preload),
+            "background" (thread in every worker; /health reports warming meanwhile)
+            or "off"
+    """
+    if mode == "off":
+        _status["ready"] = True
+        return
+
+    if mode == "background":
+        _background["app"] = app
+        app.before_request(start_background_warm_up)
+        # SERVER_SOFTWARE is set by the gunicorn arbiter before it loads the app
+        if not os.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn/"):
+            start_background_warm_up()
+        return
+
+    warm_up(app)
+    # Keep the warmed objects out of later collections, so forked workers
+    # don't touch (and copy) the pages they share with the master
+    gc.collect()
+    gc.freeze()
+
+
+def start_background_warm_up():
+    """Start the background warm-up thread in this process, unless it already runs or ran."""
+    if _background["app"] is None or _status["ready"] or _background["pid"] == os.getpid():
+        return
+
+    with _background_lock:
+        if _background["pid"] == os.getpid():
+            return
+        _background["pid"] = os.getpid()
+    threading.Thread(target=warm_up, args=(_background["app"],), name="warmup", daemon=True).start()
+
+
+def warm_up_status() -> dict:
+    """Copy of the warm-up status: ready, duration_s, error."""
+    return dict(_status)
@@ -0,0 +1 @@
+# transcriber benchmarks
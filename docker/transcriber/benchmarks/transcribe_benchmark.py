@@ -0,0 +1,201 @@
+"""
+Sequential, batched and parallel transcription benchmark.
+
+Transcribes every audio/video file of a corpus with the sequential decoder,
+with the batched pipeline (one run per batch size) and optionally in
+parallel mode (process pool), through the same code path as /transcribe,
+and reports per run:
+
+    seconds     wall time (audio decoding included)
+    rtf         real-time factor: seconds / audio duration (lower is faster)
+    wer         word error rate against <name>.txt next to the file, if present
+    wer_vs_seq  word error rate of a batched/parallel run against the sequential output
+    timing_ms   median |start difference| of the words both runs agree on
+    backwards   words starting before the previous word (timeline errors)
+
+Usage (from docker/transcriber):
+    python -m benchmarks.transcribe_benchmark <files or directories>
+        [--batch-size 8 --batch-size 16] [--parallel] [--language pl] [--json results.json]
+
+The model is configured by the service's environment (WHISPER_MODEL,
+WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, WHISPER_CPU_THREADS, ...).
+"""
+
+import argparse
+import difflib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+os.environ.setdefault("MODEL_LOAD", "lazy")  # Warm up below, outside the timed runs
+
+import numpy as np
+
+import server
+
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".mp4", ".mkv", ".mov", ".webm")
+
+
+def iter_audio_files(paths: list):
+    """Audio/video files of the given paths (directories are walked, sorted)."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    if name.lower().endswith(AUDIO_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def normalize_words(text: str) -> list:
+    """Lowercased words without punctuation (what WER is computed on)."""
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: list, hypothesis: list) -> float:
+    """
+    Word-level Levenshtein distance divided by the reference length.
+
+    Rows of the edit-distance matrix are computed with numpy (insertions via
+    a running minimum), so hour-long transcripts compare in seconds.
+    """
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+
+    vocabulary = {word: index for index, word in enumerate(set(reference) | set(hypothesis))}
+    hyp = np.array([vocabulary[word] for word in hypothesis], dtype=np.int64)
+    offsets = np.arange(len(hypothesis) + 1)
+    row = offsets.copy()
+    for word in reference:
+        substitution = row[:-1] + (hyp != vocabulary[word])
+        current = np.empty_like(row)
+        current[0] = row[0] + 1
+        current[1:] = np.minimum(row[1:] + 1, substitution)
+        row = np.minimum.accumulate(current - offsets) + offsets
+    return float(row[-1]) / len(reference)
+
+
+def _words(segments: list) -> list:
+    """(normalized word, start) of every word of a transcription."""
+    words = []
+    for segment in segments:
+        for word in segment.get("words", []):
+            words.extend((token, word["start"]) for token in normalize_words(word["word"]))
+    return words
+
+
+def timing_difference_ms(words: list, baseline_words: list) -> float | None:
+    """Median start-time difference of the words matched between two transcriptions."""
+    matcher = difflib.SequenceMatcher(None, [w for w, _ in baseline_words], [w for w, _ in words], autojunk=False)
+    differences = [
+        abs(words[block.b + k][1] - baseline_words[block.a + k][1])
+        for block in matcher.get_matching_blocks()
+        for k in range(block.size)
+    ]
+    return round(statistics.median(differences) * 1000, 1) if differences else None
+
+
+def _backwards_words(words: list) -> int:
+    return sum(1 for (_, previous), (_, current) in zip(words, words[1:]) if current < previous)
+
+
+def run(path: str, mode: str, batch_size: int, language: str | None) -> dict:
+    """Transcribe a file once; returns the timing and the transcription."""
+    options = {"language": language, "word_timestamps": True, "mode": mode, "batch_size": batch_size}
+    start = time.perf_counter()
+    segments_iter, info = server._start_transcription(path, options)
+    segments = list(segments_iter)
+    seconds = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "batch_size": batch_size if mode == "batched" else None,
+        "seconds": round(seconds, 2),
+        "duration": round(info.duration, 2),
+        "rtf": round(seconds / info.duration, 4) if info.duration else None,
+        "language": info.language,
+        "segments": segments,
+    }
+
+
+def benchmark_file(path: str, batch_sizes: list, language: str | None, parallel: bool = False) -> dict:
+    """
+    Run the sequential decoder, the batched pipeline and the parallel mode on one file.
+
+    Returns:
+        dict with the file, its duration and a list of runs (mode,
+        batch_size, seconds, rtf, wer, wer_vs_seq, timing_ms, backwards)
+    """
+    reference_path = os.path.splitext(path)[0] + ".txt"
+    reference = None
+    if os.path.exists(reference_path):
+        with open(reference_path, encoding="utf-8") as f:
+            reference = normalize_words(f.read())
+
+    runs = [run(path, "sequential", 0, language)]
+    runs += [run(path, "batched", batch_size, language) for batch_size in batch_sizes]
+    if parallel:
+        runs.append(run(path, "parallel", 0, language))
+
+    sequential_words = _words(runs[0]["segments"])
+    for entry in runs:
+        words = _words(entry.pop("segments"))
+        hypothesis = [word for word, _ in words]
+        entry["wer"] = round(word_error_rate(reference, hypothesis), 4) if reference is not None else None
+        entry["backwards"] = _backwards_words(words)
+        if entry["mode"] != "sequential":
+            entry["wer_vs_seq"] = round(word_error_rate([w for w, _ in sequential_words], hypothesis), 4)
+            entry["timing_ms"] = timing_difference_ms(words, sequential_words)
+        else:
+            entry["wer_vs_seq"] = entry["timing_ms"] = None
+        entry["words"] = len(words)
+
+    return {"file": path, "duration": runs[0]["duration"], "has_reference": reference is not None, "runs": runs}
+
+
+def _format_metric(value, digits: int) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_report(results: list):
+    print(f"{'file':<32} {'mode':<12} {'audio s':>8} {'time s':>8} {'RTF':>7} {'speedup':>7} "
+          f"{'WER':>6} {'WER/seq':>7} {'timing ms':>9} {'backwards':>9}")
+    for result in results:
+        name = os.path.basename(result["file"])[:32]
+        sequential_seconds = result["runs"][0]["seconds"]
+        for entry in result["runs"]:
+            mode = entry["mode"] if entry["batch_size"] is None else f"batched/{entry['batch_size']}"
+            speedup = sequential_seconds / entry["seconds"] if entry["seconds"] else None
+            print(f"{name:<32} {mode:<12} {entry['duration']:>8.1f} {entry['seconds']:>8.2f} "
+                  f"{_format_metric(entry['rtf'], 3):>7} {_format_metric(speedup, 2):>7} "
+                  f"{_format_metric(entry['wer'], 3):>6} {_format_metric(entry['wer_vs_seq'], 3):>7} "
+                  f"{_format_metric(entry['timing_ms'], 1):>9} {entry['backwards']:>9}")
+
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(description="Compare sequential, batched and parallel transcription speed and accuracy.")
+    parser.add_argument("paths", nargs="+", help="Audio/video files or directories (reference transcript: <name>.txt)")
+    parser.add_argument("--batch-size", type=int, action="append", help="Batched run(s) (default: WHISPER_BATCH_SIZE)")
+    parser.add_argument("--parallel", action="store_true", help="Also run the parallel (process pool) mode")
+    parser.add_argument("--language", help="Source language (auto-detect if omitted)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args(argv)
+
+    server.warm_up_model()
+
+    results = [benchmark_file(path, args.batch_size or [server.BATCH_SIZE], args.language, args.parallel)
+               for path in iter_audio_files(args.paths)]
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,220 @@
+"""
+Chunked transcription of long recordings on a process pool.
+
+A single transcription decodes its windows one after another, so it can't
+use a large host on its own. In "parallel" mode the audio is cut at
+silences (VAD) into chunks that a pool of worker processes transcribes
+side by side, each with its own model and a bounded number of threads.
+The language is detected once up front and pinned for every chunk.
+
+Neighbouring chunks overlap by a short margin, so a word cut by an
+imprecise VAD boundary is still transcribed whole by one of them. After
+offset correction each word is kept only by the chunk whose own range
+contains its midpoint, which removes the duplicates at the seams.
+
+Worker processes are spawned and import only this module (never server.py),
+so they neither inherit the parent's model nor start its warm-up.
+"""
+
+from typing import NamedTuple
+
+SAMPLE_RATE = 16000
+
+_worker = {"model": None}
+
+
+class ChunkedInfo(NamedTuple):
+    """Language and duration of a chunked transcription (like faster-whisper's TranscriptionInfo)."""
+
+    language: str
+    language_probability: float
+    duration: float
+
+
+def segment_data(segment, word_timestamps: bool, offset: float = 0.0, raw_words: bool = False) -> dict:
+    """
+    JSON form of a faster-whisper segment (with word timestamps).
+
+    Args:
+        segment: faster-whisper Segment
+        word_timestamps: Include the segment's words
+        offset: Seconds added to every timestamp (start of the chunk)
+        raw_words: Keep the decoder's word tokens unstripped (leading space
+            or not), so segment text can be rebuilt from them
+
+    Returns:
+        dict with id, start, end, text and words
+    """
+    seg_data = {
+        "id": segment.id,
+        "start": round(segment.start + offset, 3),
+        "end": round(segment.end + offset, 3),
+        "text": segment.text.strip(),
+    }
+
+    if word_timestamps and segment.words:
+        seg_data["words"] = [
+            {
+                "word": word.word if raw_words else word.word.strip(),
+                "start": round(word.start + offset, 3),
+                "end": round(word.end + offset, 3),
+                "probability": round(word.probability, 3),
+            }
+            for word in segment.words
+        ]
+
+    return seg_data
+
+
+def init_worker(model_size: str, device: str, compute_type: str, cpu_threads: int, model_dir: str | None):
+    """Load the model of a pool process (ProcessPoolExecutor initializer)."""
+    from faster_whisper import WhisperModel
+
+    _worker["model"] = WhisperModel(
+        model_size,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=1,
+        download_root=model_dir,
+    )
+
+
+def transcribe_chunk(audio, offset: float, options: dict, vad_parameters: dict) -> list:
+    """
+    Transcribe one chunk in a pool process.
+
+    Args:
+        audio: 16 kHz mono float32 samples of the chunk
+        offset: Start of the chunk in the recording (seconds)
+        options: language (pinned) and word_timestamps
+        vad_parameters: Silero VAD parameters
+
+    Returns:
+        Segment data with timestamps of the whole recording and raw word
+        tokens (see merge_chunk)
+    """
+    segments, _ = _worker["model"].transcribe(
+        audio,
+        language=options["language"],
+        word_timestamps=options["word_timestamps"],
+        vad_filter=True,
+        vad_parameters=dict(vad_parameters),
+    )
+    return [segment_data(segment, options["word_timestamps"], offset, raw_words=True) for segment in segments]
+
+
+def plan_chunks(speech: list, total_samples: int, count: int, overlap_samples: int) -> list:
+    """
+    Cut a recording into chunks at silences.
+
+    Each cut is placed in the middle of the speech gap closest to an even
+    split; without a usable gap (continuous speech) the even split is used.
+
+    Args:
+        speech: VAD speech spans [{start, end}] in samples
+        total_samples: Length of the recording
+        count: Number of chunks wanted
+        overlap_samples: Audio added on both sides of every seam
+
+    Returns:
+        [{start, end, own_start, own_end}] in samples: start/end is the audio
+        to transcribe, own_start/own_end the range whose words the chunk keeps
+    """
+    gaps = [(a["end"] + b["start"]) // 2 for a, b in zip(speech, speech[1:]) if b["start"] > a["end"]]
+
+    cuts = [0]
+    for k in range(1, count):
+        target = total_samples * k // count
+        candidates = [gap for gap in gaps if gap > cuts[-1]]
+        cut = min(candidates, key=lambda gap: abs(gap - target)) if candidates else target
+        if cut <= cuts[-1] or cut >= total_samples:
+            continue
+        cuts.append(cut)
+    cuts.append(total_samples)
+
+    return [
+        {
+            "start": max(0, own_start - overlap_samples),
+            "end": min(total_samples, own_end + overlap_samples),
+            "own_start": own_start,
+            "own_end": own_end,
+        }
+        for own_start, own_end in zip(cuts, cuts[1:])
+    ]
+
+
+def merge_chunk(segments: list, own_start: float, own_end: float) -> list:
+    """
+    Keep the segments and words a chunk owns.
+
+    A word (or a segment without words) belongs to the chunk whose own
+    range contains its midpoint; a segment cut at the seam keeps its own
+    words only, with times and text rebuilt from them. The text joins the
+    raw tokens as faster-whisper does (they carry their own spacing, none
+    in Chinese, Japanese or Thai); words are stripped afterwards.
+
+    Args:
+        segments: Segment data of the chunk (recording timestamps, raw word tokens)
+        own_start: Start of the chunk's own range (seconds)
+        own_end: End of the chunk's own range (seconds)
+
+    Returns:
+        Segment data of the chunk without the overlap duplicates
+    """
+    def owned(item: dict) -> bool:
+        return own_start <= (item["start"] + item["end"]) / 2 < own_end
+
+    merged = []
+    for seg_data in segments:
+        words = seg_data.get("words")
+        if not words:
+            if owned(seg_data):
+                merged.append(seg_data)
+            continue
+
+        kept = [word for word in words if owned(word)]
+        if not kept:
+            continue
+        if len(kept) < len(words):
+            seg_data = {
+                **seg_data,
+                "start": kept[0]["start"],
+                "end": kept[-1]["end"],
+                "text": "".join(word["word"] for word in kept).strip(),
+            }
+        merged.append({**seg_data, "words": [{**word, "word": word["word"].strip()} for word in kept]})
+    return merged
+
+
+def transcribe_chunked(audio, chunks: list, pool, options: dict, vad_parameters: dict):
+    """
+    Transcribe planned chunks on a process pool.
+
+    All chunks are submitted at once; segments are yielded in recording
+    order as soon as the chunks before them are done. Chunks still queued
+    are cancelled if the caller stops iterating.
+
+    Args:
+        audio: 16 kHz mono float32 samples of the recording
+        chunks: Output of plan_chunks()
+        pool: ProcessPoolExecutor initialized with init_worker
+        options: language (pinned) and word_timestamps
+        vad_parameters: Silero VAD parameters
+
+    Yields:
+        Segment data (recording timestamps, seams de-duplicated)
+    """
+    futures = [
+        pool.submit(transcribe_chunk, audio[chunk["start"]:chunk["end"]], chunk["start"] / SAMPLE_RATE,
+                    options, vad_parameters)
+        for chunk in chunks
+    ]
+    try:
+        for future, chunk in zip(futures, chunks):
+            yield from merge_chunk(
+                future.result(), chunk["own_start"] / SAMPLE_RATE, chunk["own_end"] / SAMPLE_RATE
+            )
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,25 @@
+"""
+Gunicorn settings of the transcriber.
+
+One process holds the model; request threads share it (see InferenceScheduler
+in server.py). Every admitted request - running, queued or streaming - holds a
+thread, so the thread count follows the same settings as the scheduler, plus
+spare threads that keep /health, /ready and 503 rejections responsive when
+the queue is full.
+"""
+
+import os
+
+# Same defaults as server.py
+_cpu_count = os.cpu_count() or 1
+_inference_workers = int(os.environ.get("WHISPER_NUM_WORKERS", max(1, _cpu_count // 4)))
+_queue_size = int(os.environ.get("TRANSCRIBE_QUEUE_SIZE", 4))
+
+bind = "0.0.0.0:3340"
+workers = 1
+worker_class = "gthread"
+threads = _inference_workers + _queue_size + 2
+timeout = 300
+accesslog = "-"
+errorlog = "-"
+capture_output = True
@@ -8,10 +8,21 @@ word-level timestamps suitable for caption generation.
 import os
 import io
 import tempfile
+import json
 import logging
-from flask import Flask, request, jsonify
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from contextlib import contextmanager
+import multiprocessing
+import numpy as np
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
+from chunked import SAMPLE_RATE, ChunkedInfo, init_worker, plan_chunks, segment_data, transcribe_chunked
+
 app = Flask(__name__)
 CORS(app)
 
@@ -23,24 +34,260 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Lazy-load model to save memory on startup
+# "eager": load the model and run a warm-up inference at startup (in the background,
+# /ready reports when done); "lazy": load on the first request
+MODEL_LOAD = os.environ.get("MODEL_LOAD", "eager")
+# Directory with downloaded weights (the image bakes them in at build time)
+WHISPER_MODEL_DIR = os.environ.get("WHISPER_MODEL_DIR") or None
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "base")
+WHISPER_DEVICE = os.environ.get("WHISPER_DEVICE", "cpu")
+WHISPER_COMPUTE_TYPE = os.environ.get("WHISPER_COMPUTE_TYPE", "int8")
+
+WARMUP_SAMPLE_RATE = SAMPLE_RATE
+WARMUP_SECONDS = 2
+# A failed warm-up is retried after this delay, doubling up to WARMUP_RETRY_MAX_SECONDS
+WARMUP_RETRY_SECONDS = float(os.environ.get("WARMUP_RETRY_SECONDS", 30))
+WARMUP_RETRY_MAX_SECONDS = 300
+
+# One model per process, shared by all request threads (gunicorn gthread, 1 worker).
+# num_workers transcriptions run in parallel on it, each with cpu_threads threads.
+CPU_COUNT = os.cpu_count() or 1
+INFERENCE_WORKERS = int(os.environ.get("WHISPER_NUM_WORKERS", max(1, CPU_COUNT // 4)))
+CPU_THREADS = int(os.environ.get("WHISPER_CPU_THREADS", max(1, CPU_COUNT // INFERENCE_WORKERS)))
+# Requests waiting for a free inference worker; above that /transcribe answers 503
+QUEUE_SIZE = int(os.environ.get("TRANSCRIBE_QUEUE_SIZE", 4))
+QUEUE_TIMEOUT = float(os.environ.get("TRANSCRIBE_QUEUE_TIMEOUT", 300))
+
+# "sequential": decode the file window by window; "batched": split it on speech (VAD)
+# and decode batch_size chunks per model call (faster on long recordings);
+# "parallel": cut it at silences into chunks transcribed by a process pool
+TRANSCRIBE_MODES = ("sequential", "batched", "parallel")
+TRANSCRIBE_MODE = os.environ.get("TRANSCRIBE_MODE", "sequential")
+BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", 8))
+MAX_BATCH_SIZE = int(os.environ.get("WHISPER_MAX_BATCH_SIZE", 32))
+
+# Parallel mode: PARALLEL_PROCESSES processes with their own model and PARALLEL_CPU_THREADS
+# threads each; a recording gets one chunk per PARALLEL_MIN_CHUNK_SECONDS (at most one per
+# process), shorter ones are transcribed sequentially
+PARALLEL_CPU_THREADS = int(os.environ.get("PARALLEL_CPU_THREADS", 4))
+PARALLEL_PROCESSES = int(os.environ.get("PARALLEL_PROCESSES", max(1, CPU_COUNT // PARALLEL_CPU_THREADS)))
+PARALLEL_MIN_CHUNK_SECONDS = float(os.environ.get("PARALLEL_MIN_CHUNK_SECONDS", 300))
+PARALLEL_CHUNK_OVERLAP = float(os.environ.get("PARALLEL_CHUNK_OVERLAP", 1.0))
+# The pool keeps PARALLEL_PROCESSES models resident; it is shut down after this many idle seconds
+PARALLEL_POOL_IDLE_SECONDS = float(os.environ.get("PARALLEL_POOL_IDLE_SECONDS", 600))
+# Speech used to detect the language once for all chunks
+LANGUAGE_DETECTION_SECONDS = 90
+
+VAD_PARAMETERS = dict(
+    min_silence_duration_ms=500,
+    speech_pad_ms=200,
+)
+
+
+class QueueFull(Exception):
+    """The inference queue is full (or the wait timed out)."""
+
+
+class InferenceScheduler:
+    """
+    Admission control for the shared model.
+
+    The model has ``workers`` inference slots. A request takes one slot, a
+    parallel request takes all of them (its process pool uses every core).
+    At most ``workers`` requests run at once and up to ``queue_size`` more
+    wait for their slots in arrival order; further requests are rejected
+    instead of piling up in the worker.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self.running = 0
+        self.slots_in_use = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._queue)
+
+    def acquire(self, slots: int = 1):
+        """Wait for inference slots. Raises QueueFull when saturated."""
+        slots = min(slots, self.workers)
+        with self._condition:
+            if self.running + self.waiting >= self.workers + self.queue_size:
+                raise QueueFull(f"{self.running} running, {self.waiting} queued")
+
+            ticket = object()
+            self._queue.append(ticket)
+            try:
+                acquired = self._condition.wait_for(
+                    lambda: self._queue[0] is ticket and self.slots_in_use + slots <= self.workers,
+                    timeout=self.timeout,
+                )
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+            if not acquired:
+                raise QueueFull(f"No inference slot within {self.timeout:.0f}s")
+
+            self.running += 1
+            self.slots_in_use += slots
+
+    def release(self, slots: int = 1):
+        with self._condition:
+            self.running -= 1
+            self.slots_in_use -= min(slots, self.workers)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, slots: int = 1):
+        """Hold inference slots for the block. Raises QueueFull when saturated."""
+        self.acquire(slots)
+        try:
+            yield
+        finally:
+            self.release(slots)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "running": self.running,
+                "waiting": self.waiting,
+                "slots_in_use": self.slots_in_use,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+            }
+
+
+scheduler = InferenceScheduler(INFERENCE_WORKERS, QUEUE_SIZE, QUEUE_TIMEOUT)
+
 _model = None
+_model_lock = threading.Lock()
+_model_status = {"ready": False, "error": None, "load_seconds": None, "warmup_seconds": None}
 
 
 def get_model():
-    """Load the Whisper model on first use."""
+    """Load the Whisper model (once per process; concurrent callers wait for it)."""
     global _model
     if _model is None:
-        from faster_whisper import WhisperModel
-        model_size = os.environ.get("WHISPER_MODEL", "base")
-        device = os.environ.get("WHISPER_DEVICE", "cpu")
-        compute_type = os.environ.get("WHISPER_COMPUTE_TYPE", "int8")
-        logger.info(f"[TRANSCRIBER] Loading model: {model_size} on {device} ({compute_type})")
-        _model = WhisperModel(model_size, device=device, compute_type=compute_type)
-        logger.info("[TRANSCRIBER] Model loaded successfully")
+        with _model_lock:
+            if _model is None:
+                from faster_whisper import WhisperModel
+                logger.info(
+                    f"[TRANSCRIBER] Loading model: {WHISPER_MODEL} on {WHISPER_DEVICE} ({WHISPER_COMPUTE_TYPE}), "
+                    f"{INFERENCE_WORKERS} workers x {CPU_THREADS} threads"
+                )
+                start = time.perf_counter()
+                _model = WhisperModel(
+                    WHISPER_MODEL,
+                    device=WHISPER_DEVICE,
+                    compute_type=WHISPER_COMPUTE_TYPE,
+                    cpu_threads=CPU_THREADS,
+                    num_workers=INFERENCE_WORKERS,
+                    download_root=WHISPER_MODEL_DIR,
+                )
+                _model_status["load_seconds"] = round(time.perf_counter() - start, 2)
+                logger.info(f"[TRANSCRIBER] Model loaded successfully in {_model_status['load_seconds']}s")
     return _model
 
 
+_pool = None
+_pool_lock = threading.Lock()
+_pool_state = {"users": 0, "idle_timer": None}
+
+
+def _acquire_pool() -> ProcessPoolExecutor:
+    """Process pool of the parallel mode (started on first use, one model per process)."""
+    global _pool
+    with _pool_lock:
+        if _pool_state["idle_timer"] is not None:
+            _pool_state["idle_timer"].cancel()
+            _pool_state["idle_timer"] = None
+        if _pool is None:
+            logger.info(
+                f"[TRANSCRIBER] Starting pool: {PARALLEL_PROCESSES} processes x {PARALLEL_CPU_THREADS} threads"
+            )
+            _pool = ProcessPoolExecutor(
+                max_workers=PARALLEL_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(WHISPER_MODEL, WHISPER_DEVICE, WHISPER_COMPUTE_TYPE, PARALLEL_CPU_THREADS, WHISPER_MODEL_DIR),
+            )
+        _pool_state["users"] += 1
+        return _pool
+
+
+def _release_pool(pool: ProcessPoolExecutor):
+    """Done with the pool; the last user schedules its idle shutdown."""
+    with _pool_lock:
+        _pool_state["users"] -= 1
+        if _pool is pool and _pool_state["users"] == 0 and PARALLEL_POOL_IDLE_SECONDS > 0:
+            timer = threading.Timer(PARALLEL_POOL_IDLE_SECONDS, _shutdown_pool, args=(pool, "idle"))
+            timer.daemon = True
+            _pool_state["idle_timer"] = timer
+            timer.start()
+
+
+def _shutdown_pool(pool: ProcessPoolExecutor, reason: str):
+    """
+    Shut a pool down and free its models: after the idle timeout, or when it
+    broke (a worker died). The next parallel request starts a new one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not pool or (reason == "idle" and _pool_state["users"]):
+            return
+        _pool = None
+        _pool_state["idle_timer"] = None
+    logger.info(f"[TRANSCRIBER] Shutting down pool ({reason})")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def warmup_audio() -> np.ndarray:
+    """A short, quiet 440 Hz tone followed by silence (16 kHz float32 mono)."""
+    t = np.arange(WARMUP_SECONDS * WARMUP_SAMPLE_RATE) / WARMUP_SAMPLE_RATE
+    audio = 0.1 * np.sin(2 * np.pi * 440 * t)
+    audio[len(audio) // 2:] = 0.0
+    return audio.astype(np.float32)
+
+
+def _mark_ready(source: str):
+    """The model has served an inference: report the worker ready."""
+    if not _model_status["ready"]:
+        _model_status["ready"] = True
+        if _model_status["error"]:
+            logger.info(f"[TRANSCRIBER] Ready after {source} (warm-up had failed: {_model_status['error']})")
+
+
+def warm_up_model():
+    """
+    Load the model and run one inference, then mark the worker ready.
+
+    Runs the encoder, the decoder and word alignment once, so the first real
+    request doesn't pay for lazy initialisation. Errors are logged and
+    reported by /ready, and the warm-up is retried with a growing delay.
+    Requests meanwhile load the model themselves; the first one that
+    succeeds marks the worker ready as well.
+    """
+    delay = WARMUP_RETRY_SECONDS
+    while not _model_status["ready"]:
+        try:
+            model = get_model()
+            start = time.perf_counter()
+            segments, _ = model.transcribe(warmup_audio(), language="en", word_timestamps=True, vad_filter=False)
+            list(segments)  # Transcription is lazy: decode all segments
+            _model_status["warmup_seconds"] = round(time.perf_counter() - start, 2)
+            _mark_ready("warm-up")
+            logger.info(f"[TRANSCRIBER] Warm-up inference done in {_model_status['warmup_seconds']}s")
+        except Exception as e:
+            _model_status["error"] = str(e)
+            logger.error(f"[TRANSCRIBER] Warm-up failed: {e}; retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_SECONDS)
+
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint."""
@@ -51,6 +298,256 @@ def health():
     })
 
 
+def _busy_response():
+    """503 for a saturated inference queue; clients retry after Retry-After seconds."""
+    response = jsonify({"error": "Transcriber is busy, retry later", "queue": scheduler.stats()})
+    response.status_code = 503
+    response.headers["Retry-After"] = "10"
+    return response
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 503 until the model is loaded and warmed up."""
+    status = dict(_model_status)
+    if MODEL_LOAD == "lazy":
+        status["ready"] = True  # Nothing to wait for: the first request loads the model
+    return jsonify({
+        "service": "transcriber",
+        "model_load": MODEL_LOAD,
+        "mode": TRANSCRIBE_MODE,
+        "batch_size": BATCH_SIZE,
+        "parallel_processes": PARALLEL_PROCESSES,
+        **status,
+        "queue": scheduler.stats(),
+    }), 200 if status["ready"] else 503
+
+
+def _stitch_segments(segments, duration: float):
+    """
+    Segment data of a chunked (batched or parallel) transcription on one global timeline.
+
+    Chunks are decoded independently and offset by their start time; near a
+    chunk boundary a segment or its word alignment can overrun into the next
+    chunk. Segments and words are clamped so they never go back in time and
+    stay inside their segment and the audio, empty segments are dropped and
+    ids are renumbered consecutively, as the sequential decoder returns them.
+    """
+    previous_end = 0.0
+    index = 0
+    for seg_data in segments:
+        if not seg_data["text"]:
+            continue
+
+        start = min(max(seg_data["start"], previous_end), duration)
+        end = min(max(seg_data["end"], start), duration)
+        cursor = start
+        for word in seg_data.get("words", []):
+            word["start"] = min(max(word["start"], cursor), end)
+            word["end"] = min(max(word["end"], word["start"]), end)
+            cursor = word["start"]
+
+        index += 1
+        seg_data.update(id=index, start=round(start, 3), end=round(end, 3))
+        previous_end = end
+        yield seg_data
+
+
+def _start_transcription(path: str, options: dict) -> tuple:
+    """
+    Start a transcription; segments are decoded lazily while iterating.
+
+    Args:
+        path: Audio/video file
+        options: language, word_timestamps, mode ("sequential" or "batched")
+            and batch_size
+
+    Returns:
+        (iterator of segment data dicts, faster-whisper TranscriptionInfo)
+    """
+    word_timestamps = options["word_timestamps"]
+
+    if options["mode"] == "batched":
+        from faster_whisper import BatchedInferencePipeline
+        # The pipeline keeps per-call state (last word timestamp): one per request, on the shared model
+        pipeline = BatchedInferencePipeline(get_model())
+        segments_iter, info = pipeline.transcribe(
+            path,
+            language=options["language"],
+            word_timestamps=word_timestamps,
+            without_timestamps=False,  # Split chunks into sentence segments, like the sequential decoder
+            vad_filter=True,
+            vad_parameters=dict(VAD_PARAMETERS),
+            batch_size=options["batch_size"],
+        )
+        segments = (segment_data(segment, word_timestamps) for segment in segments_iter)
+        return _stitch_segments(segments, info.duration), info
+
+    if options["mode"] == "parallel":
+        return _start_parallel_transcription(path, options)
+
+    segments_iter, info = get_model().transcribe(
+        path,
+        language=options["language"],
+        word_timestamps=word_timestamps,
+        vad_filter=True,
+        vad_parameters=dict(VAD_PARAMETERS),
+    )
+    return (segment_data(segment, word_timestamps) for segment in segments_iter), info
+
+
+def _speech_sample(audio: np.ndarray, speech: list) -> np.ndarray:
+    """The first LANGUAGE_DETECTION_SECONDS of speech (the whole audio without VAD speech)."""
+    parts, samples = [], 0
+    for span in speech:
+        parts.append(audio[span["start"]:span["end"]])
+        samples += span["end"] - span["start"]
+        if samples >= LANGUAGE_DETECTION_SECONDS * SAMPLE_RATE:
+            break
+    return np.concatenate(parts) if parts else audio
+
+
+def _start_parallel_transcription(path: str, options: dict) -> tuple:
+    """
+    Start a parallel (process pool) transcription.
+
+    The audio is decoded and VAD-segmented once here, the language detected
+    once on its first speech and pinned for every chunk. Recordings too short
+    for two chunks are transcribed sequentially on the shared model.
+
+    Returns:
+        (iterator of segment data dicts, ChunkedInfo)
+    """
+    from faster_whisper import decode_audio
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+    duration = len(audio) / SAMPLE_RATE
+    speech = get_speech_timestamps(audio, VadOptions(**VAD_PARAMETERS))
+    model = get_model()
+
+    language, language_probability = options["language"], 1.0
+    if language is None:
+        language, language_probability, _ = model.detect_language(
+            audio=_speech_sample(audio, speech), language_detection_segments=3
+        )
+    info = ChunkedInfo(language, language_probability, duration)
+    pinned = {**options, "language": language}
+
+    count = min(PARALLEL_PROCESSES, int(duration // PARALLEL_MIN_CHUNK_SECONDS))
+    if count < 2:
+        segments_iter, _ = model.transcribe(
+            audio,
+            language=language,
+            word_timestamps=options["word_timestamps"],
+            vad_filter=True,
+            vad_parameters=dict(VAD_PARAMETERS),
+        )
+        return (segment_data(segment, options["word_timestamps"]) for segment in segments_iter), info
+
+    chunks = plan_chunks(speech, len(audio), count, int(PARALLEL_CHUNK_OVERLAP * SAMPLE_RATE))
+    logger.info(f"[TRANSCRIBER] Parallel: {duration:.0f}s in {len(chunks)} chunks, language={language}")
+
+    def segments():
+        pool = _acquire_pool()
+        try:
+            yield from transcribe_chunked(audio, chunks, pool, pinned, VAD_PARAMETERS)
+        except BrokenProcessPool:
+            _shutdown_pool(pool, "broken")
+            raise
+        finally:
+            _release_pool(pool)
+
+    return _stitch_segments(segments(), duration), info
+
+
+def _transcription_options(args) -> dict:
+    """
+    Read the transcription query parameters.
+
+    Raises:
+        ValueError: On an unknown mode or an invalid batch_size
+    """
+    mode = args.get("mode") or TRANSCRIBE_MODE
+    if mode not in TRANSCRIBE_MODES:
+        raise ValueError(f"mode must be one of: {', '.join(TRANSCRIBE_MODES)}")
+
+    batch_size = args.get("batch_size") or BATCH_SIZE
+    try:
+        batch_size = int(batch_size)
+    except ValueError:
+        raise ValueError("batch_size must be an integer")
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+
+    return {
+        "language": args.get("language", None),
+        "word_timestamps": args.get("word_timestamps", "true").lower() == "true",
+        "mode": mode,
+        "batch_size": batch_size,
+        # A parallel request runs its own pool on every core: nothing may run on the shared model meanwhile
+        "slots": INFERENCE_WORKERS if mode == "parallel" else 1,
+    }
+
+
+def _stream_record(record: dict, stream_format: str) -> str:
+    data = json.dumps(record, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {record['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def _stream_transcription(path: str, filename: str, options: dict, stream_format: str):
+    """
+    Yield transcription records as faster-whisper produces them.
+
+    Records: "info" (language, duration), one "segment" per segment (with
+    words and progress = segment end / duration), then "done" with a
+    summary - or "error". Owns the inference slot (acquired by the caller)
+    and the temp file; both are released when the stream ends or the client
+    disconnects.
+    """
+    start = time.perf_counter()
+    count = 0
+    try:
+        segments_iter, info = _start_transcription(path, options)
+        summary = {
+            "language": info.language,
+            "language_probability": round(info.language_probability, 3),
+            "duration": round(info.duration, 3),
+            "mode": options["mode"],
+        }
+        yield _stream_record({"type": "info", **summary}, stream_format)
+
+        for seg_data in segments_iter:
+            count += 1
+            _mark_ready("a transcription")
+            progress = min(1.0, seg_data["end"] / info.duration) if info.duration else None
+            yield _stream_record({
+                "type": "segment",
+                **seg_data,
+                "progress": round(progress, 4) if progress is not None else None,
+            }, stream_format)
+
+        logger.info(
+            f"[TRANSCRIBER] Streamed {filename}: {count} segments, "
+            f"lang={info.language} ({info.language_probability:.1%}), duration={info.duration:.1f}s"
+        )
+        yield _stream_record({
+            "type": "done",
+            **summary,
+            "segments": count,
+            "seconds": round(time.perf_counter() - start, 2),
+        }, stream_format)
+
+    except Exception as e:
+        logger.error(f"[TRANSCRIBER] Stream error after {count} segments: {e}")
+        yield _stream_record({"type": "error", "error": str(e), "segments": count}, stream_format)
+    finally:
+        scheduler.release(options["slots"])
+        os.unlink(path)
+
+
 @app.route("/transcribe", methods=["POST"])
 def transcribe():
     """
@@ -61,13 +558,24 @@ def transcribe():
         - Optional query params:
             - language: source language code (auto-detect if omitted)
             - word_timestamps: true/false (default: true)
+            - stream: 1/ndjson or sse to stream segments as they are decoded
+            - mode: sequential, batched or parallel (default: TRANSCRIBE_MODE)
+            - batch_size: chunks per model call in batched mode (default: WHISPER_BATCH_SIZE)
 
     Returns:
         JSON with:
             - language: detected language code
             - language_probability: confidence of language detection
             - duration: total audio duration in seconds
+            - mode: decoding mode used
             - segments: array of segment objects with word-level timestamps
+
+        With stream, an NDJSON (application/x-ndjson) or Server-Sent Events
+        (text/event-stream) stream of records:
+            - {"type": "info", language, language_probability, duration, mode}
+            - {"type": "segment", id, start, end, text, words, progress} per segment
+            - {"type": "done", language, language_probability, duration, mode, segments, seconds}
+            - {"type": "error", error, segments} if transcription fails midway
     """
     if "file" not in request.files:
         return jsonify({"error": "No file provided"}), 400
@@ -76,72 +584,72 @@ def transcribe():
     if not file.filename:
         return jsonify({"error": "Empty filename"}), 400
 
-    language = request.args.get("language", None)
-    word_timestamps = request.args.get("word_timestamps", "true").lower() == "true"
+    try:
+        options = _transcription_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream = request.args.get("stream", "0").lower()
+    stream_format = {"1": "ndjson", "true": "ndjson", "ndjson": "ndjson", "sse": "sse"}.get(stream)
+    if stream_format is None and stream not in ("0", "false", ""):
+        return jsonify({"error": "stream must be 1, ndjson or sse"}), 400
 
     # Save to temp file (faster-whisper needs file path)
     suffix = os.path.splitext(file.filename)[1] or ".mp4"
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    streaming = False
     try:
         file.save(tmp.name)
         tmp.close()
 
-        logger.info(f"[TRANSCRIBER] Processing file: {file.filename} (language={language})")
-
-        model = get_model()
-        segments_iter, info = model.transcribe(
-            tmp.name,
-            language=language,
-            word_timestamps=word_timestamps,
-            vad_filter=True,
-            vad_parameters=dict(
-                min_silence_duration_ms=500,
-                speech_pad_ms=200,
-            ),
+        logger.info(
+            f"[TRANSCRIBER] Processing file: {file.filename} (language={options['language']}, "
+            f"mode={options['mode']}, stream={stream_format})"
         )
 
-        segments = []
-        for segment in segments_iter:
-            seg_data = {
-                "id": segment.id,
-                "start": round(segment.start, 3),
-                "end": round(segment.end, 3),
-                "text": segment.text.strip(),
-            }
-
-            if word_timestamps and segment.words:
-                seg_data["words"] = [
-                    {
-                        "word": word.word.strip(),
-                        "start": round(word.start, 3),
-                        "end": round(word.end, 3),
-                        "probability": round(word.probability, 3),
-                    }
-                    for word in segment.words
-                ]
-
-            segments.append(seg_data)
+        if stream_format:
+            # Reject before the stream starts; the generator then owns the slot and the file
+            scheduler.acquire(options["slots"])
+            streaming = True
+            response = Response(
+                _stream_transcription(tmp.name, file.filename, options, stream_format),
+                mimetype="text/event-stream" if stream_format == "sse" else "application/x-ndjson",
+            )
+            response.headers["Cache-Control"] = "no-cache"
+            response.headers["X-Accel-Buffering"] = "no"
+            return response
+
+        # Segments are decoded lazily: the whole loop runs inside the slot
+        with scheduler.slot(options["slots"]):
+            segments_iter, info = _start_transcription(tmp.name, options)
+            segments = list(segments_iter)
+        _mark_ready("a transcription")
 
         result = {
             "language": info.language,
             "language_probability": round(info.language_probability, 3),
             "duration": round(info.duration, 3),
+            "mode": options["mode"],
             "segments": segments,
         }
 
         logger.info(
-            f"[TRANSCRIBER] Done: {len(segments)} segments, "
+            f"[TRANSCRIBER] Done ({options['mode']}): {len(segments)} segments, "
             f"lang={info.language} ({info.language_probability:.1%}), "
             f"duration={info.duration:.1f}s"
         )
 
         return jsonify(result)
 
+    except QueueFull as e:
+        logger.warning(f"[TRANSCRIBER] Busy, rejecting {file.filename}: {e}")
+        return _busy_response()
     except Exception as e:
         logger.error(f"[TRANSCRIBER] Error: {e}")
         return jsonify({"error": str(e)}), 500
     finally:
-        os.unlink(tmp.name)
+        if not streaming:
+            os.unlink(tmp.name)
 
 
 @app.route("/detect-language", methods=["POST"])
@@ -166,12 +674,16 @@ def detect_language():
         tmp.close()
 
         model = get_model()
-        _, info = model.transcribe(tmp.name, word_timestamps=False)
+        with scheduler.slot():
+            _, info = model.transcribe(tmp.name, word_timestamps=False)
 
         return jsonify({
             "language": info.language,
             "language_probability": round(info.language_probability, 3),
         })
+    except QueueFull as e:
+        logger.warning(f"[TRANSCRIBER] Busy, rejecting language detection: {e}")
+        return _busy_response()
     except Exception as e:
         logger.error(f"[TRANSCRIBER] Language detection error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -179,5 +691,9 @@ def detect_language():
         os.unlink(tmp.name)
 
 
+if MODEL_LOAD == "eager":
+    threading.Thread(target=warm_up_model, name="model-warmup", daemon=True).start()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=3340, debug=True)
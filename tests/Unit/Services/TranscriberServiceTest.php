@@ -0,0 +1,113 @@
+<?php
+
+use App\Services\TranscriberService;
+use Illuminate\Support\Facades\Http;
+use Illuminate\Support\Facades\Storage;
+
+function ndjson(array $records): string
+{
+    return implode('', array_map(fn ($record) => json_encode($record) . "\n", $records));
+}
+
+beforeEach(function () {
+    Storage::fake();
+    Storage::put('videos/test.mp4', 'video');
+
+    // Tiny reads, so records are split across read boundaries
+    $this->service = new class extends TranscriberService {
+        protected int $streamReadSize = 7;
+    };
+
+    $this->info = ['type' => 'info', 'language' => 'pl', 'language_probability' => 0.95, 'duration' => 10.0];
+    $this->segments = [
+        ['id' => 1, 'start' => 0.0, 'end' => 2.5, 'text' => 'Cześć wszystkim', 'words' => [
+            ['word' => 'Cześć', 'start' => 0.0, 'end' => 0.5, 'probability' => 0.98],
+            ['word' => 'wszystkim', 'start' => 0.6, 'end' => 1.2, 'probability' => 0.99],
+        ]],
+        ['id' => 2, 'start' => 3.0, 'end' => 5.0, 'text' => 'Drugi segment', 'words' => []],
+    ];
+    $this->done = ['type' => 'done', 'language' => 'pl', 'language_probability' => 0.95, 'duration' => 10.0, 'segments' => 2];
+});
+
+describe('TranscriberService', function () {
+
+    describe('transcribe (streamed)', function () {
+
+        it('collects streamed segments and reports each one with its progress', function () {
+            Http::fake([
+                '*/transcribe*' => Http::response(ndjson([
+                    $this->info,
+                    ['type' => 'segment', ...$this->segments[0], 'progress' => 0.25],
+                    ['type' => 'segment', ...$this->segments[1], 'progress' => 0.5],
+                    $this->done,
+                ]), 200, ['Content-Type' => 'application/x-ndjson']),
+            ]);
+
+            $received = [];
+            $result = $this->service->transcribe('videos/test.mp4', null, function ($segment, $progress, $segments) use (&$received) {
+                $received[] = [$segment['id'], $progress, count($segments)];
+            });
+
+            expect($received)->toBe([[1, 0.25, 1], [2, 0.5, 2]]);
+            expect($result['language'])->toBe('pl');
+            expect($result['duration'])->toBe(10.0);
+            expect($result['segments'])->toBe($this->segments);
+
+            Http::assertSent(fn ($request) => str_contains($request->url(), 'stream=ndjson'));
+        });
+
+        it('parses a last record without a trailing newline', function () {
+            Http::fake([
+                '*/transcribe*' => Http::response(rtrim(ndjson([
+                    $this->info,
+                    ['type' => 'segment', ...$this->segments[1], 'progress' => 0.5],
+                    $this->done,
+                ]), "\n")),
+            ]);
+
+            $result = $this->service->transcribe('videos/test.mp4', 'pl', fn () => null);
+
+            expect($result['segments'])->toHaveCount(1);
+        });
+
+        it('throws on an error record', function () {
+            Http::fake([
+                '*/transcribe*' => Http::response(ndjson([
+                    $this->info,
+                    ['type' => 'segment', ...$this->segments[0], 'progress' => 0.25],
+                    ['type' => 'error', 'error' => 'Decoder crashed', 'segments' => 1],
+                ])),
+            ]);
+
+            $this->service->transcribe('videos/test.mp4', null, fn () => null);
+        })->throws(Exception::class, 'Transcription failed: Decoder crashed');
+
+        it('throws when the stream ends before the done record', function () {
+            Http::fake([
+                '*/transcribe*' => Http::response(ndjson([
+                    $this->info,
+                    ['type' => 'segment', ...$this->segments[0], 'progress' => 0.25],
+                ])),
+            ]);
+
+            $this->service->transcribe('videos/test.mp4', null, fn () => null);
+        })->throws(Exception::class, 'stream ended before completion');
+
+    });
+
+    describe('transcribe (non-streamed)', function () {
+
+        it('returns the JSON result', function () {
+            Http::fake([
+                '*/transcribe*' => Http::response(['language' => 'pl', 'duration' => 10.0, 'segments' => $this->segments]),
+            ]);
+
+            $result = $this->service->transcribe('videos/test.mp4');
+
+            expect($result['segments'])->toBe($this->segments);
+            Http::assertSent(fn ($request) => !str_contains($request->url(), 'stream='));
+        });
+
+    });
+
+});